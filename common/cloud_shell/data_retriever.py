@@ -35,7 +35,29 @@ class CloudshellDataRetrieverService:
         return VCenterTemplateModel(
                 vcenter_resource_name=template_components[0],
                 vm_folder=self.PATH_DELIMITER.join(template_components[1:-1]),
-                template_name=template_components[-1])
+                template_name=template_components[-1],
+                linked_clone=self.getLinkedCloneAttributeData(resource_attributes),
+                snapshot_name=self.getSnapshotNameAttributeData(resource_attributes))
+
+    def getLinkedCloneAttributeData(self, resource_attributes):
+        """
+        get linked clone from 'Linked Clone' attribute
+        resources without the attribute are deployed as full clones
+        :rtype: boolean
+        """
+        linked_clone = resource_attributes.attributes.get("Linked Clone")
+        return str(linked_clone).lower() == "true"
+
+    def getSnapshotNameAttributeData(self, resource_attributes):
+        """
+        get the snapshot a linked clone is based on from 'Snapshot Name' attribute
+        if attribute is empty than the current snapshot of the template is used
+        :rtype str:
+        """
+        snapshot_name = resource_attributes.attributes.get("Snapshot Name")
+        if not snapshot_name:
+            snapshot_name = None
+        return snapshot_name
 
     def getPowerStateAttributeData(self, resource_attributes):
         """
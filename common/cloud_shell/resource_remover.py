@@ -7,3 +7,10 @@ class CloudshellResourceRemover(object):
         :type resource_full_name: str
         """
         session.DeleteResource(resource_full_name)
+
+    def remove_resources(self, session, resource_full_names):
+        """
+        removes many resources from session with one call
+        :type resource_full_names: list[str]
+        """
+        session.DeleteResources(resource_full_names)
@@ -0,0 +1,143 @@
+from contextlib import contextmanager
+from Queue import Queue
+from threading import BoundedSemaphore, Lock, Thread
+
+
+class KeyedSemaphore(object):
+    """
+    One bounded semaphore per key, so at most 'limit' callers hold the same key.
+    The semaphore of a key exists only while callers hold it or wait for it
+    """
+
+    def __init__(self, limit):
+        """
+        :param int limit: the number of callers that can hold a key together
+        """
+        self.limit = limit
+        # key to [semaphore, the number of callers that hold or wait for it]
+        self._semaphores = dict()
+        self._lock = Lock()
+
+    @contextmanager
+    def hold(self, key):
+        """
+        blocks while 'limit' callers hold the key, a None key is not limited
+        """
+        if key is None:
+            yield
+            return
+        with self._lock:
+            entry = self._semaphores.get(key)
+            if entry is None:
+                entry = self._semaphores[key] = [BoundedSemaphore(self.limit), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._semaphores[key]
+
+    def __len__(self):
+        """
+        :return: the number of keys that are held or waited for
+        """
+        with self._lock:
+            return len(self._semaphores)
+
+
+class BoundedExecutor(object):
+    """
+    Worker threads that live as long as their owner and are shared by all of its requests.
+    At most max_workers calls run together, and submitting blocks while max_pending calls are queued or running,
+    so a burst of requests waits for room instead of piling work on the vCenter
+    """
+
+    def __init__(self, max_workers=8, max_pending=None):
+        """
+        :param int max_workers: the number of calls that run together
+        :param int max_pending: the number of calls that can be queued or running, twice max_workers by default
+        """
+        self.max_workers = max_workers
+        self._pending = BoundedSemaphore(max_pending or max_workers * 2)
+        self._calls = Queue()
+        self._workers = []
+        self._lock = Lock()
+        self._shut_down = False
+
+    def submit(self, func, *args):
+        """
+        queues the call, blocks while max_pending calls are queued or running.
+        The errors of the call are not reported, func handles its own errors
+        """
+        self._pending.acquire()
+        try:
+            self._start_workers()
+        except Exception:
+            self._pending.release()
+            raise
+        self._calls.put((func, args))
+
+    def shutdown(self, timeout=30):
+        """
+        lets the queued calls finish and stops the worker threads, calls submitted afterwards are refused
+        :param timeout: seconds to wait for every worker
+        """
+        with self._lock:
+            self._shut_down = True
+            workers = list(self._workers)
+            self._workers = []
+        for worker in workers:
+            self._calls.put(None)
+        for worker in workers:
+            worker.join(timeout)
+
+    def imap_unordered(self, func, args_list):
+        """
+        runs func once for every tuple of arguments
+        :return: generator of (args, result, error) in the order the calls complete, error is None on success
+        """
+        completed = Queue()
+
+        def run(*args):
+            try:
+                completed.put((args, func(*args), None))
+            except Exception as e:
+                completed.put((args, None, e))
+
+        pending = 0
+        for args in args_list:
+            self.submit(run, *args)
+            pending += 1
+            # the calls that completed while the rest are submitted are streamed right away
+            while not completed.empty():
+                pending -= 1
+                yield completed.get()
+        while pending:
+            pending -= 1
+            yield completed.get()
+
+    def _start_workers(self):
+        with self._lock:
+            if self._shut_down:
+                raise RuntimeError('the executor was shut down')
+            while len(self._workers) < self.max_workers:
+                worker = Thread(target=self._work, name='BoundedExecutor-{0}'.format(len(self._workers)))
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            call = self._calls.get()
+            if call is None:
+                return
+            func, args = call
+            try:
+                func(*args)
+            except Exception:
+                pass
+            finally:
+                self._pending.release()
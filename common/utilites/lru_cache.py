@@ -0,0 +1,43 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class LruCache(object):
+    """
+    A dict of limited size, the entry that was used least recently is dropped when a new one does not fit
+    """
+
+    def __init__(self, max_size=256):
+        """
+        :param int max_size: the number of entries kept
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get_or_create(self, key, factory):
+        """
+        :param key: hashable identity of the value
+        :param factory: called with the key when it is not cached, its errors are raised and nothing is cached
+        :return: the cached value of the key
+        """
+        with self._lock:
+            if key in self._entries:
+                value = self._entries.pop(key)
+                self._entries[key] = value
+                return value
+
+        value = factory(key)
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,54 @@
+from threading import Event, Lock
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Runs a function once per key at a time, callers asking for a key that is already in flight wait for
+    the running call and share its result or its error.
+    Calls for different keys do not block each other
+    """
+
+    def __init__(self):
+        self._calls = dict()
+        self._lock = Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        :param key: hashable identity of the work
+        :param func: the work, called only if no call for the key is running
+        :return: the result of func, or of the call that was already running for the key
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            owner = call is None
+            if owner:
+                call = _Call()
+                self._calls[key] = call
+
+        if not owner:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
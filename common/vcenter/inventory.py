@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory index of the vCenter inventory, loaded with a single property collector pass
+"""
+from threading import RLock
+
+from pyVmomi import vim
+from common.logger import getLogger
+
+logger = getLogger(__name__)
+
+NAME = 'name'
+PARENT = 'parent'
+UUID = 'config.uuid'
+INSTANCE_UUID = 'config.instanceUuid'
+
+INVENTORY_PROPERTIES = {
+    vim.VirtualMachine: [NAME, PARENT, UUID, INSTANCE_UUID],
+    vim.Network: [NAME, PARENT],
+    vim.DistributedVirtualSwitch: [NAME, PARENT],
+    vim.Datastore: [NAME, PARENT],
+    vim.ResourcePool: [NAME, PARENT],
+    vim.ComputeResource: [NAME, PARENT],
+    vim.HostSystem: [NAME, PARENT],
+    vim.Folder: [NAME, PARENT],
+    vim.Datacenter: [NAME, PARENT]
+}
+
+
+class InventoryItem(object):
+    __slots__ = ('obj', 'name', 'parent', 'uuid', 'instance_uuid')
+
+    def __init__(self, obj, name=None, parent=None, uuid=None, instance_uuid=None):
+        self.obj = obj
+        self.name = name
+        self.parent = parent
+        self.uuid = uuid
+        self.instance_uuid = instance_uuid
+
+
+class InventorySnapshot(object):
+    """
+    Holds the name, parent and uuid of the inventory objects and answers path, name and uuid lookups
+    without going to the vCenter.
+    Paths are in the format used by pyVmomiService: 'dc/folder/name', the hidden datacenter folders
+    (vm, network, host, datastore) are not part of the path
+    """
+
+    def __init__(self):
+        self._items = dict()
+        self._lock = RLock()
+        self._by_name = None
+        self._by_path = None
+        self._by_uuid = None
+
+    def load(self, pv_service, si):
+        """
+        Loads the whole inventory in one paged RetrievePropertiesEx pass
+
+        :param pv_service: pyVmomiService
+        :param si: pyvmomi 'ServiceInstance'
+        """
+        objects = pv_service.retrieve_properties(si.content, INVENTORY_PROPERTIES)
+        items = dict()
+        for obj, properties in objects:
+            items[obj] = self._create_item(obj, properties)
+
+        with self._lock:
+            self._items = items
+            self._invalidate_indexes()
+        logger.debug('inventory snapshot loaded {0} objects'.format(len(items)))
+        return self
+
+    def update(self, obj, properties):
+        """
+        Adds an object or changes the properties of a known one
+
+        :param obj: the managed object
+        :param dict properties: property path to the new value
+        """
+        with self._lock:
+            item = self._items.get(obj)
+            if item is None:
+                self._items[obj] = self._create_item(obj, properties)
+            else:
+                self._apply_properties(item, properties)
+            self._invalidate_indexes()
+
+    def remove(self, obj):
+        """
+        Forgets an object that was deleted from the inventory
+        """
+        with self._lock:
+            if self._items.pop(obj, None) is not None:
+                self._invalidate_indexes()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, obj):
+        return obj in self._items
+
+    def find_by_path(self, path, name, vim_type=None):
+        """
+        Finds the object by its parent path and name
+
+        :param str path: the path of the parent ('dc' or 'dc/folder' or 'dc/folder/folder/etc...')
+        :param str name: the name of the object
+        :param vim_type: when given only objects of that type are returned
+        :return: the managed object or None
+        """
+        full_path = self._join(self._normalize(path), name)
+        with self._lock:
+            self._build_indexes()
+            candidates = self._by_path.get(full_path, [])
+        return self._first_of_type(candidates, vim_type)
+
+    def find_by_name(self, name, vim_type=None):
+        """
+        Finds the first object having the name
+        :param str name: the name of the object
+        :param vim_type: when given only objects of that type are returned
+        :return: the managed object or None
+        """
+        with self._lock:
+            self._build_indexes()
+            candidates = self._by_name.get(name, [])
+        return self._first_of_type(candidates, vim_type)
+
+    def find_by_uuid(self, uuid):
+        """
+        Finds a virtual machine by its bios uuid or its instance uuid
+        :param str uuid: the uuid of the vm
+        :return: the vm or None
+        """
+        with self._lock:
+            self._build_indexes()
+            item = self._by_uuid.get(uuid)
+        return item.obj if item else None
+
+    def get_path(self, obj):
+        """
+        :return: the path of the object including its name, or None if the object is unknown
+        """
+        with self._lock:
+            item = self._items.get(obj)
+            if item is None:
+                return None
+            return self._get_path(item)
+
+    def get_datacenter(self, obj):
+        """
+        :return: the datacenter the object belongs to, or None if the object is unknown
+        """
+        with self._lock:
+            item = self._items.get(obj)
+            while item is not None and not isinstance(item.obj, vim.Datacenter):
+                item = self._items.get(item.parent) if item.parent is not None else None
+        return item.obj if item else None
+
+    def _first_of_type(self, candidates, vim_type):
+        for item in candidates:
+            if vim_type is None or isinstance(item.obj, vim_type):
+                return item.obj
+        return None
+
+    def _invalidate_indexes(self):
+        self._by_name = None
+        self._by_path = None
+        self._by_uuid = None
+
+    def _build_indexes(self):
+        """
+        indexes are built lazily on the first lookup after a change, must be called under the lock
+        """
+        if self._by_path is not None:
+            return
+        by_name = dict()
+        by_path = dict()
+        by_uuid = dict()
+        for item in self._items.values():
+            by_name.setdefault(item.name, []).append(item)
+            path = self._get_path(item)
+            if path is not None:
+                by_path.setdefault(path, []).append(item)
+            if item.uuid:
+                by_uuid[item.uuid] = item
+            if item.instance_uuid:
+                by_uuid[item.instance_uuid] = item
+        self._by_name = by_name
+        self._by_uuid = by_uuid
+        self._by_path = by_path
+
+    def _get_path(self, item):
+        parts = []
+        current = item
+        while current is not None:
+            parent = self._items.get(current.parent) if current.parent is not None else None
+            if parent is None:
+                if current.parent is not None:
+                    # the chain is broken, the parent is not part of the snapshot
+                    return None
+                # the root folder is not part of the path
+                break
+            if not self._is_hidden_folder(current, parent):
+                parts.append(current.name)
+            current = parent
+        return '/'.join(reversed(parts))
+
+    @staticmethod
+    def _is_hidden_folder(item, parent):
+        """
+        the vm, network, host and datastore folders of a datacenter are skipped in the paths
+        """
+        return isinstance(item.obj, vim.Folder) and isinstance(parent.obj, vim.Datacenter)
+
+    @staticmethod
+    def _create_item(obj, properties):
+        item = InventoryItem(obj)
+        InventorySnapshot._apply_properties(item, properties)
+        return item
+
+    @staticmethod
+    def _apply_properties(item, properties):
+        if NAME in properties:
+            item.name = properties[NAME]
+        if PARENT in properties:
+            item.parent = properties[PARENT]
+        if UUID in properties:
+            item.uuid = properties[UUID]
+        if INSTANCE_UUID in properties:
+            item.instance_uuid = properties[INSTANCE_UUID]
+
+    @staticmethod
+    def _normalize(path):
+        if not path:
+            return ''
+        return '/'.join([part for part in path.split('/') if part])
+
+    @staticmethod
+    def _join(path, name):
+        return '{0}/{1}'.format(path, name) if path else name
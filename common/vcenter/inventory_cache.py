@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Inventory index that is kept up to date in the background with PropertyCollector.WaitForUpdatesEx
+"""
+import time
+from threading import Thread, Event
+
+from pyVmomi import vim, vmodl
+from common.logger import getLogger
+from common.utilites.io import get_path_and_name
+from common.vcenter.inventory import InventorySnapshot, INVENTORY_PROPERTIES
+
+logger = getLogger(__name__)
+
+ENTER = 'enter'
+MODIFY = 'modify'
+LEAVE = 'leave'
+ASSIGN = 'assign'
+NETWORK_TYPES = (vim.Network, vim.DistributedVirtualSwitch)
+
+
+class InventoryCache(object):
+    """
+    Subscribes to inventory changes of a vCenter session and patches the name/path/uuid indexes as objects
+    appear, move or vanish, so lookups are local reads.
+    The cache reports itself as stale when it stopped receiving updates, the callers should then go to the vCenter
+    """
+
+    def __init__(self, si, max_wait_seconds=30, stale_after=120, time_func=time.time):
+        """
+        :param si: pyvmomi 'ServiceInstance'
+        :param int max_wait_seconds: how long one WaitForUpdatesEx call blocks on the vCenter side
+        :param int stale_after: seconds without a successful update round after which the cache is stale
+        :param time_func: returns the current time in seconds
+        """
+        self.si = si
+        self.max_wait_seconds = max_wait_seconds
+        self.stale_after = stale_after
+        self.time_func = time_func
+        self.snapshot = InventorySnapshot()
+        self.version = None
+        self.last_update = None
+        self._collector = None
+        self._filter = None
+        self._view = None
+        self._thread = None
+        self._stopped = Event()
+
+    def start(self):
+        """
+        Starts loading the inventory and following its changes in the background.
+        The cache is not fresh until the initial content is loaded, so the lookups go to the vCenter meanwhile
+        """
+        self._thread = Thread(target=self._follow_updates, name='InventoryCache')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops following the changes and destroys the server side objects of the cache
+        """
+        self._stopped.set()
+        for cancel in (lambda: self._collector.CancelWaitForUpdates(),
+                       lambda: self._filter.Destroy(),
+                       lambda: self._view.Destroy(),
+                       lambda: self._collector.Destroy()):
+            try:
+                cancel()
+            except Exception as e:
+                logger.debug('failed to clean up the inventory cache: {0}'.format(e))
+
+    def is_fresh(self):
+        """
+        :return: True if the cache received updates recently and can be trusted
+        """
+        if self._stopped.is_set() or self.last_update is None:
+            return False
+        if self._thread is not None and not self._thread.is_alive():
+            return False
+        return self.time_func() - self.last_update < self.stale_after
+
+    def find_by_uuid(self, uuid):
+        """
+        :param str uuid: the bios or instance uuid of the vm
+        :return: the vm or None
+        """
+        return self.snapshot.find_by_uuid(uuid)
+
+    def get_datacenter(self, obj):
+        """
+        :return: the datacenter the object belongs to, or None
+        """
+        return self.snapshot.get_datacenter(obj)
+
+    def find_network_by_name(self, path, name):
+        """
+        :param str path: the path of the network ('dc' or 'dc/folder')
+        :param str name: the name of the network or distributed virtual switch
+        :return: the network or None
+        """
+        return self.snapshot.find_by_path(path, name, NETWORK_TYPES)
+
+    def get_network_by_full_name(self, full_name):
+        """
+        :param str full_name: full network name - likes 'Root/Folder/Network'
+        :return: the network or None
+        """
+        path, name = get_path_and_name(full_name)
+        return self.find_network_by_name(path, name) if name else None
+
+    def wait_for_updates(self, max_wait_seconds=None):
+        """
+        Waits for one round of changes and applies them to the indexes
+        :param int max_wait_seconds: overrides the configured wait
+        """
+        options = vmodl.query.PropertyCollector.WaitOptions()
+        options.maxWaitSeconds = self.max_wait_seconds if max_wait_seconds is None else max_wait_seconds
+        update_set = self._collector.WaitForUpdatesEx(self.version, options)
+        while update_set:
+            self.apply_update_set(update_set)
+            self.version = update_set.version
+            if not update_set.truncated:
+                break
+            update_set = self._collector.WaitForUpdatesEx(self.version, options)
+        self.last_update = self.time_func()
+
+    def apply_update_set(self, update_set):
+        """
+        Patches the indexes with the changes of a vmodl.query.PropertyCollector.UpdateSet
+        """
+        for filter_update in update_set.filterSet or []:
+            for object_update in filter_update.objectSet or []:
+                if object_update.kind == LEAVE:
+                    self.snapshot.remove(object_update.obj)
+                elif object_update.kind in (ENTER, MODIFY):
+                    properties = {change.name: change.val if change.op == ASSIGN else None
+                                  for change in object_update.changeSet or []}
+                    self.snapshot.update(object_update.obj, properties)
+
+    def _load(self):
+        """
+        Creates the property collector filter and loads the initial content
+        """
+        content = self.si.content
+        self._collector = content.propertyCollector.CreatePropertyCollector()
+        self._view = content.viewManager.CreateContainerView(content.rootFolder, INVENTORY_PROPERTIES.keys(), True)
+        self._filter = self._collector.CreateFilter(self._create_filter_spec(self._view), True)
+
+        self.version = ''
+        self.wait_for_updates(max_wait_seconds=0)
+
+    def _follow_updates(self):
+        try:
+            self._load()
+        except Exception as e:
+            logger.warn('failed to load the inventory cache, lookups will go to the vcenter: {0}'.format(e))
+            return
+        if self._stopped.is_set():
+            # stopped while loading, the server side objects were created after stop cleaned up
+            self.stop()
+            return
+
+        while not self._stopped.is_set():
+            try:
+                self.wait_for_updates()
+            except Exception as e:
+                if not self._stopped.is_set():
+                    logger.warn('inventory cache stopped receiving updates: {0}'.format(e))
+                return
+
+    @staticmethod
+    def _create_filter_spec(view):
+        traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(name='traverseView',
+                                                                     path='view',
+                                                                     skip=False,
+                                                                     type=vim.view.ContainerView)
+        object_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal_spec])
+        property_specs = [vmodl.query.PropertyCollector.PropertySpec(type=vim_type, pathSet=paths, all=False)
+                          for vim_type, paths in INVENTORY_PROPERTIES.items()]
+        return vmodl.query.PropertyCollector.FilterSpec(objectSet=[object_spec], propSet=property_specs)
@@ -0,0 +1,201 @@
+import time
+from threading import Lock
+
+from pyVmomi import vim
+from common.logger import getLogger
+
+logger = getLogger(__name__)
+
+
+class PooledSession(object):
+    def __init__(self, si, created_at):
+        """
+        :param si: pyvmomi 'ServiceInstance'
+        :param float created_at: the time the session was logged in
+        """
+        self.si = si
+        self.created_at = created_at
+        self.last_used = created_at
+        self.in_use = 0
+        # set once the session is no longer handed out, it is logged out when its last user releases it
+        self.dead = False
+
+
+class VCenterSessionPool(object):
+    """
+    Keeps authenticated vCenter sessions alive between commands, so every command does not pay for a full
+    SmartConnect handshake
+    """
+
+    def __init__(self, pv_service, max_idle_time=600, max_session_age=3600, time_func=time.time,
+                 on_session_created=None):
+        """
+        :param pv_service: pyVmomiService
+        :param int max_idle_time: seconds a session may stay unused before it is evicted
+        :param int max_session_age: seconds after which a session is logged out and a new one is created
+        :param time_func: returns the current time in seconds
+        :param on_session_created: called with every new ServiceInstance before it is handed out
+        """
+        self.pv_service = pv_service
+        self.on_session_created = on_session_created
+        self.max_idle_time = max_idle_time
+        self.max_session_age = max_session_age
+        self.time_func = time_func
+        self._sessions = dict()
+        # id of every ServiceInstance that was handed out and is not logged out yet, to its PooledSession
+        self._handed_out = dict()
+        self._key_locks = dict()
+        self._lock = Lock()
+
+    @staticmethod
+    def _get_key(connection_details):
+        return connection_details.host, connection_details.username, connection_details.port
+
+    def get_session(self, connection_details):
+        """
+        Returns a live ServiceInstance for the given connection details, logs in only if there is no valid one
+
+        :param models.VCenterConnectionDetails.VCenterConnectionDetails connection_details:
+        :return: pyvmomi 'ServiceInstance' or None if the connection failed
+        """
+        key = self._get_key(connection_details)
+        self.evict_expired()
+
+        with self._get_key_lock(key):
+            pooled = self._sessions.get(key)
+            if pooled and self._is_alive(pooled.si):
+                with self._lock:
+                    # the session is taken only if an eviction did not pop it while it was validated
+                    if self._sessions.get(key) is pooled:
+                        pooled.last_used = self.time_func()
+                        pooled.in_use += 1
+                        return pooled.si
+                pooled = None
+
+            if pooled:
+                logger.info('vcenter session of {0} is no longer valid, logging in again'.format(key[0]))
+                self._retire(key, pooled)
+
+            si = self.pv_service.connect(connection_details.host,
+                                         connection_details.username,
+                                         connection_details.password,
+                                         connection_details.port)
+            if si:
+                if self.on_session_created:
+                    self.on_session_created(si)
+                pooled = PooledSession(si, self.time_func())
+                pooled.in_use = 1
+                with self._lock:
+                    self._sessions[key] = pooled
+                    self._handed_out[id(si)] = pooled
+            return si
+
+    def release_session(self, connection_details, si):
+        """
+        Marks that a command has finished using the session, it stays logged in for the next command.
+        A session that was invalidated or replaced meanwhile is logged out when its last user releases it
+        :param models.VCenterConnectionDetails.VCenterConnectionDetails connection_details:
+        :param si: the pyvmomi 'ServiceInstance' get_session returned
+        """
+        with self._lock:
+            pooled = self._handed_out.get(id(si))
+            if pooled is None or pooled.si is not si or pooled.in_use == 0:
+                return
+            pooled.in_use -= 1
+            pooled.last_used = self.time_func()
+            if not self._should_disconnect(pooled):
+                return
+        self._disconnect(pooled)
+
+    def invalidate(self, connection_details, si):
+        """
+        Forgets the given session, the next request will log in again. It is logged out once the commands that
+        still use it release it
+        :param models.VCenterConnectionDetails.VCenterConnectionDetails connection_details:
+        :param si: the pyvmomi 'ServiceInstance' get_session returned
+        """
+        with self._lock:
+            pooled = self._handed_out.get(id(si))
+            if pooled is None or pooled.si is not si:
+                return
+        self._retire(self._get_key(connection_details), pooled)
+
+    def evict_expired(self):
+        """
+        Logs out the sessions that were idle or alive for too long
+        """
+        now = self.time_func()
+        # the sessions are popped in the same critical section that checks them, so a session that a command
+        # has just taken is not logged out
+        with self._lock:
+            expired = [(key, pooled) for key, pooled in self._sessions.items() if self._is_expired(pooled, now)]
+            for key, pooled in expired:
+                self._sessions.pop(key)
+                pooled.dead = True
+                self._handed_out.pop(id(pooled.si), None)
+        for key, pooled in expired:
+            logger.debug('evicting vcenter session of {0}'.format(key[0]))
+            self._disconnect(pooled)
+
+    def close_all(self):
+        """
+        Logs out all the sessions, the ones still in use included
+        """
+        with self._lock:
+            sessions = self._handed_out.values()
+            self._sessions.clear()
+            self._handed_out.clear()
+        for pooled in sessions:
+            pooled.dead = True
+            self._disconnect(pooled)
+
+    def _get_key_lock(self, key):
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = Lock()
+            return self._key_locks[key]
+
+    def _is_expired(self, pooled, now):
+        return not pooled.in_use and (now - pooled.last_used > self.max_idle_time
+                                      or now - pooled.created_at > self.max_session_age)
+
+    def _retire(self, key, pooled):
+        """
+        stops handing out the session, logs it out now if no command uses it
+        """
+        with self._lock:
+            if self._sessions.get(key) is pooled:
+                self._sessions.pop(key)
+            pooled.dead = True
+            if not self._should_disconnect(pooled):
+                return
+        self._disconnect(pooled)
+
+    def _should_disconnect(self, pooled):
+        """
+        called under the lock, forgets a dead session that nobody uses so it is logged out once
+        """
+        if pooled.dead and not pooled.in_use and self._handed_out.get(id(pooled.si)) is pooled:
+            self._handed_out.pop(id(pooled.si))
+            return True
+        return False
+
+    def _disconnect(self, pooled):
+        try:
+            self.pv_service.disconnect(pooled.si)
+        except Exception as e:
+            logger.debug('failed to disconnect vcenter session: {0}'.format(e))
+
+    @staticmethod
+    def _is_alive(si):
+        """
+        validates the session with the cheapest call there is
+        """
+        try:
+            si.CurrentTime()
+            return True
+        except vim.fault.NotAuthenticated:
+            return False
+        except Exception as e:
+            logger.debug('vcenter session validation failed: {0}'.format(e))
+            return False
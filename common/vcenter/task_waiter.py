@@ -5,32 +5,354 @@ from common.logger import configure_loglevel
 logger = getLogger(__name__)
 # configure_loglevel("INFO", "INFO", os.path.join(__file__, os.pardir, os.pardir, os.pardir, 'logs', 'vCenter.log'))
 
+STATE = 'info.state'
+ERROR = 'info.error'
+RESULT = 'info.result'
+PROGRESS = 'info.progress'
+TASK_PROPERTIES = [STATE, ERROR, RESULT, PROGRESS]
+DONE_STATES = (vim.TaskInfo.State.success, vim.TaskInfo.State.error)
+
+
+class TaskTimeoutException(Exception):
+    pass
+
+
+class TaskOutcome(object):
+    def __init__(self, task, state, result=None, error=None):
+        """
+        The final state of a task that was waited for with wait_all or as_completed
+        :param vim.Task task: the task
+        :param str state: success, error, or the last known state when the wait timed out
+        :param result: the task result
+        :param error: the task fault or TaskTimeoutException
+        """
+        self.task = task
+        self.state = state
+        self.result = result
+        self.error = error
+
+    @property
+    def succeeded(self):
+        return self.state == vim.TaskInfo.State.success
+
+
 class SynchronousTaskWaiter(object):
-    def __init__(self):
-        pass
+    def __init__(self, timeout=None, max_wait_seconds=30, max_poll_interval=2):
+        """
+        :param int timeout: default seconds to wait for a task, None to wait until it is done
+        :param int max_wait_seconds: how long one WaitForUpdatesEx call blocks on the vCenter side
+        :param int max_poll_interval: max seconds between two reads when the task cannot be followed with
+                                      a property collector
+        """
+        self.timeout = timeout
+        self.max_wait_seconds = max_wait_seconds
+        self.max_poll_interval = max_poll_interval
 
     # noinspection PyMethodMayBeStatic
-    def wait_for_task(self, task, action_name='job', hideResult=False):
+    def wait_for_task(self, task, action_name='job', hideResult=False, timeout=None, progress_callback=None):
         """
-        Waits and provides updates on a vSphere task
+        Waits and provides updates on a vSphere task, returns as soon as the vCenter reports the task is done
         :param hideResult:
         :param action_name:
         :param task:
+        :param int timeout: seconds to wait before TaskTimeoutException is raised, overrides the default
+        :param progress_callback: called with the progress percentage whenever it changes
         """
+        on_progress = (lambda t, progress: progress_callback(progress)) if progress_callback else None
+        follow = self._follow_tasks([task], action_name, timeout or self.timeout, on_progress)
+        try:
+            done_task, info = next(follow)
+        finally:
+            follow.close()
 
-        while task.info.state == vim.TaskInfo.State.running:
-            time.sleep(2)
-
-        if task.info.state == vim.TaskInfo.State.success:
-            if task.info.result is not None and not hideResult:
-                out = '%s completed successfully, result: %s' % (action_name, task.info.result)
+        if info[STATE] == vim.TaskInfo.State.success:
+            if info[RESULT] is not None and not hideResult:
+                out = '%s completed successfully, result: %s' % (action_name, info[RESULT])
                 logger.info(out)
             else:
                 out = '%s completed successfully.' % action_name
                 logger.info(out)
         else:
-            out = '%s did not complete successfully: %s' % (action_name, task.info.error)
+            out = '%s did not complete successfully: %s' % (action_name, info[ERROR])
             logger.info(out)
-            raise task.info.error
+            raise info[ERROR] or Exception(out)
+
+        return info[RESULT]
+
+    def as_completed(self, tasks, action_name='job', timeout=None, progress_callback=None):
+        """
+        Follows all the tasks with one property collector filter and yields a TaskOutcome for each one as soon
+        as it is done. Task faults do not stop the iteration, they are reported on the outcome.
+        Tasks appended to the list while it is iterated join the same property collector.
+        When the timeout passes the tasks that are still running are yielded with a TaskTimeoutException error
+
+        :param list[vim.Task] tasks: the tasks to follow, all on the same vCenter connection
+        :param str action_name: used for logging
+        :param int timeout: seconds to wait for all the tasks, overrides the default
+        :param progress_callback: called with the task and its progress percentage whenever it changes
+        :rtype: collections.Iterable[TaskOutcome]
+        """
+        timeout = timeout or self.timeout
+        done = set()
+        try:
+            for task, info in self._follow_tasks(tasks, action_name, timeout, progress_callback):
+                done.add(task)
+                yield TaskOutcome(task, info[STATE], info[RESULT], info[ERROR])
+        except TaskTimeoutException as e:
+            logger.info(str(e))
+            for task in [task for task in tasks if task not in done]:
+                yield TaskOutcome(task, vim.TaskInfo.State.running, error=e)
+
+    def wait_all(self, tasks, action_name='job', timeout=None, progress_callback=None):
+        """
+        Waits for all the tasks with one property collector filter
+
+        :param list[vim.Task] tasks: the tasks to wait for, all on the same vCenter connection
+        :param str action_name: used for logging
+        :param int timeout: seconds to wait for all the tasks, overrides the default
+        :param progress_callback: called with the task and its progress percentage whenever it changes
+        :return: list of TaskOutcome in the order of the given tasks
+        :rtype: list[TaskOutcome]
+        """
+        outcomes = {outcome.task: outcome
+                    for outcome in self.as_completed(tasks, action_name, timeout, progress_callback)}
+        failed = len([outcome for outcome in outcomes.values() if not outcome.succeeded])
+        logger.info('%s: %s of %s tasks completed successfully' % (action_name, len(outcomes) - failed, len(outcomes)))
+        return [outcomes[task] for task in tasks]
+
+    def wait_for_property(self, obj, property_path, is_ready, action_name='job', timeout=None):
+        """
+        Waits until a property of a managed object reaches a wanted value, the property changes are pushed by
+        the vCenter instead of being read again and again
+        :param obj: the managed object, e.g. vim.VirtualMachine
+        :param str property_path: the property to follow, e.g. 'runtime.powerState'
+        :param is_ready: called with the property value, returns True when the wait is over
+        :param str action_name: used for logging
+        :param int timeout: seconds to wait before TaskTimeoutException is raised, overrides the default
+        :return: the property value that ended the wait
+        """
+        values = self.wait_for_properties(obj, [property_path], lambda changed: is_ready(changed[property_path]),
+                                          action_name, timeout)
+        return values[property_path]
+
+    def wait_for_properties(self, obj, property_paths, is_ready, action_name='job', timeout=None):
+        """
+        Waits until the properties of a managed object reach wanted values, is_ready is called once with the
+        current values and again whenever the vCenter reports that one of them changed
+        :param obj: the managed object, e.g. vim.VirtualMachine
+        :param list[str] property_paths: the properties to follow, e.g. ['guest.ipAddress', 'guest.net']
+        :param is_ready: called with a dict of property path to value, returns True when the wait is over
+        :param str action_name: used for logging
+        :param int timeout: seconds to wait before TaskTimeoutException is raised, overrides the default
+        :return: dict of property path to the value that ended the wait
+        """
+        follow = self.as_ready([obj], property_paths, lambda ready_obj, values: is_ready(values), action_name,
+                               timeout)
+        try:
+            ready_obj, values = next(follow)
+        finally:
+            follow.close()
+        logger.info('%s: %s are ready' % (action_name, ', '.join(property_paths)))
+        return values
+
+    def as_ready(self, objs, property_paths, is_ready, action_name='job', timeout=None):
+        """
+        Follows the properties of many managed objects with one property collector filter and yields every
+        object once, as soon as its properties reach wanted values.
+        When the timeout passes before all the objects are ready TaskTimeoutException is raised
+
+        :param list objs: the managed objects, all on the same vCenter connection
+        :param list[str] property_paths: the properties to follow, e.g. ['guest.ipAddress', 'guest.net']
+        :param is_ready: called with the object and a dict of property path to value whenever one of them
+                         changed, returns True when the object is ready
+        :param str action_name: used for logging
+        :param int timeout: seconds to wait for all the objects, overrides the default
+        :return: generator of (object, dict of property path to value)
+        """
+        if not objs:
+            return
+        timeout = timeout or self.timeout
+        deadline = time.time() + timeout if timeout else None
+        collector = self._create_property_collector(objs[0])
+        if collector is None:
+            for ready in self._poll_properties(objs, property_paths, is_ready, action_name, timeout, deadline):
+                yield ready
+            return
+
+        try:
+            collector.CreateFilter(self._create_property_filter_spec(objs, property_paths), True)
+            values = {obj: {property_path: None for property_path in property_paths} for obj in objs}
+            pending = set(objs)
+            version = ''
+            while pending:
+                update_set = collector.WaitForUpdatesEx(version, self._get_wait_options(deadline))
+                if update_set:
+                    version = update_set.version
+                    changed = []
+                    for filter_update in update_set.filterSet:
+                        for object_update in filter_update.objectSet:
+                            obj = object_update.obj
+                            for change in object_update.changeSet:
+                                values[obj][change.name] = change.val if change.op == 'assign' else None
+                            if obj not in changed:
+                                changed.append(obj)
+                    for obj in changed:
+                        if obj in pending and is_ready(obj, values[obj]):
+                            pending.remove(obj)
+                            yield obj, values[obj]
+                if pending and deadline and time.time() >= deadline:
+                    raise TaskTimeoutException('{0} did not complete within {1} seconds'.format(action_name, timeout))
+        finally:
+            self._destroy_property_collector(collector)
+
+    def _poll_properties(self, objs, property_paths, is_ready, action_name, timeout, deadline):
+        """
+        reads the properties with a growing interval, used when the objects have no connection to the vCenter
+        to create a property collector on
+        """
+        interval = 0.1
+        pending = list(objs)
+        while pending:
+            for obj in list(pending):
+                values = {property_path: reduce(getattr, property_path.split('.'), obj)
+                          for property_path in property_paths}
+                if is_ready(obj, values):
+                    pending.remove(obj)
+                    yield obj, values
+            if not pending:
+                break
+            if deadline and time.time() >= deadline:
+                raise TaskTimeoutException('{0} did not complete within {1} seconds'.format(action_name, timeout))
+            time.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+
+    def _follow_tasks(self, tasks, action_name, timeout, progress_callback):
+        """
+        yields (task, task info properties) for every task once it is done, the tasks appended to the list
+        meanwhile are followed too. Raises TaskTimeoutException when the timeout passes before all the tasks are done
+        """
+        if not tasks:
+            return
+        collector = self._create_property_collector(tasks[0])
+        if collector is None:
+            for done in self._poll_tasks(tasks, action_name, timeout, progress_callback):
+                yield done
+            return
+
+        try:
+            infos = dict()
+            pending = set()
+            followed = 0
+            deadline = time.time() + timeout if timeout else None
+            version = ''
+            while True:
+                if len(tasks) > followed:
+                    # a filter of its own on the same collector, its first update carries the current task info
+                    added = tasks[followed:]
+                    followed = len(tasks)
+                    collector.CreateFilter(self._create_filter_spec(added), True)
+                    for task in added:
+                        infos[task] = {STATE: None, ERROR: None, RESULT: None, PROGRESS: None}
+                        pending.add(task)
+                if not pending:
+                    break
+                update_set = collector.WaitForUpdatesEx(version, self._get_wait_options(deadline))
+                if update_set:
+                    version = update_set.version
+                    for filter_update in update_set.filterSet:
+                        for object_update in filter_update.objectSet:
+                            task = object_update.obj
+                            self._apply_changes(task, infos[task], object_update.changeSet,
+                                                action_name, progress_callback)
+                            if task in pending and infos[task][STATE] in DONE_STATES:
+                                pending.remove(task)
+                                yield task, infos[task]
+                if pending and deadline and time.time() >= deadline:
+                    raise TaskTimeoutException('{0} did not complete within {1} seconds'.format(action_name, timeout))
+        finally:
+            self._destroy_property_collector(collector)
+
+    def _poll_tasks(self, tasks, action_name, timeout, progress_callback):
+        """
+        reads the task info with a growing interval, used when the task has no connection to the vCenter to
+        create a property collector on
+        """
+        deadline = time.time() + timeout if timeout else None
+        interval = 0.1
+        progress = dict()
+        pending = list(tasks)
+        followed = len(tasks)
+        while pending:
+            for task in list(pending):
+                info = task.info
+                if info.state in DONE_STATES:
+                    pending.remove(task)
+                    yield task, {STATE: info.state,
+                                 ERROR: getattr(info, 'error', None),
+                                 RESULT: getattr(info, 'result', None),
+                                 PROGRESS: progress.get(task)}
+                elif getattr(info, 'progress', None) != progress.get(task):
+                    progress[task] = info.progress
+                    self._report_progress(task, action_name, info.progress, progress_callback)
+            pending.extend(tasks[followed:])
+            followed = len(tasks)
+            if not pending:
+                break
+            if deadline and time.time() >= deadline:
+                raise TaskTimeoutException('{0} did not complete within {1} seconds'.format(action_name, timeout))
+            time.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+
+    def _apply_changes(self, task, info, change_set, action_name, progress_callback):
+        for change in change_set:
+            value = change.val if change.op == 'assign' else None
+            if change.name == PROGRESS and value != info[PROGRESS] and value is not None:
+                self._report_progress(task, action_name, value, progress_callback)
+            info[change.name] = value
+
+    @staticmethod
+    def _report_progress(task, action_name, progress, progress_callback):
+        if progress is None:
+            return
+        logger.debug('%s progress: %s%%' % (action_name, progress))
+        if progress_callback:
+            progress_callback(task, progress)
+
+    def _get_wait_options(self, deadline):
+        options = vmodl.query.PropertyCollector.WaitOptions()
+        wait_seconds = self.max_wait_seconds
+        if deadline:
+            wait_seconds = max(1, min(wait_seconds, int(deadline - time.time()) + 1))
+        options.maxWaitSeconds = wait_seconds
+        return options
+
+    @staticmethod
+    def _create_property_collector(task):
+        """
+        creates a property collector dedicated to this wait, so waits running in parallel threads do not
+        consume each other's updates
+        """
+        stub = getattr(task, '_stub', None)
+        if stub is None:
+            return None
+        return vmodl.query.PropertyCollector('propertyCollector', stub).CreatePropertyCollector()
+
+    @staticmethod
+    def _destroy_property_collector(collector):
+        try:
+            collector.Destroy()
+        except Exception as e:
+            logger.debug('failed to destroy property collector: {0}'.format(e))
+
+    @staticmethod
+    def _create_filter_spec(tasks):
+        object_specs = [vmodl.query.PropertyCollector.ObjectSpec(obj=task, skip=False) for task in tasks]
+        property_spec = vmodl.query.PropertyCollector.PropertySpec(type=vim.Task, pathSet=TASK_PROPERTIES, all=False)
+        return vmodl.query.PropertyCollector.FilterSpec(objectSet=object_specs, propSet=[property_spec])
 
-        return task.info.result
+    @staticmethod
+    def _create_property_filter_spec(objs, property_paths):
+        object_specs = [vmodl.query.PropertyCollector.ObjectSpec(obj=obj, skip=False) for obj in objs]
+        property_spec = vmodl.query.PropertyCollector.PropertySpec(type=objs[0].__class__, pathSet=property_paths,
+                                                                   all=False)
+        return vmodl.query.PropertyCollector.FilterSpec(objectSet=object_specs, propSet=[property_spec])
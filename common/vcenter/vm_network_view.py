@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Read-once model of the network devices of a vm and the networks they are attached to
+"""
+from collections import OrderedDict
+
+from pyVmomi import vim
+
+NAME = 'name'
+KEY = 'key'
+DEVICES = 'config.hardware.device'
+NETWORK = 'network'
+VM_NETWORK_VIEW_PROPERTIES = [NAME, DEVICES, NETWORK]
+
+
+class NetworkRecord(object):
+    __slots__ = ('network', 'name', 'key')
+
+    def __init__(self, network, name, key=None):
+        """
+        :param network: vim.Network or vim.dvs.DistributedVirtualPortgroup
+        :param str name: the network name
+        :param str key: the port group key, None for standard networks
+        """
+        self.network = network
+        self.name = name
+        self.key = key
+
+
+class VNicRecord(object):
+    __slots__ = ('device', 'label', 'mac', 'network', 'portgroup_key')
+
+    def __init__(self, device, label, mac, network=None, portgroup_key=None):
+        """
+        :param device: vim.vm.device.VirtualEthernetCard
+        :param str label: the vnic name ('Network adapter 1')
+        :param str mac: the mac address
+        :param network: the standard network of the backing
+        :param str portgroup_key: the port group key of a distributed port backing
+        """
+        self.device = device
+        self.label = label
+        self.mac = mac
+        self.network = network
+        self.portgroup_key = portgroup_key
+
+
+class VmNetworkView(object):
+    """
+    The vnics of a vm indexed by label, mac and port group key, and the networks of the vm indexed by name,
+    key and object. Built from properties that were read once, lookups do not go to the vCenter
+    """
+
+    def __init__(self, vm, name, devices, networks):
+        """
+        :param vm: vim.VirtualMachine
+        :param str name: the vm name
+        :param devices: the virtual devices of the vm
+        :param networks: [NetworkRecord] the networks the vm is attached to
+        """
+        self.vm = vm
+        self.name = name
+        self.networks = list(networks)
+        self.vnics = OrderedDict()
+        self._vnics_by_mac = dict()
+        self._vnics_by_portgroup_key = dict()
+        self._networks_by_name = dict()
+        self._networks_by_key = dict()
+        self._networks_by_obj = dict()
+
+        for record in self.networks:
+            self._networks_by_name.setdefault(record.name, record)
+            self._networks_by_obj[record.network] = record
+            if record.key:
+                self._networks_by_key[record.key] = record
+
+        for device in devices or []:
+            if not isinstance(device, vim.vm.device.VirtualEthernetCard):
+                continue
+            record = self._create_vnic_record(device)
+            self.vnics[record.label] = record
+            if record.mac:
+                self._vnics_by_mac[record.mac] = record
+            if record.portgroup_key:
+                self._vnics_by_portgroup_key.setdefault(record.portgroup_key, []).append(record)
+
+    @classmethod
+    def create(cls, vm, objects):
+        """
+        :param vm: vim.VirtualMachine
+        :param objects: list of (managed object, dict of property path to value) of the vm and its networks
+        :rtype: VmNetworkView
+        """
+        vm_properties = dict()
+        networks = []
+        for obj, properties in objects:
+            if obj == vm:
+                vm_properties = properties
+            else:
+                networks.append(NetworkRecord(obj, properties.get(NAME), properties.get(KEY)))
+        return cls(vm, vm_properties.get(NAME), vm_properties.get(DEVICES), networks)
+
+    def map_vnics(self):
+        """
+        :return: dictionary: {'vnic_name': vnic}, like VNicService.map_vnics
+        """
+        return OrderedDict((label, record.device) for label, record in self.vnics.items())
+
+    def get_vnic_by_mac_address(self, mac_address):
+        record = self._vnics_by_mac.get(mac_address)
+        return record.device if record else None
+
+    def get_vnics_by_portgroup_key(self, portgroup_key):
+        return [record.device for record in self._vnics_by_portgroup_key.get(portgroup_key, [])]
+
+    def get_network_by_name(self, network_name):
+        record = self._networks_by_name.get(network_name)
+        return record.network if record else None
+
+    def get_network_by_key(self, network_key):
+        record = self._networks_by_key.get(network_key)
+        return record.network if record else None
+
+    def get_vnic_network_name(self, vnic_name):
+        """
+        :param str vnic_name: the vnic label
+        :return: the name of the network the vnic is attached to, None if it is unknown
+        """
+        vnic = self.vnics.get(vnic_name)
+        if vnic is None:
+            return None
+        if vnic.portgroup_key:
+            record = self._networks_by_key.get(vnic.portgroup_key)
+        else:
+            record = self._networks_by_obj.get(vnic.network) if vnic.network is not None else None
+        return record.name if record else None
+
+    @staticmethod
+    def _create_vnic_record(device):
+        backing = getattr(device, 'backing', None)
+        port = getattr(backing, 'port', None)
+        return VNicRecord(device,
+                          device.deviceInfo.label if device.deviceInfo else None,
+                          getattr(device, 'macAddress', None),
+                          network=getattr(backing, 'network', None),
+                          portgroup_key=getattr(port, 'portgroupKey', None))
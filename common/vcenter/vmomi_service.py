@@ -3,12 +3,26 @@ import time
 import os
 
 from datetime import datetime
-from pyVmomi import vim
+from pyVmomi import vim, vmodl
 from common.logger import getLogger
+from common.utilites.bounded_executor import KeyedSemaphore
 from common.utilites.io import get_path_and_name
+from common.vcenter.inventory import InventorySnapshot
+from common.vcenter.inventory_cache import InventoryCache
+from common.vcenter.task_waiter import SynchronousTaskWaiter
+from common.vcenter.vm_network_view import VmNetworkView, VM_NETWORK_VIEW_PROPERTIES
 
 logger = getLogger(__name__)
 
+VM_UUID = 'config.uuid'
+VM_INSTANCE_UUID = 'config.instanceUuid'
+VM_PREFETCH_PROPERTIES = ['name', VM_UUID, VM_INSTANCE_UUID, 'config.hardware.device', 'network',
+                          'runtime.powerState', 'runtime.host']
+LINKED_CLONE_DISK_MOVE_TYPE = 'createNewChildDiskBacking'
+# InstantClone_Task was added to the vSphere API in 6.7
+INSTANT_CLONE_API_VERSION = (6, 7)
+BASE_SNAPSHOT_NAME = 'linked clone base'
+
 
 # configure_loglevel("INFO", "INFO", os.path.join(__file__, os.pardir, os.pardir, os.pardir, 'logs', 'vCenter.log'))
 
@@ -32,6 +46,17 @@ class pyVmomiService:
             self.vim = vim
         else:
             self.vim = vim_import
+        self._inventory_caches = dict()
+        self._resolved_networks = dict()
+        # seconds a network resolved by its full name is reused without going to the vcenter
+        self.network_cache_ttl = 600
+        self._resolved_placements = dict()
+        # seconds the template, folder, datastore and pool of a clone are reused without going to the vcenter
+        self.placement_cache_ttl = 600
+        # one base snapshot is created per template, concurrent linked clones wait for it
+        self._template_snapshot_locks = KeyedSemaphore(1)
+        self.time_func = time.time
+        self.task_waiter = SynchronousTaskWaiter()
 
     def connect(self, address, user, password, port=443):
         """  
@@ -68,8 +93,43 @@ class pyVmomiService:
 
     def disconnect(self, si):
         """ Disconnect from vCenter """
+        self.stop_inventory_cache(si)
+        self.invalidate_network_cache(si)
+        self.invalidate_placement_cache(si)
         self.pyvmomi_disconnect(si)
 
+    def start_inventory_cache(self, si):
+        """
+        Starts following the inventory changes of the session, lookups by uuid and network name are then
+        answered locally while the cache is fresh
+
+        :param si: pyvmomi 'ServiceInstance'
+        :rtype: InventoryCache
+        """
+        cache = self._inventory_caches.get(id(si))
+        if cache is None:
+            try:
+                cache = InventoryCache(si).start()
+            except Exception as e:
+                logger.warn('failed to start the inventory cache, lookups will go to the vcenter: {0}'.format(e))
+                return None
+            self._inventory_caches[id(si)] = cache
+        return cache
+
+    def stop_inventory_cache(self, si):
+        """
+        :param si: pyvmomi 'ServiceInstance'
+        """
+        cache = self._inventory_caches.pop(id(si), None)
+        if cache:
+            cache.stop()
+
+    def _get_fresh_inventory_cache(self, si):
+        cache = self._inventory_caches.get(id(si))
+        if cache and cache.is_fresh():
+            return cache
+        return None
+
     def find_datacenter_by_name(self, si, path, name):
         """
         Finds datacenter in the vCenter or returns "None"
@@ -93,6 +153,13 @@ class pyVmomiService:
 
         if uuid is None:
             return None
+
+        cache = self._get_fresh_inventory_cache(si) if is_vm and path is None and data_center is None else None
+        if cache:
+            vm = cache.find_by_uuid(uuid)
+            if vm is not None:
+                return vm
+
         if path is not None:
             data_center = self.find_item_in_path_by_type(si, path, vim.Datacenter)
 
@@ -155,6 +222,11 @@ class pyVmomiService:
         :param path:       the path to find the object ('dc' or 'dc/folder' or 'dc/folder/folder/etc...')
         :param name:       the datastore name to return
         """
+        cache = self._get_fresh_inventory_cache(si)
+        if cache:
+            network = cache.find_network_by_name(path, name)
+            if network is not None:
+                return network
         return self.find_obj_by_path(si, path, name, self.Network)
 
     def find_vm_by_name(self, si, path, name):
@@ -242,12 +314,32 @@ class pyVmomiService:
 
     def get_network_by_full_name(self, si, default_network_full_name):
         """
-        Find network by a Full Name
+        Find network by a Full Name, the network is resolved once per session and reused for network_cache_ttl
         :param default_network_full_name: <str> Full Network Name - likes 'Root/Folder/Network'
         :return:
         """
+        key = (id(si), default_network_full_name)
+        resolved = self._resolved_networks.get(key)
+        if resolved and resolved[0] is si and self.time_func() - resolved[2] < self.network_cache_ttl:
+            return resolved[1]
+
         path, name = get_path_and_name(default_network_full_name)
-        return self.find_network_by_name(si, path, name) if name else None
+        network = self.find_network_by_name(si, path, name) if name else None
+        if network is not None:
+            self._resolved_networks[key] = (si, network, self.time_func())
+        return network
+
+    def invalidate_network_cache(self, si, full_name=None):
+        """
+        Forgets the networks resolved by their full name, called when a network turns out to be gone
+        (vmodl.fault.ManagedObjectNotFound) or when the session ends
+
+        :param si: pyvmomi 'ServiceInstance'
+        :param full_name: the full name to forget, all the networks of the session when None
+        """
+        for key in self._resolved_networks.keys():
+            if key[0] == id(si) and (full_name is None or key[1] == full_name):
+                self._resolved_networks.pop(key, None)
 
     def get_obj(self, content, vimtype, name):
         """
@@ -259,33 +351,232 @@ class pyVmomiService:
         :param name:       the object name to return
         """
 
-        obj = None
-        container = content.viewManager.CreateContainerView(
-            content.rootFolder, vimtype, True)
-        for c in container.view:
-            if name:
-                if c.name == name:
-                    obj = c
-                    break
-            else:
-                obj = c
-                break
+        '# the names of all the objects are fetched in one property collector call instead of one call per object'
+        for obj, properties in self.retrieve_properties(content, {t: ['name'] for t in vimtype}):
+            if not name or properties.get('name') == name:
+                return obj
+        return None
+
+    def retrieve_properties(self, content, type_to_properties, container=None, page_size=1000):
+        """
+        Retrieves the given properties of all the objects of the given types with a single property collector
+        pass, the results are paged so big inventories are not returned in one huge response
 
-        return obj
+        :param content:            pyvmomi content object
+        :param type_to_properties: dict of vim type to the list of property paths to retrieve, e.g.
+                                   {vim.VirtualMachine: ['name', 'config.uuid']}
+        :param container:          the managed object to look under, the root folder if None
+        :param page_size:          max objects to return in one response
+        :return: list of (managed object, dict of property path to value)
+        """
+        view = content.viewManager.CreateContainerView(container or content.rootFolder,
+                                                       type_to_properties.keys(), True)
+        try:
+            traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(name='traverseView',
+                                                                         path='view',
+                                                                         skip=False,
+                                                                         type=vim.view.ContainerView)
+            object_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal_spec])
+            property_specs = [vmodl.query.PropertyCollector.PropertySpec(type=vim_type, pathSet=paths, all=False)
+                              for vim_type, paths in type_to_properties.items()]
+            filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=[object_spec], propSet=property_specs)
+
+            return self._retrieve_pages(content.propertyCollector, filter_spec, page_size)
+        finally:
+            view.Destroy()
+
+    def retrieve_object_properties(self, content, objects, properties):
+        """
+        Retrieves the given properties of the given objects in one property collector call
+
+        :param content:    pyvmomi content object
+        :param objects:    the managed objects to read
+        :param properties: the list of property paths to retrieve
+        :return: list of (managed object, dict of property path to value)
+        """
+        if not objects:
+            return []
+        object_specs = [vmodl.query.PropertyCollector.ObjectSpec(obj=obj, skip=False) for obj in objects]
+        property_specs = [vmodl.query.PropertyCollector.PropertySpec(type=vim_type, pathSet=properties, all=False)
+                          for vim_type in set([type(obj) for obj in objects])]
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=object_specs, propSet=property_specs)
+        return self._retrieve_pages(content.propertyCollector, filter_spec, len(objects))
+
+    def retrieve_referenced_properties(self, content, obj, path, vim_type, properties):
+        """
+        Retrieves the properties of the objects referenced by a property of the given object in one call,
+        like the name and key of all the port groups of a dvSwitch
+
+        :param content:    pyvmomi content object
+        :param obj:        the managed object holding the references
+        :param str path:   the property of obj holding the references ('portgroup')
+        :param vim_type:   the type of the referenced objects
+        :param properties: the list of property paths to retrieve of the referenced objects
+        :return: list of (managed object, dict of property path to value)
+        """
+        traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(name='traverse_{0}'.format(path),
+                                                                     path=path,
+                                                                     skip=False,
+                                                                     type=type(obj))
+        object_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=obj, skip=True, selectSet=[traversal_spec])
+        property_spec = vmodl.query.PropertyCollector.PropertySpec(type=vim_type, pathSet=properties, all=False)
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=[object_spec], propSet=[property_spec])
+        return self._retrieve_pages(content.propertyCollector, filter_spec, 1000)
+
+    def find_vms_by_uuids(self, si, uuids):
+        """
+        Finds many vms by their bios or instance uuid and reads their devices, networks, power state and host
+        together with the names and keys of their networks, so the number of calls to the vCenter does not grow
+        with the number of vms
+
+        :param si:    pyvmomi 'ServiceInstance'
+        :param uuids: the uuids of the vms
+        :return: dict of uuid to pyVmomiService.PrefetchedVm, uuids that were not found are not in the dict
+        """
+        missing = set([uuid for uuid in uuids if uuid])
+        uuid_to_vm = dict()
+
+        cache = self._get_fresh_inventory_cache(si)
+        if cache:
+            for uuid in missing:
+                vm = cache.find_by_uuid(uuid)
+                if vm is not None:
+                    uuid_to_vm[uuid] = vm
+            missing -= set(uuid_to_vm.keys())
+
+        if missing:
+            for vm, properties in self.retrieve_properties(si.content, {vim.VirtualMachine: [VM_UUID,
+                                                                                             VM_INSTANCE_UUID]}):
+                for uuid in (properties.get(VM_UUID), properties.get(VM_INSTANCE_UUID)):
+                    if uuid in missing:
+                        uuid_to_vm[uuid] = vm
+
+        vms = list(set(uuid_to_vm.values()))
+        if not vms:
+            return dict()
+        filter_spec = self._create_network_view_filter_spec(vms, VM_PREFETCH_PROPERTIES)
+        objects = self._retrieve_pages(si.content.propertyCollector, filter_spec, 1000)
+        vm_set = set(vms)
+        vm_properties = {obj: properties for obj, properties in objects if obj in vm_set}
+        networks = {obj: properties for obj, properties in objects if obj not in vm_set}
+        return {uuid: self.PrefetchedVm(vm, vm_properties[vm], networks)
+                for uuid, vm in uuid_to_vm.items()
+                if vm in vm_properties}
+
+    def get_vms_datacenters(self, si, vms):
+        """
+        Finds the datacenter of every vm without reading the parents of each one: the fresh inventory cache
+        answers it, otherwise all the vms belong to the only datacenter of the vCenter
+
+        :param si:  pyvmomi 'ServiceInstance'
+        :param vms: list of vim.VirtualMachine
+        :return: dict of vm to vim.Datacenter, the vms whose datacenter is not known are not in the dict
+        """
+        cache = self._get_fresh_inventory_cache(si)
+        if cache:
+            datacenters = dict()
+            for vm in vms:
+                datacenter = cache.get_datacenter(vm)
+                if datacenter is not None:
+                    datacenters[vm] = datacenter
+            return datacenters
+
+        datacenters = [datacenter for datacenter, properties
+                       in self.retrieve_properties(si.content, {vim.Datacenter: ['name']})]
+        if len(datacenters) == 1:
+            return {vm: datacenters[0] for vm in vms}
+        return dict()
+
+    def get_vm_network_view(self, si, vm):
+        """
+        Reads the devices and networks of the vm together with the names and keys of the networks in one
+        property collector call
+
+        :param si: pyvmomi 'ServiceInstance'
+        :param vm: vim.VirtualMachine
+        :rtype: VmNetworkView
+        """
+        filter_spec = self._create_network_view_filter_spec([vm], VM_NETWORK_VIEW_PROPERTIES)
+        return VmNetworkView.create(vm, self._retrieve_pages(si.content.propertyCollector, filter_spec, 1000))
+
+    @staticmethod
+    def _create_network_view_filter_spec(vms, vm_properties):
+        """
+        reads the given properties of the vms and the names and keys of the networks they are attached to
+        """
+        traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(name='traverse_network',
+                                                                     path='network',
+                                                                     skip=False,
+                                                                     type=vim.VirtualMachine)
+        object_specs = [vmodl.query.PropertyCollector.ObjectSpec(obj=vm, skip=False, selectSet=[traversal_spec])
+                        for vm in vms]
+        property_specs = [
+            vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine, pathSet=vm_properties, all=False),
+            vmodl.query.PropertyCollector.PropertySpec(type=vim.Network, pathSet=['name'], all=False),
+            vmodl.query.PropertyCollector.PropertySpec(type=vim.dvs.DistributedVirtualPortgroup,
+                                                       pathSet=['name', 'key'], all=False)]
+        return vmodl.query.PropertyCollector.FilterSpec(objectSet=object_specs, propSet=property_specs)
+
+    def get_inventory_snapshot(self, si):
+        """
+        Loads the names, parents and uuids of the inventory in one pass, so paths, names and uuids can be
+        looked up without going to the vCenter
+
+        :param si: pyvmomi 'ServiceInstance'
+        :rtype: InventorySnapshot
+        """
+        return InventorySnapshot().load(self, si)
+
+    @staticmethod
+    def _retrieve_pages(property_collector, filter_spec, page_size):
+        results = []
+        options = vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=page_size)
+        page = property_collector.RetrievePropertiesEx(specSet=[filter_spec], options=options)
+        while page:
+            for object_content in page.objects:
+                properties = {prop.name: prop.val for prop in object_content.propSet}
+                results.append((object_content.obj, properties))
+            if not page.token:
+                break
+            page = property_collector.ContinueRetrievePropertiesEx(token=page.token)
+        return results
 
     def wait_for_task(self, task):
         """ wait for a vCenter task to finish """
-        task_done = False
-        while not task_done:
-            if task.info.state == 'success':
-                logger.info("Task succeeded: " + task.info.state)
-                return task.info.result
-
-            if task.info.state == 'error':
-                logger.info("error type: %s" % task.info.error.__class__.__name__)
-                logger.info("found cause: %s" % task.info.error.faultCause)
-                raise Exception(task.info.error.faultCause)
-            time.sleep(1)
+        try:
+            return self.task_waiter.wait_for_task(task=task, action_name='Task', hideResult=True)
+        except vmodl.fault.ManagedObjectNotFound:
+            # kept as is, so the caches that hold the object can be invalidated
+            raise
+        except vmodl.MethodFault as e:
+            logger.info("error type: %s" % e.__class__.__name__)
+            logger.info("found cause: %s" % e.faultCause)
+            raise Exception(e.faultCause)
+
+    class PrefetchedVm:
+        """
+        A vm together with the properties that were read with it in the same call
+        """
+
+        def __init__(self, vm, properties, networks=None):
+            """
+            :param vm:                pyvmomi vm object
+            :param dict properties:   property path to value
+            :param dict networks:     network to its dict of property path to value, read in the same call,
+                                      the networks of other vms may be included
+            """
+            self.vm = vm
+            self.name = properties.get('name')
+            self.uuid = properties.get(VM_UUID)
+            self.instance_uuid = properties.get(VM_INSTANCE_UUID)
+            self.devices = properties.get('config.hardware.device') or []
+            self.networks = properties.get('network') or []
+            self.power_state = properties.get('runtime.powerState')
+            self.host = properties.get('runtime.host')
+            networks = networks or dict()
+            self.network_view = VmNetworkView.create(vm, [(vm, properties)] +
+                                                     [(network, networks[network])
+                                                      for network in self.networks if network in networks])
 
     class CloneVmParameters:
         """
@@ -300,7 +591,9 @@ class pyVmomiService:
                      datastore_name=None,
                      cluster_name=None,
                      resource_pool=None,
-                     power_on=True):
+                     power_on=True,
+                     linked_clone=False,
+                     snapshot_name=None):
             """
             Constructor of CloneVmParameters
             :param si:              pyvmomi 'ServiceInstance'
@@ -311,6 +604,8 @@ class pyVmomiService:
             :param cluster_name:    str: the name of the dcluster
             :param resource_pool:   str: the name of the resource pool
             :param power_on:        bool: turn on the cloned vm
+            :param linked_clone:    bool: the clone shares the disks of a template snapshot instead of copying them
+            :param snapshot_name:   str: the snapshot of a linked clone, the current snapshot if None
             """
             self.si = si
             self.template_name = template_name
@@ -320,21 +615,42 @@ class pyVmomiService:
             self.cluster_name = cluster_name
             self.resource_pool = resource_pool
             self.power_on = power_on
+            self.linked_clone = linked_clone
+            self.snapshot_name = snapshot_name
 
     class CloneVmResult:
         """
         Clone vm result object, will contain the cloned vm or error message
         """
 
-        def __init__(self, vm=None, error=None):
+        def __init__(self, vm=None, error=None, task=None):
             """
             Constructor receives the cloned vm or the error message
 
             :param vm:    cloned vm
             :param error: will contain the error message if there is one
+            :param task:  the clone task, set by start_clone_vm
             """
             self.vm = vm
             self.error = error
+            self.task = task
+
+    class ClonePlacement:
+        """
+        Where a clone is created and what it is cloned from
+        """
+
+        def __init__(self, dest_folder, template, datastore, resource_pool):
+            """
+            :param dest_folder:   vim.Folder the clone is created in
+            :param template:      vim.VirtualMachine the template/vm to clone
+            :param datastore:     vim.Datastore of the clone
+            :param resource_pool: vim.ResourcePool of the clone
+            """
+            self.dest_folder = dest_folder
+            self.template = template
+            self.datastore = datastore
+            self.resource_pool = resource_pool
 
     def clone_vm(self, clone_params):
         """
@@ -342,6 +658,26 @@ class pyVmomiService:
 
         :param clone_params: CloneVmParameters =
         """
+        result = self.start_clone_vm(clone_params)
+        if result.error:
+            return result
+
+        try:
+            vm = self.wait_for_task(result.task)
+        except vmodl.fault.ManagedObjectNotFound:
+            # the cached folder, datastore or resource pool of the clone was removed
+            self.invalidate_placement_cache(clone_params.si, clone_params)
+            raise
+        result.vm = vm
+        return result
+
+    def start_clone_vm(self, clone_params):
+        """
+        Starts cloning a VM from a template/VM without waiting for it, so many clones can run together
+
+        :param clone_params: CloneVmParameters
+        :return: CloneVmResult with the clone task or the error message
+        """
         result = self.CloneVmResult()
 
         if not isinstance(clone_params.si, self.vim.ServiceInstance):
@@ -360,14 +696,153 @@ class pyVmomiService:
             result.error = 'vm_folder param cannot be None'
             return result
 
+        placement = self.resolve_clone_placement(clone_params)
+        if placement is None:
+            result.error = 'Failed to find folder: {0}'.format(clone_params.vm_folder)
+            return result
+
+        '# set relo_spec'
+        relo_spec = self.vim.vm.RelocateSpec()
+        relo_spec.datastore = placement.datastore
+        relo_spec.pool = placement.resource_pool
+
+        clone_spec = self.vim.vm.CloneSpec()
+        clone_spec.location = relo_spec
+        clone_spec.powerOn = clone_params.power_on
+
+        if clone_params.linked_clone:
+            relo_spec.diskMoveType = LINKED_CLONE_DISK_MOVE_TYPE
+            clone_spec.snapshot = self.get_clone_snapshot(placement.template, clone_params.snapshot_name)
+
+        logger.info("cloning VM...")
+
+        result.task = placement.template.Clone(folder=placement.dest_folder, name=clone_params.vm_name,
+                                               spec=clone_spec)
+        return result
+
+    def supports_instant_clone(self, si):
+        """
+        Instant clone needs both a pyVmomi that knows InstantClone_Task and a vCenter of API version 6.7 or later
+        :param si: pyvmomi 'ServiceInstance'
+        :rtype: bool
+        """
+        if not hasattr(self.vim.VirtualMachine, 'InstantClone_Task') or not hasattr(self.vim.vm, 'InstantCloneSpec'):
+            return False
+        try:
+            api_version = tuple(int(part) for part in si.content.about.apiVersion.split('.')[:2])
+        except (AttributeError, ValueError):
+            return False
+        return api_version >= INSTANT_CLONE_API_VERSION
+
+    def instant_clone_vm(self, parent, vm_name, placement):
+        """
+        Forks a running parent vm, the child starts from the memory and disk state of the parent instead of booting
+        :param parent:    vim.VirtualMachine the running parent
+        :param vm_name:   str the name of the child
+        :param placement: ClonePlacement where the child is created
+        :return: vim.VirtualMachine the child
+        """
+        relo_spec = self.vim.vm.RelocateSpec()
+        relo_spec.folder = placement.dest_folder
+        relo_spec.datastore = placement.datastore
+        relo_spec.pool = placement.resource_pool
+
+        instant_clone_spec = self.vim.vm.InstantCloneSpec()
+        instant_clone_spec.name = vm_name
+        instant_clone_spec.location = relo_spec
+
+        logger.info("instant cloning VM...")
+        task = parent.InstantClone_Task(spec=instant_clone_spec)
+        return self.wait_for_task(task)
+
+    def get_clone_snapshot(self, template, snapshot_name=None):
+        """
+        Finds the snapshot a linked clone is created from. A template without snapshots gets a base snapshot,
+        it is created once even when many linked clones of the template are deployed together
+
+        :param template:      vim.VirtualMachine the template/vm to clone
+        :param snapshot_name: str the name of the snapshot, the current snapshot if None
+        :return: vim.vm.Snapshot
+        """
+        if snapshot_name:
+            snapshot = self._find_snapshot_by_name(template.snapshot, snapshot_name)
+            if snapshot is None:
+                raise ValueError('Snapshot {0} was not found on {1}'.format(snapshot_name, template.name))
+            return snapshot
+
+        snapshot_info = template.snapshot
+        if snapshot_info and snapshot_info.currentSnapshot:
+            return snapshot_info.currentSnapshot
+
+        with self._template_snapshot_locks.hold(template):
+            # another deploy may have created the base snapshot while this one waited
+            snapshot_info = template.snapshot
+            if snapshot_info and snapshot_info.currentSnapshot:
+                return snapshot_info.currentSnapshot
+            logger.info('creating the base snapshot of {0} for linked clones'.format(template.name))
+            task = template.CreateSnapshot_Task(name=BASE_SNAPSHOT_NAME,
+                                                description='the base of the linked clones of the template',
+                                                memory=False,
+                                                quiesce=False)
+            return self.wait_for_task(task)
+
+    @staticmethod
+    def _find_snapshot_by_name(snapshot_info, snapshot_name):
+        trees = list(snapshot_info.rootSnapshotList) if snapshot_info else []
+        while trees:
+            tree = trees.pop(0)
+            if tree.name == snapshot_name:
+                return tree.snapshot
+            trees.extend(tree.childSnapshotList or [])
+        return None
+
+    def resolve_clone_placement(self, clone_params):
+        """
+        Finds the template, the destination folder, the datastore and the resource pool of a clone.
+        They are resolved once per session and reused for placement_cache_ttl, so many apps deployed from the
+        same template to the same place do not look them up again
+
+        :param clone_params: CloneVmParameters
+        :return: ClonePlacement, None when the folder was not found
+        """
+        si = clone_params.si
+        key = self._get_placement_key(clone_params)
+        resolved = self._resolved_placements.get(key)
+        if resolved and resolved[0] is si and self.time_func() - resolved[2] < self.placement_cache_ttl:
+            return resolved[1]
+
+        placement = self._resolve_clone_placement(clone_params)
+        if placement is not None:
+            self._resolved_placements[key] = (si, placement, self.time_func())
+        return placement
+
+    def invalidate_placement_cache(self, si, clone_params=None):
+        """
+        Forgets the clone placements of the session, called when an object turns out to be gone
+        (vmodl.fault.ManagedObjectNotFound) or when the session ends
+        :param si: pyvmomi 'ServiceInstance'
+        :param clone_params: CloneVmParameters, only the placement of this clone is forgotten when given
+        """
+        if clone_params is not None:
+            self._resolved_placements.pop(self._get_placement_key(clone_params), None)
+            return
+        for key in self._resolved_placements.keys():
+            if key[0] == id(si):
+                self._resolved_placements.pop(key, None)
+
+    @staticmethod
+    def _get_placement_key(clone_params):
+        return (id(clone_params.si), clone_params.vm_folder, clone_params.template_name,
+                clone_params.datastore_name, clone_params.cluster_name, clone_params.resource_pool)
+
+    def _resolve_clone_placement(self, clone_params):
         managed_object = self.get_folder(clone_params.si, clone_params.vm_folder)
         if isinstance(managed_object, self.vim.Datacenter):
             dest_folder = managed_object.vmFolder
         elif isinstance(managed_object, self.vim.Folder):
             dest_folder = managed_object
         else:
-            result.error = 'Failed to find folder: {0}'.format(clone_params.vm_folder)
-            return result
+            return None
 
         template = self.find_vm_by_name(clone_params.si, clone_params.vm_folder, clone_params.template_name)
 
@@ -388,21 +863,7 @@ class pyVmomiService:
                                    clone_params.cluster_name)
             resource_pool = cluster.resourcePool
 
-        '# set relo_spec'
-        relo_spec = self.vim.vm.RelocateSpec()
-        relo_spec.datastore = datastore
-        relo_spec.pool = resource_pool
-
-        clone_spec = self.vim.vm.CloneSpec()
-        clone_spec.location = relo_spec
-        clone_spec.powerOn = clone_params.power_on
-
-        logger.info("cloning VM...")
-
-        task = template.Clone(folder=dest_folder, name=clone_params.vm_name, spec=clone_spec)
-        vm = self.wait_for_task(task)
-        result.vm = vm
-        return result
+        return self.ClonePlacement(dest_folder, template, datastore, resource_pool)
 
     def destroy_vm(self, vm):
         """ 
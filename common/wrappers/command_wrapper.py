@@ -1,3 +1,5 @@
+from pyVmomi import vim, vmodl
+
 DISCONNCTING_VCENERT = 'disconnecting from vcenter: {0}'
 COMMAND_ERROR = 'error has occurred while executing command: {0}'
 DEBUG_COMMAND_RESULT = 'finished executing with the result: {0}'
@@ -13,12 +15,22 @@ INFO_CONNECTING_TO_VCENTER = 'connecting to vcenter: {0}'
 START = 'START'
 END = 'END'
 LOG_FORMAT = 'action:{0} command_name:{1}'
+RELEASING_VCENTER_SESSION = 'releasing vcenter session: {0}'
+INVALIDATING_VCENTER_SESSION = 'vcenter session is not authenticated, invalidating it: {0}'
+INVALIDATING_NETWORK_CACHE = 'managed object not found, forgetting the resolved networks and clone placements of: {0}'
 
 
 class CommandWrapper:
-    def __init__(self, logger, pv_service):
+    def __init__(self, logger, pv_service, session_pool=None):
+        """
+        :param logger: logger factory
+        :param pv_service: pyVmomiService
+        :param common.vcenter.session_pool.VCenterSessionPool session_pool: when given the vCenter sessions are
+                                                                             reused between commands
+        """
         self.pv_service = pv_service
         self.logger = logger
+        self.session_pool = session_pool
 
     def execute_command(self, command, *args):
         return self.execute_command_with_connection(None, command, *args)
@@ -45,10 +57,7 @@ class CommandWrapper:
                                                      connection_details.username,
                                                      connection_details.port))
 
-                si = self.pv_service.connect(connection_details.host,
-                                             connection_details.username,
-                                             connection_details.password,
-                                             connection_details.port)
+                si = self._get_service_instance(connection_details)
             if si:
                 logger.info(CONNECTED_TO_CENTER.format(connection_details.host))
 
@@ -68,12 +77,42 @@ class CommandWrapper:
             logger.debug(DEBUG_COMMAND_RESULT.format(str(results)))
 
             return results
+        except vim.fault.NotAuthenticated as e:
+            logger.error(COMMAND_ERROR.format(command_name))
+            logger.exception(e)
+            if si and self.session_pool:
+                logger.info(INVALIDATING_VCENTER_SESSION.format(connection_details.host))
+                self.session_pool.invalidate(connection_details, si)
+            raise
+        except vmodl.fault.ManagedObjectNotFound as e:
+            logger.error(COMMAND_ERROR.format(command_name))
+            logger.exception(e)
+            if si:
+                logger.info(INVALIDATING_NETWORK_CACHE.format(connection_details.host))
+                self.pv_service.invalidate_network_cache(si)
+                self.pv_service.invalidate_placement_cache(si)
+            raise
         except Exception as e:
             logger.error(COMMAND_ERROR.format(command_name))
             logger.exception(e)
             raise
         finally:
             if si:
-                logger.info(DISCONNCTING_VCENERT.format(connection_details.host))
-                self.pv_service.disconnect(si)
+                self._release_service_instance(logger, connection_details, si)
             logger.info(LOG_FORMAT.format(END, command_name))
+
+    def _get_service_instance(self, connection_details):
+        if self.session_pool:
+            return self.session_pool.get_session(connection_details)
+        return self.pv_service.connect(connection_details.host,
+                                       connection_details.username,
+                                       connection_details.password,
+                                       connection_details.port)
+
+    def _release_service_instance(self, logger, connection_details, si):
+        if self.session_pool:
+            logger.info(RELEASING_VCENTER_SESSION.format(connection_details.host))
+            self.session_pool.release_session(connection_details, si)
+        else:
+            logger.info(DISCONNCTING_VCENERT.format(connection_details.host))
+            self.pv_service.disconnect(si)
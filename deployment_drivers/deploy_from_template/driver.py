@@ -47,6 +47,8 @@ class DeploymentServiceDriver(object):
                                                                                 vCenterVMFromTemplateResourceModel)
         vcenter_resource_model = self._get_vcenter(api, vcenter_template_resource_model.vcenter_name)
         template_model = self._create_vcenter_template_model(vcenter_resource_model, vcenter_template_resource_model)
+        template_model.linked_clone = self.cs_retriever_service.getLinkedCloneAttributeData(resource_context)
+        template_model.snapshot_name = self.cs_retriever_service.getSnapshotNameAttributeData(resource_context)
         vm_cluster_model = VMClusterModel(vcenter_resource_model.vm_cluster, vcenter_resource_model.vm_resource_pool)
 
         # get power state of the cloned VM
@@ -11,3 +11,5 @@ class vCenterVMFromTemplateResourceModel(object):
         self.auto_power_off = ''
         self.wait_for_ip = ''
         self.auto_delete = ''
+        self.linked_clone = ''
+        self.snapshot_name = ''
@@ -61,18 +61,77 @@ class TestCommandOrchestrator(TestCase):
         # assert
         self.assertTrue(self.command_orchestrator.command_wrapper.execute_command_with_connection.called)
 
+    def test_destroy_vms(self):
+        # arrange
+        self.command_orchestrator._parse_remote_models = Mock(return_value=[Mock(), Mock()])
+        # act
+        self.command_orchestrator.destroy_vms(self.context, self.ports)
+        # assert
+        self.assertEqual(len(self.command_orchestrator.command_wrapper.execute_command_with_connection.call_args[0][3]),
+                         2)
+
+    def test_power_on_vms(self):
+        # arrange
+        self.command_orchestrator._parse_remote_models = Mock(return_value=[Mock(), Mock()])
+        # act
+        self.command_orchestrator.power_on_vms(self.context, self.ports)
+        # assert
+        args = self.command_orchestrator.command_wrapper.execute_command_with_connection.call_args[0]
+        self.assertEqual(args[1], self.command_orchestrator.vm_power_management_command.power_on_vms)
+        self.assertEqual(len(args[3]), 2)
+
     def test_deploy_from_template(self):
         # act
         self.command_orchestrator.deploy_from_template(self.context, '{"name": "name"}')
         # assert
         self.assertTrue(self.command_orchestrator.command_wrapper.execute_command_with_connection.called)
 
+    def test_deploy_from_templates(self):
+        # act
+        self.command_orchestrator.deploy_from_templates(self.context, '[{"name": "name1"}, {"name": "name2"}]')
+        # assert
+        args = self.command_orchestrator.command_wrapper.execute_command_with_connection.call_args[0]
+        self.assertEqual(args[1], self.command_orchestrator.deploy_command.execute_deploy_from_templates)
+        self.assertEqual([data_holder.name for data_holder in args[2]], ['name1', 'name2'])
+
+    def test_deploy_instant_clone(self):
+        # act
+        self.command_orchestrator.deploy_instant_clone(self.context, '{"name": "name"}')
+        # assert
+        args = self.command_orchestrator.command_wrapper.execute_command_with_connection.call_args[0]
+        self.assertEqual(args[1], self.command_orchestrator.deploy_command.execute_deploy_instant_clone)
+        self.assertEqual(args[3], self.connection_details)
+
+    def test_deploy_from_warm_pool(self):
+        # act
+        self.command_orchestrator.deploy_from_warm_pool(self.context, '{"name": "name"}')
+        # assert
+        args = self.command_orchestrator.command_wrapper.execute_command_with_connection.call_args[0]
+        self.assertEqual(args[1], self.command_orchestrator.deploy_command.execute_deploy_from_warm_pool)
+        self.assertEqual(args[3], self.connection_details)
+
+    def test_get_warm_pool_stats(self):
+        # act
+        res = self.command_orchestrator.get_warm_pool_stats(self.context)
+        # assert
+        self.assertEqual(res, 'command_json_result=[]=command_json_result_end')
+
     def test_deploy_from_image(self):
         # act
         self.command_orchestrator.deploy_from_image(self.context, '{"name": "name"}')
         # assert
         self.assertTrue(self.command_orchestrator.command_wrapper.execute_command_with_connection.called)
 
+    def test_refresh_ips(self):
+        # arrange
+        self.command_orchestrator._parse_remote_models = Mock(return_value=[Mock(), Mock()])
+        # act
+        self.command_orchestrator.refresh_ips(self.context, self.ports)
+        # assert
+        args = self.command_orchestrator.command_wrapper.execute_command_with_connection.call_args[0]
+        self.assertEqual(args[1], self.command_orchestrator.refresh_ip_command.refresh_ips)
+        self.assertEqual(len(args[3]), 2)
+
     def test_power_off(self):
         # act
         self.command_orchestrator.power_off(self.context, self.ports)
@@ -89,10 +148,34 @@ class TestCommandOrchestrator(TestCase):
         # act
         self.command_orchestrator.power_cycle(self.context, self.ports, 0.0001)
         # assert
-        self.assertTrue(self.command_orchestrator.command_wrapper.execute_command_with_connection.called)
+        self.command_orchestrator.command_wrapper.execute_command_with_connection.assert_called_once()
+        self.assertEqual(self.command_orchestrator.command_wrapper.execute_command_with_connection.call_args[0][1],
+                         self.command_orchestrator.vm_power_management_command.power_cycle)
 
     def test_refresh_ip(self):
         # act
         self.command_orchestrator.refresh_ip(self.context, self.ports)
         # assert
         self.assertTrue(self.command_orchestrator.command_wrapper.execute_command_with_connection.called)
+
+    def test_connection_details_are_decrypted_once(self):
+        # act
+        self.command_orchestrator.power_off(self.context, self.ports)
+        self.command_orchestrator.power_on(self.context, self.ports)
+        # assert
+        self.assertEqual(self.command_orchestrator.cs_helper.get_connection_details.call_count, 1)
+
+    def test_cleanup_releases_sessions_and_workers(self):
+        # arrange
+        self.command_orchestrator.session_pool = Mock()
+        self.command_orchestrator.executor = Mock()
+        self.command_orchestrator.warm_vm_pool = Mock()
+        self.command_orchestrator.instant_clone_pool = Mock()
+        # act
+        self.command_orchestrator.cleanup()
+        # assert
+        self.assertTrue(self.command_orchestrator.instant_clone_pool.retire_all.called)
+        self.assertTrue(self.command_orchestrator.session_pool.close_all.called)
+        self.assertTrue(self.command_orchestrator.executor.shutdown.called)
+        self.assertTrue(self.command_orchestrator.warm_vm_pool.shutdown.called)
+        self.assertTrue(self.command_orchestrator.warm_vm_pool.destroy_all.called)
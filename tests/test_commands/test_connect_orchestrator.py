@@ -0,0 +1,262 @@
+import json
+from unittest import TestCase
+
+from mock import Mock
+from pyVmomi import vim, vmodl
+
+from vCenterShell.commands.connect_orchestrator import ConnectionCommandOrchestrator
+from vCenterShell.vm.dvswitch_connector import ConnectRequest
+from vCenterShell.vm.portgroup_configurer import VNicDeviceMapper
+
+
+class TestConnectionCommandOrchestrator(TestCase):
+    def setUp(self):
+        self.vm = Mock()
+        self.default_network = Mock()
+        self.pv_service = Mock()
+        self.pv_service.find_vms_by_uuids = Mock(return_value={})
+        self.pv_service.find_by_uuid = Mock(return_value=self.vm)
+        self.pv_service.get_network_by_full_name = Mock(return_value=self.default_network)
+
+        self.access_network = Mock()
+        self.access_network.name = 'QS_dvSwitch_VLAN_10_Access'
+        self.trunk_network = Mock()
+        self.trunk_network.name = 'QS_dvSwitch_VLAN_20_Trunk'
+        self.connector = Mock()
+        self.connector.create_port_groups = Mock(return_value={})
+        self.connector.create_connect_requests = Mock(
+            side_effect=lambda si, vm, mappings, port_groups, vm_network_view: [ConnectRequest(None, self.access_network
+                                                                 if mapping.vlan_spec == 'Access'
+                                                                 else self.trunk_network)
+                                                  for mapping in mappings])
+
+        self.removed_vnic = Mock()
+        self.removed_vnic.deviceInfo.label = 'Network adapter 1'
+        self.disconnector = Mock()
+        self.disconnector.create_disconnect_mappings = Mock(
+            return_value=[VNicDeviceMapper(self.removed_vnic, self.default_network, False, 'AA')])
+
+        self.access_vnic = Mock()
+        self.access_vnic.macAddress = 'AA'
+        self.trunk_vnic = Mock()
+        self.trunk_vnic.macAddress = 'BB'
+        self.port_group_configurer = Mock()
+        self.port_group_configurer.map_vnics_to_networks = Mock(
+            return_value=[VNicDeviceMapper(self.trunk_vnic, self.trunk_network, True, 'BB'),
+                          VNicDeviceMapper(self.access_vnic, self.access_network, True, 'AA')])
+
+        vc_data_model = Mock()
+        vc_data_model.default_dvswitch = 'QualiSB\\dvSwitch'
+        vc_data_model.default_port_group_location = 'QualiSB'
+        vc_data_model.holding_network = 'QualiSB/anetwork'
+        self.orchestrator = ConnectionCommandOrchestrator(vc_data_model, self.connector, self.disconnector,
+                                                          self.pv_service, self.port_group_configurer)
+
+    @staticmethod
+    def _action(action_id, action_type, vm_uuid='uuid', mode='Access', vlan_ids=None, interfaces=None):
+        return {'actionId': action_id,
+                'type': action_type,
+                'connectionParams': {'mode': mode, 'vlanIds': vlan_ids or []},
+                'connectorAttributes': [{'attributeName': 'Interface', 'attributeValue': interface}
+                                        for interface in interfaces or []],
+                'customActionAttributes': [{'attributeName': 'VM_UUID', 'attributeValue': vm_uuid}]}
+
+    @staticmethod
+    def _request(*actions):
+        return json.dumps({'driverRequest': {'actions': list(actions)}})
+
+    def test_all_actions_of_a_vm_are_applied_with_one_reconfigure(self):
+        # arrange
+        request = self._request(self._action('access', 'setVlan', mode='Access', vlan_ids=['10']),
+                                self._action('trunk', 'setVlan', mode='Trunk', vlan_ids=['20']),
+                                self._action('remove', 'removeVlan', interfaces=['AA']))
+
+        # act
+        results = self.orchestrator.connect_bulk(Mock(), request)
+
+        # assert
+        self.port_group_configurer.update_vnic_by_mapping.assert_called_once()
+        device_mappings = self.port_group_configurer.update_vnic_by_mapping.call_args[0][1]
+        self.assertEqual([mapping.vnic_mac for mapping in device_mappings], ['AA', 'BB'])
+        self.assertTrue(device_mappings[0].connect)
+        self.assertEqual(self.port_group_configurer.map_vnics_to_networks.call_args[0][3], ['Network adapter 1'])
+
+        results_by_action = {result.actionId: result for result in results}
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results_by_action['access'].updatedInterface, 'AA')
+        self.assertEqual(results_by_action['trunk'].updatedInterface, 'BB')
+        self.assertEqual(results_by_action['remove'].updatedInterface, 'AA')
+        self.assertTrue(all(result.success == 'True' for result in results))
+        self.assertTrue(self.pv_service.find_by_uuid.called)
+
+    def test_vm_network_state_is_read_once_for_all_actions(self):
+        # arrange
+        view = Mock()
+        self.pv_service.get_vm_network_view = Mock(return_value=view)
+        request = self._request(self._action('access', 'setVlan', mode='Access', vlan_ids=['10']),
+                                self._action('trunk', 'setVlan', mode='Trunk', vlan_ids=['20']),
+                                self._action('remove', 'removeVlan', interfaces=['AA']))
+
+        # act
+        self.orchestrator.connect_bulk(Mock(), request)
+
+        # assert
+        self.pv_service.get_vm_network_view.assert_called_once()
+        self.assertIs(self.disconnector.create_disconnect_mappings.call_args[0][4], view)
+        self.assertTrue(all(call[0][4] is view for call in self.connector.create_connect_requests.call_args_list))
+        self.assertIs(self.port_group_configurer.map_vnics_to_networks.call_args[0][4], view)
+
+    def test_vms_are_resolved_once_for_the_request(self):
+        # arrange
+        prefetched = Mock()
+        prefetched.vm = self.vm
+        self.pv_service.find_vms_by_uuids = Mock(return_value={'uuid': prefetched})
+        request = self._request(self._action('access', 'setVlan', vlan_ids=['10']),
+                                self._action('remove', 'removeVlan', interfaces=['AA']))
+
+        # act
+        self.orchestrator.connect_bulk(Mock(), request)
+
+        # assert
+        self.assertEqual(list(self.pv_service.find_vms_by_uuids.call_args[0][1]), ['uuid'])
+        self.assertFalse(self.pv_service.find_by_uuid.called)
+
+    def test_prefetched_network_view_is_used_for_the_actions(self):
+        # arrange
+        prefetched = Mock()
+        prefetched.vm = self.vm
+        self.pv_service.find_vms_by_uuids = Mock(return_value={'uuid': prefetched})
+        self.pv_service.get_vm_network_view = Mock()
+        request = self._request(self._action('access', 'setVlan', vlan_ids=['10']),
+                                self._action('remove', 'removeVlan', interfaces=['AA']))
+
+        # act
+        self.orchestrator.connect_bulk(Mock(), request)
+
+        # assert
+        self.assertFalse(self.pv_service.get_vm_network_view.called)
+        self.assertIs(self.disconnector.create_disconnect_mappings.call_args[0][4], prefetched.network_view)
+        self.assertIs(self.port_group_configurer.map_vnics_to_networks.call_args[0][4], prefetched.network_view)
+
+    def test_port_groups_of_all_vms_are_created_in_one_batch(self):
+        # arrange
+        port_groups = {'QS_dvSwitch_VLAN_10_Access': self.access_network}
+        self.connector.create_port_groups = Mock(return_value=port_groups)
+        request = self._request(self._action('vm1', 'setVlan', vm_uuid='uuid1', vlan_ids=['10']),
+                                self._action('vm2', 'setVlan', vm_uuid='uuid2', mode='Trunk', vlan_ids=['20']),
+                                self._action('vm3', 'removeVlan', vm_uuid='uuid3', interfaces=['AA']))
+
+        # act
+        self.orchestrator.connect_bulk(Mock(), request)
+
+        # assert
+        self.connector.create_port_groups.assert_called_once()
+        mappings = self.connector.create_port_groups.call_args[0][1]
+        self.assertEqual([mapping.vlan_id for mapping in mappings], ['10', '20'])
+        self.assertTrue(all(call[0][3] is port_groups
+                            for call in self.connector.create_connect_requests.call_args_list))
+
+    def test_removed_port_group_is_forgotten(self):
+        # arrange
+        self.port_group_configurer.update_vnic_by_mapping = Mock(
+            side_effect=vmodl.fault.ManagedObjectNotFound(obj=vim.dvs.DistributedVirtualPortgroup('dvportgroup-1')))
+        request = self._request(self._action('access', 'setVlan', vlan_ids=['10']))
+
+        # act
+        results = self.orchestrator.connect_bulk(Mock(), request)
+
+        # assert
+        self.assertEqual(results[0].success, 'False')
+        self.pv_service.invalidate_network_cache.assert_called_once()
+        self.connector.invalidate_port_groups.assert_called_once_with('dvSwitch', 'QualiSB')
+
+    def test_reconfigure_failure_fails_every_action_of_the_vm(self):
+        # arrange
+        self.port_group_configurer.update_vnic_by_mapping = Mock(side_effect=Exception('reconfigure failed'))
+        request = self._request(self._action('access', 'setVlan', vlan_ids=['10']),
+                                self._action('remove', 'removeVlan', interfaces=['AA']))
+
+        # act
+        results = self.orchestrator.connect_bulk(Mock(), request)
+
+        # assert
+        self.assertEqual(sorted([result.actionId for result in results]), ['access', 'remove'])
+        self.assertTrue(all(result.success == 'False' for result in results))
+        self.assertTrue(all('reconfigure failed' in result.errorMessage for result in results))
+
+    def test_failed_action_does_not_stop_the_other_actions(self):
+        # arrange
+        self.disconnector.create_disconnect_mappings = Mock(side_effect=KeyError('VNIC having MAC address'))
+        request = self._request(self._action('access', 'setVlan', vlan_ids=['10']),
+                                self._action('remove', 'removeVlan', interfaces=['CC']),
+                                self._action('no_interface', 'removeVlan'))
+
+        # act
+        results = self.orchestrator.connect_bulk(Mock(), request)
+
+        # assert
+        results_by_action = {result.actionId: result for result in results}
+        self.assertEqual(results_by_action['access'].success, 'True')
+        self.assertEqual(results_by_action['remove'].success, 'False')
+        self.assertEqual(results_by_action['no_interface'].success, 'False')
+        self.assertEqual(self.port_group_configurer.map_vnics_to_networks.call_args[0][3], [])
+        self.port_group_configurer.update_vnic_by_mapping.assert_called_once()
+
+    def test_each_vm_is_reconfigured_separately(self):
+        # arrange
+        request = self._request(self._action('vm1', 'removeVlan', vm_uuid='uuid1', interfaces=['AA']),
+                                self._action('vm2', 'removeVlan', vm_uuid='uuid2', interfaces=['AA']))
+
+        # act
+        results = self.orchestrator.connect_bulk(Mock(), request)
+
+        # assert
+        self.assertEqual(self.port_group_configurer.update_vnic_by_mapping.call_count, 2)
+        self.assertEqual(sorted([result.actionId for result in results]), ['vm1', 'vm2'])
+
+    def test_vm_not_found_fails_its_actions(self):
+        # arrange
+        self.pv_service.find_by_uuid = Mock(return_value=None)
+        request = self._request(self._action('access', 'setVlan', vlan_ids=['10']))
+
+        # act
+        results = self.orchestrator.connect_bulk(Mock(), request)
+
+        # assert
+        self.assertEqual(results[0].success, 'False')
+        self.assertIn('VM having UUID uuid not found', results[0].errorMessage)
+        self.assertFalse(self.port_group_configurer.update_vnic_by_mapping.called)
+
+    def test_unexpected_error_of_a_vm_fails_only_its_actions(self):
+        # arrange
+        request = self._request(self._action('vm1', 'setVlan', vm_uuid='uuid1', vlan_ids=['10']),
+                                self._action('vm2', 'setVlan', vm_uuid='uuid2', vlan_ids=['10']))
+        vm2 = Mock()
+        self.pv_service.find_by_uuid = Mock(side_effect=lambda si, vm_uuid: vm2 if vm_uuid == 'uuid2' else self.vm)
+
+        def plan_connections(plan, si, vm, *args):
+            if vm is vm2:
+                raise RuntimeError('unexpected')
+
+        self.orchestrator._plan_connections = Mock(side_effect=plan_connections)
+
+        # act
+        results = self.orchestrator.connect_bulk(Mock(), request)
+
+        # assert
+        self.assertEqual([result.actionId for result in results], ['vm2'])
+        self.assertEqual(results[0].success, 'False')
+        self.assertIn('unexpected', results[0].errorMessage)
+        self.port_group_configurer.update_vnic_by_mapping.assert_not_called()
+
+    def test_requests_share_the_executor(self):
+        # arrange
+        request = self._request(self._action('access', 'setVlan', vlan_ids=['10']))
+        self.orchestrator.connect_bulk(Mock(), request)
+        workers = list(self.orchestrator.executor._workers)
+
+        # act
+        self.orchestrator.connect_bulk(Mock(), request)
+
+        # assert
+        self.assertEqual(self.orchestrator.executor._workers, workers)
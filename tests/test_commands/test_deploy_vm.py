@@ -41,6 +41,18 @@ class TestDeployFromTemplateCommand(unittest.TestCase):
         self.assertTrue(result)
         self.assertTrue(deployer.deploy_from_template.called_with(si, deploy_params))
 
+    def test_deploy_templates_execute(self):
+        # arrange
+        deployer = Mock()
+        deployer.deploy_from_templates = Mock(return_value=iter(['res1', 'res2']))
+        deploy_command = DeployCommand(deployer)
+
+        # act
+        result = deploy_command.execute_deploy_from_templates(Mock(), [Mock(), Mock()])
+
+        # assert
+        self.assertEqual(result, ['res1', 'res2'])
+
     def test_deploy_image_execute(self):
         deployer = Mock()
         si = Mock()
@@ -39,3 +39,98 @@ class test_destroyVirtualMachineCommand(unittest.TestCase):
         self.assertTrue(disconnector.remove_interfaces_from_vm.called_with(si, vm))
         self.assertTrue(resource_remover.remove_resource.called_with(resource_name))
         self.assertTrue(pv_service.find_by_uuid.called_with(si, uuid))
+
+
+class TestDestroyVirtualMachinesCommand(unittest.TestCase):
+    def setUp(self):
+        self.pv_service = Mock()
+        self.resource_remover = Mock()
+        self.disconnector = Mock()
+        self.task_waiter = Mock()
+        self.task_waiter.wait_all = Mock(side_effect=lambda tasks, action_name: [self._outcome(True)
+                                                                                for task in tasks])
+        self.si = Mock()
+        self.session = Mock()
+
+    @staticmethod
+    def _outcome(succeeded, error=None):
+        outcome = Mock()
+        outcome.succeeded = succeeded
+        outcome.error = error
+        return outcome
+
+    @staticmethod
+    def _prefetched(power_state):
+        prefetched = Mock()
+        prefetched.power_state = power_state
+        return prefetched
+
+    def test_destroy_vms_powers_off_and_destroys_together(self):
+        # arrange
+        vm1 = self._prefetched('poweredOn')
+        vm2 = self._prefetched('poweredOff')
+        self.pv_service.find_vms_by_uuids = Mock(return_value={'uuid1': vm1, 'uuid2': vm2})
+        destroyer = DestroyVirtualMachineCommand(self.pv_service, self.resource_remover, self.disconnector,
+                                                 self.task_waiter)
+
+        # act
+        res = destroyer.destroy_vms(self.si, self.session, [('uuid1', 'app1'), ('uuid2', 'app2')])
+
+        # assert
+        self.assertTrue(all(result.success for result in res))
+        self.assertTrue(vm1.vm.PowerOffVM_Task.called)
+        self.assertFalse(vm2.vm.PowerOffVM_Task.called)
+        self.assertEqual([len(call[0][0]) for call in self.task_waiter.wait_all.call_args_list], [1, 2])
+        self.assertFalse(self.disconnector.disconnect_all.called)
+        self.resource_remover.remove_resources.assert_called_once_with(session=self.session,
+                                                                       resource_full_names=['app1', 'app2'])
+
+    def test_destroy_vms_keeps_resources_of_failed_vms(self):
+        # arrange
+        vm1 = self._prefetched('poweredOff')
+        vm2 = self._prefetched('poweredOff')
+        self.pv_service.find_vms_by_uuids = Mock(return_value={'uuid1': vm1, 'uuid2': vm2})
+        self.task_waiter.wait_all = Mock(return_value=[self._outcome(True), self._outcome(False, 'in use')])
+        destroyer = DestroyVirtualMachineCommand(self.pv_service, self.resource_remover, self.disconnector,
+                                                 self.task_waiter)
+
+        # act
+        res = destroyer.destroy_vms(self.si, self.session, [('uuid1', 'app1'), ('uuid2', 'app2'), ('uuid3', 'app3')])
+
+        # assert
+        self.assertEqual([result.success for result in res], [True, False, False])
+        self.assertEqual(res[1].error_message, 'in use')
+        self.assertIn('uuid3', res[2].error_message)
+        self.resource_remover.remove_resources.assert_called_once_with(session=self.session,
+                                                                       resource_full_names=['app1'])
+
+    def test_destroy_vms_reports_resources_that_were_not_deleted(self):
+        # arrange
+        self.pv_service.find_vms_by_uuids = Mock(return_value={'uuid1': self._prefetched('poweredOff')})
+        self.resource_remover.remove_resources = Mock(side_effect=Exception('CloudShell is down'))
+        destroyer = DestroyVirtualMachineCommand(self.pv_service, self.resource_remover, self.disconnector,
+                                                 self.task_waiter)
+
+        # act
+        res = destroyer.destroy_vms(self.si, self.session, [('uuid1', 'app1'), ('uuid2', 'app2')])
+
+        # assert
+        self.assertEqual([result.success for result in res], [True, False])
+        self.assertIn('resource was not deleted', res[0].error_message)
+        self.assertIn('CloudShell is down', res[0].error_message)
+        self.assertIn('uuid2', res[1].error_message)
+
+    def test_destroy_vms_is_throttled(self):
+        # arrange
+        uuids = ['uuid{0}'.format(i) for i in range(5)]
+        self.pv_service.find_vms_by_uuids = Mock(return_value={uuid: self._prefetched('poweredOff')
+                                                               for uuid in uuids})
+        destroyer = DestroyVirtualMachineCommand(self.pv_service, self.resource_remover, self.disconnector,
+                                                 self.task_waiter, max_concurrent_tasks=2)
+
+        # act
+        res = destroyer.destroy_vms(self.si, self.session, [(uuid, uuid) for uuid in uuids])
+
+        # assert
+        self.assertEqual(len(res), 5)
+        self.assertEqual([len(call[0][0]) for call in self.task_waiter.wait_all.call_args_list], [2, 2, 1])
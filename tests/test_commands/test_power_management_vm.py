@@ -2,6 +2,7 @@ from unittest import TestCase
 from mock import Mock, MagicMock
 from pyVmomi import vim
 from common.logger.service import LoggingService
+from common.vcenter.task_waiter import TaskTimeoutException
 from vCenterShell.commands.power_manager_vm import VirtualMachinePowerManagementCommand
 
 
@@ -63,3 +64,207 @@ class TestVirtualMachinePowerManagementCommand(TestCase):
         self.assertTrue(power_manager._get_vm.called_with(si, vm_uuid))
         self.assertTrue(synchronous_task_waiter.wait_for_task.called_with(task))
         self.assertTrue(vm.PowerOff.called)
+
+
+class TestPowerCycle(TestCase):
+    def setUp(self):
+        self.si = Mock()
+        self.session = Mock()
+        self.vm = Mock(spec=vim.VirtualMachine)
+        self.vm.summary.runtime.powerState = 'poweredOn'
+        self.pv_service = Mock()
+        self.pv_service.find_by_uuid = Mock(return_value=self.vm)
+        self.task_waiter = Mock()
+        self.task_waiter.wait_for_property = Mock(return_value='poweredOn')
+        self.power_manager = VirtualMachinePowerManagementCommand(self.pv_service, self.task_waiter)
+
+    def test_power_cycle_resets_a_powered_on_vm(self):
+        # act
+        res = self.power_manager.power_cycle(self.si, self.session, 'uuid', 'app')
+
+        # assert
+        self.assertEqual(res, 'poweredOn')
+        self.task_waiter.wait_for_task.assert_called_once_with(task=self.vm.ResetVM_Task.return_value,
+                                                               action_name='Reset')
+        self.assertFalse(self.vm.PowerOff.called)
+        self.assertFalse(self.vm.PowerOn.called)
+        self.session.SetResourceLiveStatus.assert_called_once_with('app', 'Online', 'Active')
+
+    def test_power_cycle_waits_for_power_states_between_off_and_on(self):
+        # arrange
+        def wait_for_property(vm, property_path, is_ready, action_name, timeout=None):
+            state = 'poweredOff' if is_ready('poweredOff') else 'poweredOn'
+            self.vm.summary.runtime.powerState = state
+            return state
+        self.task_waiter.wait_for_property = Mock(side_effect=wait_for_property)
+
+        # act
+        self.power_manager.power_cycle(self.si, self.session, 'uuid', None, use_reset=False,
+                                       wait_for_heartbeat=True)
+
+        # assert
+        self.assertTrue(self.vm.PowerOff.called)
+        self.assertTrue(self.vm.PowerOn.called)
+        self.assertFalse(self.vm.ResetVM_Task.called)
+        waited = [call[0][1] for call in self.task_waiter.wait_for_property.call_args_list]
+        self.assertEqual(waited, ['runtime.powerState', 'runtime.powerState', 'guestHeartbeatStatus'])
+        self.assertFalse(self.session.SetResourceLiveStatus.called)
+
+    def test_power_cycle_fails_when_the_heartbeat_times_out(self):
+        # arrange
+        def wait_for_property(vm, property_path, is_ready, action_name, timeout=None):
+            if property_path == 'guestHeartbeatStatus':
+                raise TaskTimeoutException('timed out')
+            return 'poweredOn'
+        self.task_waiter.wait_for_property = Mock(side_effect=wait_for_property)
+
+        # act
+        with self.assertRaises(Exception) as context:
+            self.power_manager.power_cycle(self.si, self.session, 'uuid', 'app', wait_for_heartbeat=True,
+                                           heartbeat_timeout=30)
+
+        # assert
+        self.assertIn('heartbeat', str(context.exception))
+        self.assertEqual(self.task_waiter.wait_for_property.call_args[1]['timeout'], 30)
+        self.assertFalse(self.session.SetResourceLiveStatus.called)
+
+    def test_power_cycle_powers_on_a_powered_off_vm(self):
+        # arrange
+        self.vm.summary.runtime.powerState = 'poweredOff'
+
+        # act
+        self.power_manager.power_cycle(self.si, self.session, 'uuid', 'app')
+
+        # assert
+        self.assertTrue(self.vm.PowerOn.called)
+        self.assertFalse(self.vm.ResetVM_Task.called)
+        self.assertFalse(self.vm.PowerOff.called)
+
+
+class TestBulkPowerManagement(TestCase):
+    def setUp(self):
+        self.si = Mock()
+        self.session = Mock()
+        self.vm1 = Mock(spec=vim.VirtualMachine)
+        self.vm2 = Mock(spec=vim.VirtualMachine)
+        self.pv_service = Mock()
+        self.pv_service.find_vms_by_uuids = Mock(return_value={'uuid1': self._prefetched(self.vm1, 'poweredOff'),
+                                                               'uuid2': self._prefetched(self.vm2, 'poweredOn')})
+        self.datacenter = Mock(spec=vim.Datacenter)
+        self.pv_service.get_vms_datacenters = Mock(return_value={self.vm1: self.datacenter,
+                                                                 self.vm2: self.datacenter})
+        self.task_waiter = Mock()
+        self.task_waiter.wait_all = Mock(side_effect=lambda tasks, action_name: [Mock(succeeded=True)
+                                                                                for task in tasks])
+        self.power_states = dict()
+        self.pv_service.retrieve_object_properties = Mock(side_effect=lambda content, vms, properties: [
+            (vm, {'runtime.powerState': self.power_states.get(vm, 'poweredOn')}) for vm in vms])
+        self.power_manager = VirtualMachinePowerManagementCommand(self.pv_service, self.task_waiter)
+        self.vms = [('uuid1', 'app1'), ('uuid2', 'app2'), ('uuid3', 'app3')]
+
+    @staticmethod
+    def _prefetched(vm, power_state):
+        prefetched = Mock()
+        prefetched.vm = vm
+        prefetched.power_state = power_state
+        return prefetched
+
+    def test_power_on_vms_uses_one_multi_vm_task_per_datacenter(self):
+        # arrange
+        drs_task = Mock()
+        self.task_waiter.wait_for_task = Mock(return_value=Mock(attempted=[Mock(vm=self.vm1, task=drs_task)],
+                                                                notAttempted=[]))
+
+        # act
+        results = self.power_manager.power_on_vms(self.si, self.session, self.vms)
+
+        # assert
+        self.datacenter.PowerOnMultiVM_Task.assert_called_once_with([self.vm1])
+        self.assertEqual(self.task_waiter.wait_all.call_args[0][0], [drs_task])
+        self.assertFalse(self.vm1.PowerOn.called)
+        self.assertEqual([result.success for result in results], [True, True, False])
+        self.assertEqual(results[1].message, 'already powered on')
+        self.assertIn('uuid3', results[2].message)
+        self.assertEqual(self.session.SetResourceLiveStatus.call_count, 2)
+
+    def test_power_on_vms_reports_the_vms_not_attempted(self):
+        # arrange
+        self.pv_service.find_vms_by_uuids.return_value['uuid2'].power_state = 'poweredOff'
+        fault = Mock(msg='not enough resources')
+        self.task_waiter.wait_for_task = Mock(return_value=Mock(attempted=[Mock(vm=self.vm1, task=None)],
+                                                                notAttempted=[Mock(vm=self.vm2, fault=fault)]))
+
+        # act
+        results = self.power_manager.power_on_vms(self.si, self.session, self.vms[:2])
+
+        # assert
+        self.assertTrue(results[0].success)
+        self.assertFalse(results[1].success)
+        self.assertEqual(results[1].message, 'not enough resources')
+        self.session.SetResourceLiveStatus.assert_called_once_with('app1', 'Online', 'Active')
+
+    def test_power_on_vms_powers_on_the_vms_left_without_a_task(self):
+        # arrange
+        self.pv_service.find_vms_by_uuids.return_value['uuid2'].power_state = 'poweredOff'
+        self.power_states[self.vm1] = 'poweredOff'
+        self.power_states[self.vm2] = 'poweredOff'
+        self.task_waiter.wait_for_task = Mock(return_value=Mock(attempted=[Mock(vm=self.vm1, task=None)],
+                                                                notAttempted=[]))
+
+        def power_on():
+            self.power_states[self.vm1] = 'poweredOn'
+        self.vm1.PowerOn = Mock(side_effect=power_on)
+
+        # act
+        results = self.power_manager.power_on_vms(self.si, self.session, self.vms[:2])
+
+        # assert
+        self.assertTrue(self.vm1.PowerOn.called)
+        self.assertTrue(self.vm2.PowerOn.called)
+        self.assertTrue(results[0].success)
+        self.assertFalse(results[1].success)
+        self.assertEqual(results[1].message, 'vm is poweredOff after the power on')
+        self.session.SetResourceLiveStatus.assert_called_once_with('app1', 'Online', 'Active')
+
+    def test_power_on_vms_without_datacenter_starts_a_task_per_vm(self):
+        # arrange
+        self.pv_service.get_vms_datacenters = Mock(return_value={})
+
+        # act
+        results = self.power_manager.power_on_vms(self.si, self.session, self.vms[:1])
+
+        # assert
+        self.assertTrue(self.vm1.PowerOn.called)
+        self.assertEqual(self.task_waiter.wait_all.call_args[0][0], [self.vm1.PowerOn.return_value])
+        self.assertTrue(results[0].success)
+
+    def test_power_off_vms_tracks_all_tasks_together(self):
+        # arrange
+        self.pv_service.find_vms_by_uuids.return_value['uuid1'].power_state = 'poweredOn'
+        self.task_waiter.wait_all = Mock(return_value=[Mock(succeeded=True),
+                                                       Mock(succeeded=False, error=Exception('failed'))])
+
+        # act
+        results = self.power_manager.power_off_vms(self.si, self.session, self.vms[:2])
+
+        # assert
+        self.task_waiter.wait_all.assert_called_once_with([self.vm1.PowerOff.return_value,
+                                                           self.vm2.PowerOff.return_value],
+                                                          action_name='Power Off')
+        self.assertTrue(results[0].success)
+        self.assertFalse(results[1].success)
+        self.assertEqual(results[1].message, 'failed')
+        self.session.SetResourceLiveStatus.assert_called_once_with('app1', 'Offline', 'Powered Off')
+
+    def test_power_cycle_vms_powers_on_the_vms_that_powered_off(self):
+        # arrange
+        self.task_waiter.wait_for_task = Mock(return_value=Mock(attempted=[], notAttempted=[]))
+
+        # act
+        results = self.power_manager.power_cycle_vms(self.si, self.session, self.vms[:2])
+
+        # assert
+        self.assertTrue(self.vm2.PowerOff.called)
+        self.assertFalse(self.vm1.PowerOff.called)
+        self.datacenter.PowerOnMultiVM_Task.assert_called_once_with([self.vm1, self.vm2])
+        self.assertTrue(all(result.success for result in results))
@@ -3,6 +3,7 @@ from cloudshell.api.cloudshell_api import VmDetails, ResourceInfo, VmCustomParam
 from mock import Mock, create_autospec
 from common.logger.service import LoggingService
 from common.model_factory import ResourceModelParser
+from common.vcenter.task_waiter import TaskTimeoutException
 from vCenterShell.commands.refresh_ip import RefreshIpCommand
 
 
@@ -137,3 +138,170 @@ class TestRefreshIpCommand(TestCase):
 
         # Assert
         self.assertTrue(session.UpdateResourceAddress.called_with('machine1', '192.168.1.1'))
+
+
+class TestRefreshIpWatcher(TestCase):
+    def setUp(self):
+        self.vm = Mock()
+        self.vm.guest.toolsStatus = 'toolsOk'
+        self.pyvmomi_service = Mock()
+        self.pyvmomi_service.find_by_uuid = Mock(return_value=self.vm)
+        self.task_waiter = Mock()
+        self.session = Mock()
+        self.session.GetResourceDetails = Mock(return_value=Mock(VmDetails=[]))
+        self.refresh_ip_command = RefreshIpCommand(self.pyvmomi_service, ResourceModelParser(), self.task_waiter)
+
+    @staticmethod
+    def _nic(network, *ips):
+        nic = Mock()
+        nic.network = network
+        nic.ipAddress = list(ips)
+        return nic
+
+    def _changes(self, *changes):
+        """
+        the waiter calls is_ready with every change until it returns True
+        """
+        def wait_for_properties(vm, property_paths, is_ready, action_name, timeout):
+            for values in changes:
+                if is_ready(values):
+                    return values
+            raise TaskTimeoutException('timeout')
+        self.task_waiter.wait_for_properties = Mock(side_effect=wait_for_properties)
+
+    def test_refresh_ip_returns_on_the_first_matching_change(self):
+        # arrange
+        self._changes({'guest.ipAddress': None, 'guest.net': None},
+                      {'guest.ipAddress': 'fe80::1', 'guest.net': [self._nic('A Network', 'fe80::1')]},
+                      {'guest.ipAddress': '192.168.1.1', 'guest.net': [self._nic('A Network', '192.168.1.1')]},
+                      {'guest.ipAddress': '10.0.0.1', 'guest.net': []})
+
+        # act
+        self.refresh_ip_command.refresh_ip(Mock(), self.session, 'uuid', 'machine1', 'default_network')
+
+        # assert
+        self.session.UpdateResourceAddress.assert_called_once_with('machine1', '192.168.1.1')
+        self.assertEqual(self.task_waiter.wait_for_properties.call_args[0][1], ['guest.ipAddress', 'guest.net'])
+
+    def test_refresh_ip_skips_the_default_network(self):
+        # arrange
+        self._changes({'guest.ipAddress': None,
+                       'guest.net': [self._nic('default_network', '10.0.0.1'), self._nic('A Network', '10.0.0.2')]})
+
+        # act
+        self.refresh_ip_command.refresh_ip(Mock(), self.session, 'uuid', 'machine1', 'default_network')
+
+        # assert
+        self.session.UpdateResourceAddress.assert_called_once_with('machine1', '10.0.0.2')
+
+    def test_refresh_ip_raises_when_no_address_matches(self):
+        # arrange
+        self._changes({'guest.ipAddress': None, 'guest.net': None})
+
+        # act & assert
+        self.assertRaises(ValueError, self.refresh_ip_command.refresh_ip, Mock(), self.session, 'uuid', 'machine1',
+                          'default_network')
+        self.assertFalse(self.session.UpdateResourceAddress.called)
+
+
+class TestRefreshIps(TestCase):
+    def setUp(self):
+        self.vm1 = Mock()
+        self.vm2 = Mock()
+        self.pyvmomi_service = Mock()
+        self.pyvmomi_service.find_vms_by_uuids = Mock(return_value={'uuid1': Mock(vm=self.vm1),
+                                                                    'uuid2': Mock(vm=self.vm2)})
+        self.task_waiter = Mock()
+        self.session = Mock()
+        self.session.GetResourceDetails = Mock(return_value=Mock(VmDetails=[]))
+        self.refresh_ip_command = RefreshIpCommand(self.pyvmomi_service, ResourceModelParser(), self.task_waiter)
+        self.vms = [('uuid1', 'machine1'), ('uuid2', 'machine2'), ('uuid3', 'machine3')]
+
+    def _changes(self, *changes):
+        """
+        the waiter yields the vms in the order is_ready accepts their changes
+        """
+        def as_ready(vms, property_paths, is_ready, action_name, timeout):
+            for vm, values in changes:
+                if is_ready(vm, values):
+                    yield vm, values
+            raise TaskTimeoutException('timeout')
+        self.task_waiter.as_ready = Mock(side_effect=as_ready)
+
+    @staticmethod
+    def _values(ip, tools_status='toolsOk'):
+        return {'guest.ipAddress': ip, 'guest.net': [], 'guest.toolsStatus': tools_status}
+
+    def test_refresh_ips_updates_every_address_as_soon_as_it_is_known(self):
+        # arrange
+        self._changes((self.vm2, self._values('10.0.0.2')),
+                      (self.vm1, self._values(None)),
+                      (self.vm1, self._values('10.0.0.1')))
+
+        # act
+        results = self.refresh_ip_command.refresh_ips(Mock(), self.session, self.vms, 'default_network')
+
+        # assert
+        self.assertEqual(self.session.UpdateResourceAddress.call_args_list[0][0], ('machine2', '10.0.0.2'))
+        self.assertEqual(self.session.UpdateResourceAddress.call_args_list[1][0], ('machine1', '10.0.0.1'))
+        self.assertEqual([result.ip for result in results], ['10.0.0.1', '10.0.0.2', None])
+        self.assertFalse(results[2].success)
+        self.assertIn('not found', results[2].error_message)
+        self.assertEqual(self.session.GetResourceDetails.call_count, 3)
+        self.assertEqual(self.task_waiter.as_ready.call_count, 1)
+
+    def test_refresh_ips_fails_vms_without_tools_and_vms_that_timed_out(self):
+        # arrange
+        self._changes((self.vm1, self._values(None, 'toolsNotInstalled')))
+
+        # act
+        results = self.refresh_ip_command.refresh_ips(Mock(), self.session, self.vms[:2], 'default_network')
+
+        # assert
+        self.assertIn('not installed', results[0].error_message)
+        self.assertIn('could not be obtained', results[1].error_message)
+        self.assertFalse(self.session.UpdateResourceAddress.called)
+
+
+class TestIpMatchers(TestCase):
+    def setUp(self):
+        self.session = Mock()
+        self.session.GetResourceDetails = Mock(side_effect=self._resource_details)
+        self.refresh_ip_command = RefreshIpCommand(Mock(), ResourceModelParser(), Mock())
+
+    @staticmethod
+    def _resource_details(resource_name):
+        custom_param = Mock()
+        custom_param.Name = 'ip_regex'
+        custom_param.Value = '192\.168\..*'
+        vm_details = Mock(spec=['VmCustomParams'])
+        vm_details.VmCustomParams = [custom_param]
+        return Mock(VmDetails=[vm_details])
+
+    def test_resource_details_are_read_once_per_resource(self):
+        # act
+        self.refresh_ip_command._get_ip_match_function(self.session, 'uuid1', 'machine1')
+        self.refresh_ip_command._get_ip_match_function(self.session, 'uuid1', 'machine1')
+        self.refresh_ip_command._get_ip_match_function(self.session, 'uuid2', 'machine2')
+
+        # assert
+        self.assertEqual([call[0][0] for call in self.session.GetResourceDetails.call_args_list],
+                         ['machine1', 'machine2'])
+
+    def test_resources_with_the_same_regex_share_one_matcher(self):
+        # act
+        first = self.refresh_ip_command._get_ip_match_function(self.session, 'uuid1', 'machine1')
+        second = self.refresh_ip_command._get_ip_match_function(self.session, 'uuid2', 'machine2')
+
+        # assert
+        self.assertIs(first, second)
+
+    def test_matcher_accepts_v4_addresses_that_match_the_regex(self):
+        # act
+        match = self.refresh_ip_command._get_ip_match_function(self.session, 'uuid1', 'machine1')
+
+        # assert
+        self.assertTrue(match('192.168.1.1'))
+        self.assertFalse(match('10.0.0.1'))
+        self.assertFalse(match('192.168.1.1.1'))
+        self.assertFalse(match('fe80::192.168.1.1'))
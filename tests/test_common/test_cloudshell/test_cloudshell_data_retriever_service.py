@@ -27,6 +27,20 @@ class test_cloudshellDataRetrieverService(unittest.TestCase):
         self.assertEquals(result.vCenter_resource_name, "vCenter")
         self.assertEqual(result.vm_folder, "Alex")
         self.assertEqual(result.template_name, "test")
+        self.assertFalse(result.linked_clone)
+        self.assertIsNone(result.snapshot_name)
+
+    def test_getVCenterTemplateAttributeData_linked_clone(self):
+        # Arrange
+        attributes = {"vCenter Template": "vCenter/Alex/test", "Linked Clone": "True", "Snapshot Name": "base"}
+        resource_attributes = Mock(attributes=attributes)
+
+        # Act
+        result = self.csRetrieverService.getVCenterTemplateAttributeData(resource_attributes)
+
+        # Assert
+        self.assertTrue(result.linked_clone)
+        self.assertEqual(result.snapshot_name, "base")
 
     def test_getPowerStateAttributeData_Value_Is_True(self):
         # Arrange
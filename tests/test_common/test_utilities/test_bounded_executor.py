@@ -0,0 +1,122 @@
+from threading import Lock, Event, Thread
+from unittest import TestCase
+
+from common.utilites.bounded_executor import BoundedExecutor, KeyedSemaphore
+
+
+class TestBoundedExecutor(TestCase):
+    def test_imap_unordered_returns_results_and_errors(self):
+        # arrange
+        executor = BoundedExecutor(max_workers=2)
+
+        def work(value):
+            if value == 2:
+                raise ValueError('bad value')
+            return value * 10
+
+        # act
+        results = list(executor.imap_unordered(work, [(1,), (2,), (3,)]))
+
+        # assert
+        by_args = {args: (result, error) for args, result, error in results}
+        self.assertEqual(by_args[(1,)], (10, None))
+        self.assertEqual(by_args[(3,)], (30, None))
+        self.assertIsInstance(by_args[(2,)][1], ValueError)
+
+    def test_calls_do_not_exceed_max_workers(self):
+        # arrange
+        executor = BoundedExecutor(max_workers=2, max_pending=3)
+        lock = Lock()
+        running = [0]
+        peak = [0]
+
+        def work(value):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            Event().wait(0.01)
+            with lock:
+                running[0] -= 1
+            return value
+
+        # act
+        results = list(executor.imap_unordered(work, [(i,) for i in range(10)]))
+
+        # assert
+        self.assertEqual(sorted(result for args, result, error in results), range(10))
+        self.assertLessEqual(peak[0], 2)
+
+    def test_workers_are_shared_by_requests(self):
+        # arrange
+        executor = BoundedExecutor(max_workers=2)
+        list(executor.imap_unordered(lambda: 1, [()]))
+        workers = list(executor._workers)
+
+        # act
+        list(executor.imap_unordered(lambda: 2, [()]))
+
+        # assert
+        self.assertEqual(executor._workers, workers)
+
+    def test_shutdown_stops_workers_and_refuses_calls(self):
+        # arrange
+        executor = BoundedExecutor(max_workers=2)
+        list(executor.imap_unordered(lambda: 1, [()]))
+        workers = list(executor._workers)
+
+        # act
+        executor.shutdown()
+
+        # assert
+        self.assertFalse(any(worker.is_alive() for worker in workers))
+        self.assertRaises(RuntimeError, executor.submit, lambda: 1)
+
+
+class TestKeyedSemaphore(TestCase):
+    def test_same_key_is_limited(self):
+        # arrange
+        semaphore = KeyedSemaphore(1)
+        entered = Event()
+
+        def hold():
+            with semaphore.hold('host-1'):
+                entered.set()
+
+        # act
+        with semaphore.hold('host-1'):
+            thread = Thread(target=hold)
+            thread.start()
+            blocked = not entered.wait(0.1)
+        thread.join(5)
+
+        # assert
+        self.assertTrue(blocked)
+        self.assertTrue(entered.is_set())
+
+    def test_other_keys_and_none_are_not_limited(self):
+        # arrange
+        semaphore = KeyedSemaphore(1)
+
+        # act & assert
+        with semaphore.hold('host-1'):
+            with semaphore.hold('host-2'):
+                with semaphore.hold(None):
+                    with semaphore.hold(None):
+                        pass
+
+    def test_keys_are_dropped_when_released(self):
+        # arrange
+        semaphore = KeyedSemaphore(1)
+
+        # act
+        with semaphore.hold('host-1'):
+            held = len(semaphore)
+        try:
+            with semaphore.hold('host-2'):
+                raise ValueError('failed')
+        except ValueError:
+            pass
+
+        # assert
+        self.assertEqual(held, 1)
+        self.assertEqual(len(semaphore), 0)
@@ -1,6 +1,7 @@
 from unittest import TestCase
 
 from mock import Mock
+from pyVmomi import vim, vmodl
 from common.wrappers.command_wrapper import CommandWrapper
 
 
@@ -75,4 +76,57 @@ class TestCommandWrapper(TestCase):
         wrapper = CommandWrapper(self.logger, self.pv_service)
 
         # assert
-        self.assertRaises(Exception, wrapper.execute_command, command)
\ No newline at end of file
+        self.assertRaises(Exception, wrapper.execute_command, command)
+
+    def test_execute_command_with_session_pool_does_not_disconnect(self):
+        # arrange
+        def fake_command(si):
+            return si
+
+        session_pool = Mock()
+        session_pool.get_session = Mock(return_value=self.si)
+        wrapper = CommandWrapper(self.logger, self.pv_service, session_pool)
+
+        # act
+        res = wrapper.execute_command_with_connection(self.connection_detail, fake_command)
+
+        # assert
+        self.assertEqual(res, self.si)
+        self.assertFalse(self.pv_service.connect.called)
+        self.assertFalse(self.pv_service.disconnect.called)
+        session_pool.release_session.assert_called_once_with(self.connection_detail, self.si)
+
+    def test_execute_command_with_session_pool_not_authenticated(self):
+        # arrange
+        def fake_command(si):
+            raise vim.fault.NotAuthenticated()
+
+        session_pool = Mock()
+        session_pool.get_session = Mock(return_value=self.si)
+        wrapper = CommandWrapper(self.logger, self.pv_service, session_pool)
+
+        # act
+        self.assertRaises(vim.fault.NotAuthenticated,
+                          wrapper.execute_command_with_connection, self.connection_detail, fake_command)
+
+        # assert
+        session_pool.invalidate.assert_called_once_with(self.connection_detail, self.si)
+        session_pool.release_session.assert_called_once_with(self.connection_detail, self.si)
+
+    def test_execute_command_managed_object_not_found_forgets_resolved_networks(self):
+        # arrange
+        def fake_command(si):
+            raise vmodl.fault.ManagedObjectNotFound()
+
+        session_pool = Mock()
+        session_pool.get_session = Mock(return_value=self.si)
+        wrapper = CommandWrapper(self.logger, self.pv_service, session_pool)
+
+        # act
+        self.assertRaises(vmodl.fault.ManagedObjectNotFound,
+                          wrapper.execute_command_with_connection, self.connection_detail, fake_command)
+
+        # assert
+        self.pv_service.invalidate_network_cache.assert_called_once_with(self.si)
+        self.pv_service.invalidate_placement_cache.assert_called_once_with(self.si)
+        session_pool.release_session.assert_called_once_with(self.connection_detail, self.si)
@@ -0,0 +1,49 @@
+from unittest import TestCase
+
+from common.utilites.lru_cache import LruCache
+
+
+class TestLruCache(TestCase):
+    def test_value_is_created_once(self):
+        # arrange
+        cache = LruCache()
+        calls = []
+
+        def create(key):
+            calls.append(key)
+            return key.upper()
+
+        # act
+        first = cache.get_or_create('a', create)
+        second = cache.get_or_create('a', create)
+
+        # assert
+        self.assertEqual(first, 'A')
+        self.assertEqual(second, 'A')
+        self.assertEqual(calls, ['a'])
+
+    def test_least_recently_used_is_dropped(self):
+        # arrange
+        cache = LruCache(max_size=2)
+        cache.get_or_create('a', str.upper)
+        cache.get_or_create('b', str.upper)
+        cache.get_or_create('a', str.upper)
+
+        # act
+        cache.get_or_create('c', str.upper)
+
+        # assert
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_errors_are_not_cached(self):
+        # arrange
+        cache = LruCache()
+
+        def fail(key):
+            raise ValueError(key)
+
+        # act & assert
+        self.assertRaises(ValueError, cache.get_or_create, 'a', fail)
+        self.assertNotIn('a', cache)
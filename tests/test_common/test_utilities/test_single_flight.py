@@ -0,0 +1,75 @@
+from threading import Thread, Event
+from unittest import TestCase
+
+from common.utilites.single_flight import SingleFlight
+
+
+class TestSingleFlight(TestCase):
+    def _run_in_thread(self, target):
+        results = []
+        thread = Thread(target=lambda: results.append(target()))
+        thread.start()
+        return thread, results
+
+    def test_same_key_shares_one_call(self):
+        # arrange
+        single_flight = SingleFlight()
+        started = Event()
+        release = Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'network'
+
+        first, first_results = self._run_in_thread(lambda: single_flight.do('key', work))
+        started.wait(5)
+        second, second_results = self._run_in_thread(lambda: single_flight.do('key', work))
+
+        # act
+        release.set()
+        first.join(5)
+        second.join(5)
+
+        # assert
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(first_results, ['network'])
+        self.assertEqual(second_results, ['network'])
+        self.assertFalse(single_flight.in_flight('key'))
+
+    def test_different_keys_run_in_parallel(self):
+        # arrange
+        single_flight = SingleFlight()
+        first_started = Event()
+        release = Event()
+
+        def slow():
+            first_started.set()
+            release.wait(5)
+            return 'slow'
+
+        thread, results = self._run_in_thread(lambda: single_flight.do('key1', slow))
+        first_started.wait(5)
+
+        # act
+        res = single_flight.do('key2', lambda: 'fast')
+
+        # assert
+        self.assertEqual(res, 'fast')
+        self.assertTrue(single_flight.in_flight('key1'))
+        release.set()
+        thread.join(5)
+        self.assertEqual(results, ['slow'])
+
+    def test_error_is_raised_and_key_is_released(self):
+        # arrange
+        single_flight = SingleFlight()
+
+        def fail():
+            raise ValueError('failed')
+
+        # act & assert
+        self.assertRaises(ValueError, single_flight.do, 'key', fail)
+        self.assertEqual(single_flight.do('key', lambda: 'retried'), 'retried')
@@ -0,0 +1,76 @@
+from unittest import TestCase
+
+from mock import Mock
+from pyVmomi import vim
+
+from common.vcenter.inventory import InventorySnapshot
+
+
+class TestInventorySnapshot(TestCase):
+    def setUp(self):
+        self.root = vim.Folder('group-d1')
+        self.dc = vim.Datacenter('datacenter-1')
+        self.vm_folder = vim.Folder('group-v1')
+        self.network_folder = vim.Folder('group-n1')
+        self.sub_folder = vim.Folder('group-v2')
+        self.vm = vim.VirtualMachine('vm-1')
+        self.network = vim.Network('network-1')
+        objects = [
+            (self.root, {'name': 'Datacenters'}),
+            (self.dc, {'name': 'QualiSB', 'parent': self.root}),
+            (self.vm_folder, {'name': 'vm', 'parent': self.dc}),
+            (self.network_folder, {'name': 'network', 'parent': self.dc}),
+            (self.sub_folder, {'name': 'Raz', 'parent': self.vm_folder}),
+            (self.vm, {'name': 'template', 'parent': self.sub_folder,
+                       'config.uuid': 'bios-uuid', 'config.instanceUuid': 'instance-uuid'}),
+            (self.network, {'name': 'VM Network', 'parent': self.network_folder})
+        ]
+        self.pv_service = Mock()
+        self.pv_service.retrieve_properties = Mock(return_value=objects)
+        self.snapshot = InventorySnapshot().load(self.pv_service, Mock())
+
+    def test_load_retrieves_inventory_once(self):
+        self.assertEqual(self.pv_service.retrieve_properties.call_count, 1)
+        self.assertEqual(len(self.snapshot), 7)
+
+    def test_find_by_path_skips_hidden_folders(self):
+        self.assertEqual(self.snapshot.find_by_path('QualiSB/Raz', 'template'), self.vm)
+        self.assertEqual(self.snapshot.find_by_path('/QualiSB/', 'VM Network', vim.Network), self.network)
+        self.assertEqual(self.snapshot.find_by_path('', 'QualiSB', vim.Datacenter), self.dc)
+
+    def test_find_by_path_filters_type(self):
+        self.assertIsNone(self.snapshot.find_by_path('QualiSB/Raz', 'template', vim.Network))
+
+    def test_find_by_name(self):
+        self.assertEqual(self.snapshot.find_by_name('VM Network'), self.network)
+        self.assertIsNone(self.snapshot.find_by_name('not there'))
+
+    def test_find_by_uuid(self):
+        self.assertEqual(self.snapshot.find_by_uuid('bios-uuid'), self.vm)
+        self.assertEqual(self.snapshot.find_by_uuid('instance-uuid'), self.vm)
+        self.assertIsNone(self.snapshot.find_by_uuid('other'))
+
+    def test_get_path(self):
+        self.assertEqual(self.snapshot.get_path(self.vm), 'QualiSB/Raz/template')
+
+    def test_get_datacenter(self):
+        self.assertEqual(self.snapshot.get_datacenter(self.vm), self.dc)
+        self.assertEqual(self.snapshot.get_datacenter(self.dc), self.dc)
+        self.assertIsNone(self.snapshot.get_datacenter(self.root))
+        self.assertIsNone(self.snapshot.get_datacenter(vim.VirtualMachine('vm-2')))
+
+    def test_update_moves_object(self):
+        # act
+        self.snapshot.update(self.vm, {'parent': self.vm_folder, 'name': 'renamed'})
+
+        # assert
+        self.assertEqual(self.snapshot.find_by_path('QualiSB', 'renamed'), self.vm)
+        self.assertIsNone(self.snapshot.find_by_path('QualiSB/Raz', 'template'))
+
+    def test_remove(self):
+        # act
+        self.snapshot.remove(self.vm)
+
+        # assert
+        self.assertIsNone(self.snapshot.find_by_uuid('bios-uuid'))
+        self.assertFalse(self.vm in self.snapshot)
@@ -0,0 +1,174 @@
+from threading import Event
+from unittest import TestCase
+
+from mock import Mock
+from pyVmomi import vim
+
+from common.vcenter.inventory_cache import InventoryCache
+from common.vcenter.vmomi_service import pyVmomiService
+
+
+def _change(name, val, op='assign'):
+    change = Mock()
+    change.name = name
+    change.val = val
+    change.op = op
+    return change
+
+
+def _object_update(obj, kind, changes=None):
+    object_update = Mock()
+    object_update.obj = obj
+    object_update.kind = kind
+    object_update.changeSet = changes or []
+    return object_update
+
+
+def _update_set(version, object_updates, truncated=False):
+    filter_update = Mock()
+    filter_update.objectSet = object_updates
+    update_set = Mock()
+    update_set.filterSet = [filter_update]
+    update_set.version = version
+    update_set.truncated = truncated
+    return update_set
+
+
+class TestInventoryCache(TestCase):
+    def setUp(self):
+        self.now = 100
+        self.root = vim.Folder('group-d1')
+        self.dc = vim.Datacenter('datacenter-1')
+        self.network_folder = vim.Folder('group-n1')
+        self.vm = vim.VirtualMachine('vm-1')
+        self.port_group = vim.dvs.DistributedVirtualPortgroup('dvportgroup-1')
+        self.cache = InventoryCache(Mock(), stale_after=60, time_func=lambda: self.now)
+        self.cache._collector = Mock()
+        self.cache.version = ''
+        self.cache.apply_update_set(_update_set('1', [
+            _object_update(self.root, 'enter', [_change('name', 'Datacenters')]),
+            _object_update(self.dc, 'enter', [_change('name', 'QualiSB'), _change('parent', self.root)]),
+            _object_update(self.network_folder, 'enter', [_change('name', 'network'), _change('parent', self.dc)]),
+            _object_update(self.vm, 'enter', [_change('name', 'vm1'), _change('parent', self.network_folder),
+                                              _change('config.uuid', 'uuid-1')])
+        ]))
+
+    def test_find_by_uuid(self):
+        self.assertEqual(self.cache.find_by_uuid('uuid-1'), self.vm)
+
+    def test_port_group_appears(self):
+        # arrange
+        self.cache._collector.WaitForUpdatesEx = Mock(side_effect=[
+            _update_set('2', [_object_update(self.port_group, 'enter',
+                                             [_change('name', 'QS_VLAN_10_Access'),
+                                              _change('parent', self.network_folder)])]),
+        ])
+
+        # act
+        self.cache.wait_for_updates()
+
+        # assert
+        self.assertEqual(self.cache.version, '2')
+        self.assertEqual(self.cache.find_network_by_name('QualiSB', 'QS_VLAN_10_Access'), self.port_group)
+        self.assertEqual(self.cache.get_network_by_full_name('QualiSB/QS_VLAN_10_Access'), self.port_group)
+
+    def test_truncated_updates_are_read_until_the_end(self):
+        # arrange
+        self.cache._collector.WaitForUpdatesEx = Mock(side_effect=[
+            _update_set('2', [_object_update(self.vm, 'modify', [_change('name', 'renamed')])], truncated=True),
+            _update_set('3', [_object_update(self.vm, 'leave')])
+        ])
+
+        # act
+        self.cache.wait_for_updates()
+
+        # assert
+        self.assertEqual(self.cache.version, '3')
+        self.assertIsNone(self.cache.find_by_uuid('uuid-1'))
+
+    def test_is_fresh(self):
+        # arrange
+        self.cache._collector.WaitForUpdatesEx = Mock(return_value=None)
+        self.assertFalse(self.cache.is_fresh())
+
+        # act
+        self.cache.wait_for_updates()
+
+        # assert
+        self.assertTrue(self.cache.is_fresh())
+        self.now += 61
+        self.assertFalse(self.cache.is_fresh())
+
+    def test_start_loads_the_inventory_in_the_background(self):
+        # arrange
+        loading = Event()
+        si = Mock()
+        collector = si.content.propertyCollector.CreatePropertyCollector.return_value
+        si.content.propertyCollector.CreatePropertyCollector = Mock(side_effect=lambda: loading.wait(5) and collector)
+        collector.WaitForUpdatesEx = Mock(side_effect=[None, Exception('session logged out')])
+        cache = InventoryCache(si, time_func=lambda: self.now)
+        cache._create_filter_spec = Mock()
+
+        # act
+        cache.start()
+        fresh_while_loading = cache.is_fresh()
+        loading.set()
+        cache._thread.join(5)
+
+        # assert
+        self.assertFalse(fresh_while_loading)
+        self.assertEqual(cache.last_update, self.now)
+
+
+class TestPyVmomiServiceInventoryCache(TestCase):
+    def setUp(self):
+        self.si = Mock()
+        self.vm = Mock()
+        self.pv_service = pyVmomiService(None, Mock())
+        self.cache = Mock()
+        self.cache.is_fresh = Mock(return_value=True)
+        self.pv_service._inventory_caches[id(self.si)] = self.cache
+
+    def test_find_by_uuid_from_cache(self):
+        # arrange
+        self.cache.find_by_uuid = Mock(return_value=self.vm)
+
+        # act
+        res = self.pv_service.find_by_uuid(self.si, 'uuid')
+
+        # assert
+        self.assertEqual(res, self.vm)
+        self.assertFalse(self.si.content.searchIndex.FindByUuid.called)
+
+    def test_find_by_uuid_stale_cache_goes_to_vcenter(self):
+        # arrange
+        self.cache.is_fresh = Mock(return_value=False)
+        self.si.content.searchIndex.FindByUuid = Mock(return_value=self.vm)
+
+        # act
+        res = self.pv_service.find_by_uuid(self.si, 'uuid')
+
+        # assert
+        self.assertEqual(res, self.vm)
+        self.assertFalse(self.cache.find_by_uuid.called)
+
+    def test_find_network_by_name_cache_miss_goes_to_vcenter(self):
+        # arrange
+        network = Mock()
+        self.cache.find_network_by_name = Mock(return_value=None)
+        self.pv_service.find_obj_by_path = Mock(return_value=network)
+
+        # act
+        res = self.pv_service.get_network_by_full_name(self.si, 'QualiSB/anetwork')
+
+        # assert
+        self.assertEqual(res, network)
+        self.cache.find_network_by_name.assert_called_once_with('QualiSB', 'anetwork')
+
+    def test_disconnect_stops_cache(self):
+        # act
+        self.pv_service.disconnect(self.si)
+
+        # assert
+        self.assertTrue(self.cache.stop.called)
+        self.assertFalse(id(self.si) in self.pv_service._inventory_caches)
@@ -0,0 +1,172 @@
+from unittest import TestCase
+
+from mock import Mock
+from pyVmomi import vim
+
+from common.vcenter.session_pool import VCenterSessionPool
+
+
+class TestVCenterSessionPool(TestCase):
+    def setUp(self):
+        self.now = 1000
+        self.si = Mock()
+        self.pv_service = Mock()
+        self.pv_service.connect = Mock(return_value=self.si)
+        self.connection_details = Mock()
+        self.connection_details.host = 'host'
+        self.connection_details.username = 'user'
+        self.connection_details.password = 'password'
+        self.connection_details.port = 443
+        self.pool = VCenterSessionPool(self.pv_service, max_idle_time=60, max_session_age=600,
+                                       time_func=lambda: self.now)
+
+    def test_get_session_reuses_live_session(self):
+        # act
+        first = self.pool.get_session(self.connection_details)
+        self.pool.release_session(self.connection_details, self.si)
+        second = self.pool.get_session(self.connection_details)
+
+        # assert
+        self.assertEqual(first, second)
+        self.assertEqual(self.pv_service.connect.call_count, 1)
+        self.assertTrue(self.si.CurrentTime.called)
+        self.assertFalse(self.pv_service.disconnect.called)
+
+    def test_get_session_logs_in_again_when_not_authenticated(self):
+        # arrange
+        new_si = Mock()
+        self.pool.get_session(self.connection_details)
+        self.pool.release_session(self.connection_details, self.si)
+        self.si.CurrentTime = Mock(side_effect=vim.fault.NotAuthenticated())
+        self.pv_service.connect = Mock(return_value=new_si)
+
+        # act
+        res = self.pool.get_session(self.connection_details)
+
+        # assert
+        self.assertEqual(res, new_si)
+        self.pv_service.disconnect.assert_called_once_with(self.si)
+
+    def test_idle_session_is_evicted(self):
+        # arrange
+        self.pool.get_session(self.connection_details)
+        self.pool.release_session(self.connection_details, self.si)
+        self.now += 61
+
+        # act
+        self.pool.evict_expired()
+
+        # assert
+        self.pv_service.disconnect.assert_called_once_with(self.si)
+
+    def test_session_in_use_is_not_evicted(self):
+        # arrange
+        self.pool.get_session(self.connection_details)
+        self.now += 601
+
+        # act
+        self.pool.evict_expired()
+
+        # assert
+        self.assertFalse(self.pv_service.disconnect.called)
+
+    def test_session_evicted_while_validated_is_not_handed_out(self):
+        # arrange
+        new_si = Mock()
+        self.pool.get_session(self.connection_details)
+        self.pool.release_session(self.connection_details, self.si)
+
+        def evict_meanwhile():
+            self.now += 61
+            self.pool.evict_expired()
+        self.si.CurrentTime = Mock(side_effect=evict_meanwhile)
+        self.pv_service.connect = Mock(return_value=new_si)
+
+        # act
+        res = self.pool.get_session(self.connection_details)
+
+        # assert
+        self.assertEqual(res, new_si)
+        self.pv_service.disconnect.assert_called_once_with(self.si)
+
+    def test_expired_session_is_replaced(self):
+        # arrange
+        self.pool.get_session(self.connection_details)
+        self.pool.release_session(self.connection_details, self.si)
+        self.now += 601
+
+        # act
+        self.pool.get_session(self.connection_details)
+
+        # assert
+        self.assertEqual(self.pv_service.connect.call_count, 2)
+        self.pv_service.disconnect.assert_called_once_with(self.si)
+
+    def test_invalidated_session_is_logged_out_by_its_last_user(self):
+        # arrange
+        new_si = Mock()
+        self.pool.get_session(self.connection_details)
+        self.pool.get_session(self.connection_details)
+
+        # act
+        self.pool.invalidate(self.connection_details, self.si)
+        disconnected_while_used = self.pv_service.disconnect.called
+        self.pv_service.connect = Mock(return_value=new_si)
+        res = self.pool.get_session(self.connection_details)
+        self.pool.release_session(self.connection_details, self.si)
+        self.pool.release_session(self.connection_details, self.si)
+
+        # assert
+        self.assertFalse(disconnected_while_used)
+        self.assertEqual(res, new_si)
+        self.pv_service.disconnect.assert_called_once_with(self.si)
+
+    def test_release_of_a_replaced_session_does_not_touch_its_replacement(self):
+        # arrange
+        new_si = Mock()
+        self.pool.get_session(self.connection_details)
+        self.pool.invalidate(self.connection_details, self.si)
+        self.pv_service.connect = Mock(return_value=new_si)
+        self.pool.get_session(self.connection_details)
+
+        # act
+        self.pool.release_session(self.connection_details, self.si)
+        self.now += 601
+        self.pool.evict_expired()
+
+        # assert
+        self.pv_service.disconnect.assert_called_once_with(self.si)
+
+    def test_failed_connection_is_not_pooled(self):
+        # arrange
+        self.pv_service.connect = Mock(return_value=None)
+
+        # act
+        res = self.pool.get_session(self.connection_details)
+        self.pool.get_session(self.connection_details)
+
+        # assert
+        self.assertIsNone(res)
+        self.assertEqual(self.pv_service.connect.call_count, 2)
+
+    def test_close_all(self):
+        # arrange
+        self.pool.get_session(self.connection_details)
+
+        # act
+        self.pool.close_all()
+
+        # assert
+        self.pv_service.disconnect.assert_called_once_with(self.si)
+
+    def test_on_session_created_is_called_once_per_login(self):
+        # arrange
+        on_session_created = Mock()
+        pool = VCenterSessionPool(self.pv_service, on_session_created=on_session_created)
+
+        # act
+        pool.get_session(self.connection_details)
+        pool.get_session(self.connection_details)
+
+        # assert
+        on_session_created.assert_called_once_with(self.si)
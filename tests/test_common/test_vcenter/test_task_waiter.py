@@ -1,7 +1,7 @@
 import unittest
 from mock import Mock, patch
 from pyVmomi import vim
-from common.vcenter.task_waiter import SynchronousTaskWaiter
+from common.vcenter.task_waiter import SynchronousTaskWaiter, TaskTimeoutException
 
 task = Mock(spec=vim.Task)
 
@@ -54,3 +54,250 @@ class TestTaskWaiter(unittest.TestCase):
         waiter = SynchronousTaskWaiter()
 
         self.assertRaises(Exception, waiter.wait_for_task, task)
+
+
+def _update_set(version, changes, task=vim.Task('task-1')):
+    object_update = Mock()
+    object_update.obj = task
+    object_update.changeSet = []
+    for name, val in changes.items():
+        change = Mock()
+        change.name = name
+        change.val = val
+        change.op = 'assign'
+        object_update.changeSet.append(change)
+    filter_update = Mock()
+    filter_update.objectSet = [object_update]
+    update_set = Mock()
+    update_set.filterSet = [filter_update]
+    update_set.version = version
+    return update_set
+
+
+class TestTaskWaiterPropertyCollector(unittest.TestCase):
+    def setUp(self):
+        self.task = vim.Task('task-1')
+        self.collector = Mock()
+        self.waiter = SynchronousTaskWaiter()
+        self.waiter._create_property_collector = Mock(return_value=self.collector)
+
+    def test_wait_for_task_returns_when_task_succeeds(self):
+        # arrange
+        progress_callback = Mock()
+        self.collector.WaitForUpdatesEx = Mock(side_effect=[
+            _update_set('1', {'info.state': 'running', 'info.progress': 50}),
+            _update_set('2', {'info.state': 'success', 'info.result': 'result'})
+        ])
+
+        # act
+        res = self.waiter.wait_for_task(self.task, progress_callback=progress_callback)
+
+        # assert
+        self.assertEqual(res, 'result')
+        self.assertEqual(self.collector.WaitForUpdatesEx.call_args_list[1][0][0], '1')
+        progress_callback.assert_called_once_with(50)
+        self.assertTrue(self.collector.CreateFilter.called)
+        self.assertTrue(self.collector.Destroy.called)
+
+    def test_wait_for_task_raises_task_error(self):
+        # arrange
+        error = vim.fault.DuplicateName()
+        self.collector.WaitForUpdatesEx = Mock(return_value=_update_set('1', {'info.state': 'error',
+                                                                               'info.error': error}))
+
+        # act & assert
+        self.assertRaises(vim.fault.DuplicateName, self.waiter.wait_for_task, self.task)
+        self.assertTrue(self.collector.Destroy.called)
+
+    @patch('time.time')
+    def test_wait_for_task_timeout(self, time_mock):
+        # arrange
+        time_mock.side_effect = [0, 0, 11]
+        self.collector.WaitForUpdatesEx = Mock(return_value=None)
+
+        # act & assert
+        self.assertRaises(TaskTimeoutException, self.waiter.wait_for_task, self.task, timeout=10)
+        self.assertTrue(self.collector.Destroy.called)
+
+
+class TestTaskWaiterProperty(unittest.TestCase):
+    def setUp(self):
+        self.vm = vim.VirtualMachine('vm-1')
+        self.collector = Mock()
+        self.waiter = SynchronousTaskWaiter()
+        self.waiter._create_property_collector = Mock(return_value=self.collector)
+
+    def test_wait_for_property_returns_when_the_value_is_ready(self):
+        # arrange
+        self.collector.WaitForUpdatesEx = Mock(side_effect=[
+            _update_set('1', {'runtime.powerState': 'poweredOn'}, self.vm),
+            _update_set('2', {'runtime.powerState': 'poweredOff'}, self.vm)
+        ])
+
+        # act
+        res = self.waiter.wait_for_property(self.vm, 'runtime.powerState', lambda state: state == 'poweredOff')
+
+        # assert
+        self.assertEqual(res, 'poweredOff')
+        self.assertEqual(self.collector.WaitForUpdatesEx.call_args_list[1][0][0], '1')
+        filter_spec = self.collector.CreateFilter.call_args[0][0]
+        self.assertEqual(filter_spec.propSet[0].pathSet, ['runtime.powerState'])
+        self.assertTrue(self.collector.Destroy.called)
+
+    def test_wait_for_properties_keeps_the_values_of_earlier_updates(self):
+        # arrange
+        self.collector.WaitForUpdatesEx = Mock(side_effect=[
+            _update_set('1', {'guest.ipAddress': None, 'guest.net': []}, self.vm),
+            _update_set('2', {'guest.ipAddress': '10.0.0.1'}, self.vm)
+        ])
+
+        # act
+        res = self.waiter.wait_for_properties(self.vm, ['guest.ipAddress', 'guest.net'],
+                                              lambda values: values['guest.ipAddress'] is not None)
+
+        # assert
+        self.assertEqual(res, {'guest.ipAddress': '10.0.0.1', 'guest.net': []})
+
+    def test_as_ready_yields_every_object_once_it_is_ready(self):
+        # arrange
+        vm2 = vim.VirtualMachine('vm-2')
+        self.collector.WaitForUpdatesEx = Mock(side_effect=[
+            _update_set('1', {'guest.ipAddress': '10.0.0.2'}, vm2),
+            _update_set('2', {'guest.ipAddress': None}, self.vm),
+            _update_set('3', {'guest.ipAddress': '10.0.0.1'}, self.vm)
+        ])
+
+        # act
+        ready = list(self.waiter.as_ready([self.vm, vm2], ['guest.ipAddress'],
+                                          lambda vm, values: values['guest.ipAddress'] is not None))
+
+        # assert
+        self.assertEqual([(vm, values['guest.ipAddress']) for vm, values in ready],
+                         [(vm2, '10.0.0.2'), (self.vm, '10.0.0.1')])
+        self.assertEqual(self.collector.CreateFilter.call_count, 1)
+        self.assertEqual(len(self.collector.CreateFilter.call_args[0][0].objectSet), 2)
+        self.assertTrue(self.collector.Destroy.called)
+
+    @patch('time.time')
+    def test_wait_for_property_timeout(self, time_mock):
+        # arrange
+        time_mock.side_effect = [0, 0, 11]
+        self.collector.WaitForUpdatesEx = Mock(return_value=None)
+
+        # act & assert
+        self.assertRaises(TaskTimeoutException, self.waiter.wait_for_property, self.vm, 'guestHeartbeatStatus',
+                          lambda status: status == 'green', timeout=10)
+        self.assertTrue(self.collector.Destroy.called)
+
+    @patch('time.sleep')
+    def test_wait_for_property_polls_object_without_connection(self, sleep_mock):
+        # arrange
+        vm = Mock(spec=vim.VirtualMachine)
+        vm.runtime.powerState = 'poweredOff'
+
+        def power_on(interval):
+            vm.runtime.powerState = 'poweredOn'
+        sleep_mock.side_effect = power_on
+
+        # act
+        res = SynchronousTaskWaiter().wait_for_property(vm, 'runtime.powerState', lambda state: state == 'poweredOn')
+
+        # assert
+        self.assertEqual(res, 'poweredOn')
+        self.assertEqual(sleep_mock.call_count, 1)
+
+
+class TestTaskWaiterMultipleTasks(unittest.TestCase):
+    def setUp(self):
+        self.task1 = vim.Task('task-1')
+        self.task2 = vim.Task('task-2')
+        self.task3 = vim.Task('task-3')
+        self.collector = Mock()
+        self.waiter = SynchronousTaskWaiter()
+        self.waiter._create_property_collector = Mock(return_value=self.collector)
+
+    def test_as_completed_yields_in_completion_order(self):
+        # arrange
+        self.collector.WaitForUpdatesEx = Mock(side_effect=[
+            _update_set('1', {'info.state': 'success', 'info.result': 'second'}, self.task2),
+            _update_set('2', {'info.state': 'error', 'info.error': vim.fault.DuplicateName()}, self.task1),
+        ])
+
+        # act
+        outcomes = list(self.waiter.as_completed([self.task1, self.task2]))
+
+        # assert
+        self.assertEqual([outcome.task for outcome in outcomes], [self.task2, self.task1])
+        self.assertTrue(outcomes[0].succeeded)
+        self.assertEqual(outcomes[0].result, 'second')
+        self.assertFalse(outcomes[1].succeeded)
+        self.assertIsInstance(outcomes[1].error, vim.fault.DuplicateName)
+        self.assertEqual(self.collector.CreateFilter.call_count, 1)
+        self.assertTrue(self.collector.Destroy.called)
+
+    def test_as_completed_follows_tasks_added_while_iterating(self):
+        # arrange
+        self.collector.WaitForUpdatesEx = Mock(side_effect=[
+            _update_set('1', {'info.state': 'success', 'info.result': 'first'}, self.task1),
+            _update_set('2', {'info.state': 'success', 'info.result': 'second'}, self.task2),
+        ])
+        tasks = [self.task1]
+
+        # act
+        outcomes = []
+        for outcome in self.waiter.as_completed(tasks):
+            outcomes.append(outcome)
+            if outcome.task is self.task1:
+                tasks.append(self.task2)
+
+        # assert
+        self.assertEqual([outcome.result for outcome in outcomes], ['first', 'second'])
+        self.assertEqual(self.collector.CreateFilter.call_count, 2)
+        self.assertEqual(self.waiter._create_property_collector.call_count, 1)
+        self.assertTrue(self.collector.Destroy.called)
+
+    @patch('time.time')
+    def test_wait_all_returns_outcomes_in_task_order_and_times_out(self, time_mock):
+        # arrange
+        clock = iter([0, 0])
+        time_mock.side_effect = lambda: next(clock, 11)
+        self.collector.WaitForUpdatesEx = Mock(side_effect=[
+            _update_set('1', {'info.state': 'success', 'info.result': 'third'}, self.task3),
+            None
+        ])
+
+        # act
+        outcomes = self.waiter.wait_all([self.task1, self.task2, self.task3], timeout=10)
+
+        # assert
+        self.assertEqual([outcome.task for outcome in outcomes], [self.task1, self.task2, self.task3])
+        self.assertIsInstance(outcomes[0].error, TaskTimeoutException)
+        self.assertIsInstance(outcomes[1].error, TaskTimeoutException)
+        self.assertEqual(outcomes[2].result, 'third')
+
+    @patch('time.sleep')
+    def test_wait_all_polls_tasks_without_connection(self, sleep_mock):
+        # arrange
+        task1 = Mock(spec=vim.Task)
+        task1.info = Mock(spec=vim.TaskInfo)
+        task1.info.state = vim.TaskInfo.State.success
+        task1.info.result = 'result'
+        task2 = Mock(spec=vim.Task)
+        task2.info = Mock(spec=vim.TaskInfo)
+        task2.info.state = vim.TaskInfo.State.running
+
+        def finish(interval):
+            task2.info.state = vim.TaskInfo.State.error
+            task2.info.error = vim.fault.DuplicateName()
+        sleep_mock.side_effect = finish
+
+        # act
+        outcomes = SynchronousTaskWaiter().wait_all([task1, task2])
+
+        # assert
+        self.assertTrue(outcomes[0].succeeded)
+        self.assertFalse(outcomes[1].succeeded)
+        self.assertEqual(sleep_mock.call_count, 1)
+
+    def test_wait_all_no_tasks(self):
+        self.assertEqual(self.waiter.wait_all([]), [])
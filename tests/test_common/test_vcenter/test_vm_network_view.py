@@ -0,0 +1,72 @@
+from unittest import TestCase
+
+from mock import Mock
+from pyVmomi import vim
+
+from common.vcenter.vm_network_view import VmNetworkView
+from vCenterShell.network.dvswitch.name_generator import DvPortGroupNameGenerator
+from vCenterShell.vm.dvswitch_connector import ConnectRequest
+from vCenterShell.vm.vnic_to_network_mapper import VnicToNetworkMapper
+
+
+class TestVmNetworkView(TestCase):
+    def setUp(self):
+        self.vm = vim.VirtualMachine('vm-1')
+        self.port_group = vim.dvs.DistributedVirtualPortgroup('dvportgroup-1')
+        self.network = vim.Network('network-1')
+
+        port = vim.dvs.PortConnection(portgroupKey='dvportgroup-1')
+        self.dv_vnic = vim.vm.device.VirtualVmxnet3(
+            deviceInfo=vim.Description(label='Network adapter 1', summary=''),
+            macAddress='AA',
+            backing=vim.vm.device.VirtualEthernetCard.DistributedVirtualPortBackingInfo(port=port))
+
+        self.standard_vnic = vim.vm.device.VirtualE1000(
+            deviceInfo=vim.Description(label='Network adapter 2', summary=''),
+            macAddress='BB',
+            backing=vim.vm.device.VirtualEthernetCard.NetworkBackingInfo(network=self.network))
+
+        disk = vim.vm.device.VirtualDisk()
+
+        self.view = VmNetworkView.create(self.vm, [
+            (self.vm, {'name': 'vm1',
+                       'config.hardware.device': [disk, self.dv_vnic, self.standard_vnic],
+                       'network': [self.port_group, self.network]}),
+            (self.port_group, {'name': 'QS_dvSwitch_VLAN_10_Access', 'key': 'dvportgroup-1'}),
+            (self.network, {'name': 'anetwork'})])
+
+    def test_vnics_are_indexed_by_label_and_mac(self):
+        # act
+        vnics = self.view.map_vnics()
+
+        # assert
+        self.assertEqual(self.view.name, 'vm1')
+        self.assertEqual(vnics.keys(), ['Network adapter 1', 'Network adapter 2'])
+        self.assertIs(self.view.get_vnic_by_mac_address('BB'), self.standard_vnic)
+        self.assertIsNone(self.view.get_vnic_by_mac_address('CC'))
+        self.assertEqual(self.view.get_vnics_by_portgroup_key('dvportgroup-1'), [self.dv_vnic])
+
+    def test_networks_are_indexed_by_name_and_key(self):
+        # assert
+        self.assertEqual(self.view.get_network_by_name('anetwork'), self.network)
+        self.assertEqual(self.view.get_network_by_key('dvportgroup-1'), self.port_group)
+        self.assertIsNone(self.view.get_network_by_name('missing'))
+
+    def test_vnic_network_name_is_resolved_from_the_backing(self):
+        # assert
+        self.assertEqual(self.view.get_vnic_network_name('Network adapter 1'), 'QS_dvSwitch_VLAN_10_Access')
+        self.assertEqual(self.view.get_vnic_network_name('Network adapter 2'), 'anetwork')
+        self.assertIsNone(self.view.get_vnic_network_name('Network adapter 3'))
+
+    def test_mapper_uses_the_view_for_the_vnic_networks(self):
+        # arrange
+        default_network = Mock()
+        default_network.name = 'anetwork'
+        mapper = VnicToNetworkMapper(DvPortGroupNameGenerator())
+
+        # act
+        mapping = mapper.map_request_to_vnics([ConnectRequest(None, 'new network')], self.view.map_vnics(),
+                                              self.view.networks, default_network, vm_network_view=self.view)
+
+        # assert
+        self.assertEqual(mapping, {'Network adapter 2': 'new network'})
@@ -5,7 +5,7 @@ from datetime import datetime
 
 from mock import Mock, MagicMock, create_autospec
 from pyVim.connect import SmartConnect, Disconnect
-from pyVmomi import vim
+from pyVmomi import vim, vmodl
 
 from common.logger.service import LoggingService
 from common.vcenter.vmomi_service import pyVmomiService
@@ -302,6 +302,159 @@ class ignore_test_common_pyvmomi(unittest.TestCase):
         self.assertTrue(pv_service.get_obj.called)
         self.assertTrue(pv_service.wait_for_task.called)
 
+    def test_clone_vm_placement_is_resolved_once(self):
+        # arrange
+        si = Mock(spec=vim.ServiceInstance)
+        template = Mock(spec=vim.VirtualMachine)
+        template.datastore = [vim.Datastore('datastore-1')]
+
+        pv_service = pyVmomiService(None, None)
+        pv_service.find_vm_by_name = Mock(return_value=template)
+        pv_service.get_obj = Mock(return_value=Mock(resourcePool=vim.ResourcePool('resgroup-1')))
+        pv_service.get_folder = Mock(return_value=Mock(spec=vim.Datacenter))
+        pv_service.wait_for_task = Mock()
+
+        # act
+        for vm_name in ['vm1', 'vm2']:
+            pv_service.clone_vm(pv_service.CloneVmParameters(si=si, template_name='my_temp', vm_name=vm_name,
+                                                             vm_folder='my_folder', cluster_name='cluster'))
+
+        # assert
+        pv_service.get_folder.assert_called_once()
+        pv_service.find_vm_by_name.assert_called_once()
+        pv_service.get_obj.assert_called_once()
+        self.assertEqual(template.Clone.call_count, 2)
+
+    def test_start_clone_vm_does_not_wait_for_the_task(self):
+        # arrange
+        si = Mock(spec=vim.ServiceInstance)
+        template = Mock(spec=vim.VirtualMachine)
+        pv_service = pyVmomiService(None, None)
+        pv_service.resolve_clone_placement = Mock(return_value=pv_service.ClonePlacement(
+            Mock(spec=vim.Folder), template, vim.Datastore('datastore-1'), vim.ResourcePool('resgroup-1')))
+        pv_service.wait_for_task = Mock()
+
+        # act
+        res = pv_service.start_clone_vm(pv_service.CloneVmParameters(si=si, template_name='my_temp', vm_name='vm',
+                                                                     vm_folder='my_folder'))
+
+        # assert
+        self.assertIsNone(res.error)
+        self.assertEqual(res.task, template.Clone.return_value)
+        self.assertFalse(pv_service.wait_for_task.called)
+
+    def test_start_clone_vm_linked_clone_uses_a_child_disk_of_the_snapshot(self):
+        # arrange
+        si = Mock(spec=vim.ServiceInstance)
+        template = Mock(spec=vim.VirtualMachine)
+        snapshot = vim.vm.Snapshot('snapshot-1')
+        pv_service = pyVmomiService(None, None)
+        pv_service.resolve_clone_placement = Mock(return_value=pv_service.ClonePlacement(
+            Mock(spec=vim.Folder), template, vim.Datastore('datastore-1'), vim.ResourcePool('resgroup-1')))
+        pv_service.get_clone_snapshot = Mock(return_value=snapshot)
+
+        # act
+        pv_service.start_clone_vm(pv_service.CloneVmParameters(si=si, template_name='my_temp', vm_name='vm',
+                                                               vm_folder='my_folder', linked_clone=True,
+                                                               snapshot_name='base'))
+
+        # assert
+        pv_service.get_clone_snapshot.assert_called_once_with(template, 'base')
+        clone_spec = template.Clone.call_args[1]['spec']
+        self.assertEqual(clone_spec.snapshot, snapshot)
+        self.assertEqual(clone_spec.location.diskMoveType, 'createNewChildDiskBacking')
+
+    def test_get_clone_snapshot_by_name(self):
+        # arrange
+        child = Mock(snapshot='child snapshot', childSnapshotList=[])
+        child.name = 'child'
+        root = Mock(snapshot='root snapshot', childSnapshotList=[child])
+        root.name = 'root'
+        template = Mock()
+        template.snapshot.rootSnapshotList = [root]
+        pv_service = pyVmomiService(None, None)
+
+        # act
+        res = pv_service.get_clone_snapshot(template, 'child')
+
+        # assert
+        self.assertEqual(res, 'child snapshot')
+        self.assertRaises(ValueError, pv_service.get_clone_snapshot, template, 'missing')
+
+    def test_get_clone_snapshot_creates_the_base_snapshot_once(self):
+        # arrange
+        template = Mock()
+        template.snapshot = None
+        pv_service = pyVmomiService(None, None)
+        created = vim.vm.Snapshot('snapshot-1')
+
+        def create_snapshot(task):
+            template.snapshot = Mock(currentSnapshot=created)
+            return created
+        pv_service.wait_for_task = Mock(side_effect=create_snapshot)
+
+        # act
+        results = [pv_service.get_clone_snapshot(template), pv_service.get_clone_snapshot(template)]
+
+        # assert
+        self.assertEqual(results, [created, created])
+        template.CreateSnapshot_Task.assert_called_once()
+
+    def test_clone_vm_forgets_the_placement_of_a_removed_object(self):
+        # arrange
+        si = Mock(spec=vim.ServiceInstance)
+        pv_service = pyVmomiService(None, None)
+        pv_service._resolve_clone_placement = Mock()
+        pv_service.start_clone_vm = Mock(return_value=pv_service.CloneVmResult(task=Mock()))
+        pv_service.task_waiter = Mock()
+        pv_service.task_waiter.wait_for_task = Mock(side_effect=vmodl.fault.ManagedObjectNotFound())
+        params = pv_service.CloneVmParameters(si=si, template_name='my_temp', vm_name='vm', vm_folder='my_folder')
+        other_params = pv_service.CloneVmParameters(si=si, template_name='other', vm_name='vm', vm_folder='my_folder')
+        pv_service.resolve_clone_placement(params)
+        pv_service.resolve_clone_placement(other_params)
+
+        # act
+        self.assertRaises(vmodl.fault.ManagedObjectNotFound, pv_service.clone_vm, params)
+        pv_service.resolve_clone_placement(params)
+        pv_service.resolve_clone_placement(other_params)
+
+        # assert
+        self.assertEqual(pv_service._resolve_clone_placement.call_count, 3)
+
+    def test_supports_instant_clone_needs_the_api_and_vcenter_6_7(self):
+        # arrange
+        si = Mock()
+        si.content.about.apiVersion = '6.7.1'
+        old_si = Mock()
+        old_si.content.about.apiVersion = '6.5'
+        vim_mock = Mock()
+        pv_service = pyVmomiService(None, None, vim_mock)
+        # the pyVmomi of this tree predates InstantClone_Task
+        no_api_service = pyVmomiService(None, None)
+
+        # act & assert
+        self.assertTrue(pv_service.supports_instant_clone(si))
+        self.assertFalse(pv_service.supports_instant_clone(old_si))
+        self.assertFalse(no_api_service.supports_instant_clone(si))
+
+    def test_clone_placement_is_resolved_again_after_invalidation_or_ttl(self):
+        # arrange
+        si = Mock(spec=vim.ServiceInstance)
+        pv_service = pyVmomiService(None, None)
+        pv_service._resolve_clone_placement = Mock()
+        pv_service.time_func = Mock(return_value=0)
+        params = pv_service.CloneVmParameters(si=si, template_name='my_temp', vm_name='vm', vm_folder='my_folder')
+        pv_service.resolve_clone_placement(params)
+
+        # act
+        pv_service.invalidate_placement_cache(si)
+        pv_service.resolve_clone_placement(params)
+        pv_service.time_func.return_value = pv_service.placement_cache_ttl + 1
+        pv_service.resolve_clone_placement(params)
+
+        # assert
+        self.assertEqual(pv_service._resolve_clone_placement.call_count, 3)
+
     def test_clone_vm_vm_folder_is_none(self):
         """
         Checks clone_vm
@@ -1188,6 +1341,55 @@ class ignore_test_common_pyvmomi(unittest.TestCase):
         #assert
         self.assertTrue(pv_service.find_network_by_name.called)
 
+    def test_get_network_by_full_name_is_resolved_once_per_session(self):
+        # arrange
+        pv_service = pyVmomiService(None, None)
+        si = Mock()
+        network = Mock()
+        pv_service.find_network_by_name = Mock(return_value=network)
+
+        # act
+        first = pv_service.get_network_by_full_name(si, 'QualiSB/anetwork')
+        second = pv_service.get_network_by_full_name(si, 'QualiSB/anetwork')
+        other_session = pv_service.get_network_by_full_name(Mock(), 'QualiSB/anetwork')
+
+        # assert
+        self.assertIs(first, network)
+        self.assertIs(second, network)
+        self.assertIs(other_session, network)
+        self.assertEqual(pv_service.find_network_by_name.call_count, 2)
+
+    def test_get_network_by_full_name_resolves_again_after_ttl_or_invalidation(self):
+        # arrange
+        pv_service = pyVmomiService(None, None)
+        si = Mock()
+        now = [1000]
+        pv_service.time_func = lambda: now[0]
+        pv_service.find_network_by_name = Mock(return_value=Mock())
+        pv_service.get_network_by_full_name(si, 'QualiSB/anetwork')
+
+        # act
+        now[0] += pv_service.network_cache_ttl
+        pv_service.get_network_by_full_name(si, 'QualiSB/anetwork')
+        pv_service.invalidate_network_cache(si)
+        pv_service.get_network_by_full_name(si, 'QualiSB/anetwork')
+
+        # assert
+        self.assertEqual(pv_service.find_network_by_name.call_count, 3)
+
+    def test_get_network_by_full_name_does_not_cache_missing_network(self):
+        # arrange
+        pv_service = pyVmomiService(None, None)
+        si = Mock()
+        pv_service.find_network_by_name = Mock(return_value=None)
+
+        # act
+        pv_service.get_network_by_full_name(si, 'QualiSB/anetwork')
+        pv_service.get_network_by_full_name(si, 'QualiSB/anetwork')
+
+        # assert
+        self.assertEqual(pv_service.find_network_by_name.call_count, 2)
+
     def test_destroy_vm(self):
         #arrange
         pv_service = pyVmomiService(None, None)
@@ -1264,3 +1466,207 @@ class ignore_test_common_pyvmomi(unittest.TestCase):
 
         # Assert
         self.assertIsNone(actual_network)
+
+
+class TestRetrieveProperties(unittest.TestCase):
+    def setUp(self):
+        self.view = Mock(spec=vim.view.ContainerView)
+        self.content = Mock()
+        self.content.viewManager.CreateContainerView = Mock(return_value=self.view)
+        self.pv_service = pyVmomiService(None, None)
+
+    @staticmethod
+    def _object_content(obj, **properties):
+        object_content = Mock()
+        object_content.obj = obj
+        props = []
+        for name, val in properties.items():
+            prop = Mock()
+            prop.name = name
+            prop.val = val
+            props.append(prop)
+        object_content.propSet = props
+        return object_content
+
+    def test_retrieve_properties_pages(self):
+        # arrange
+        first = Mock()
+        first.objects = [self._object_content('ds1', name='datastore1')]
+        first.token = 'token'
+        second = Mock()
+        second.objects = [self._object_content('ds2', name='datastore2')]
+        second.token = None
+        self.content.propertyCollector.RetrievePropertiesEx = Mock(return_value=first)
+        self.content.propertyCollector.ContinueRetrievePropertiesEx = Mock(return_value=second)
+
+        # act
+        res = self.pv_service.retrieve_properties(self.content, {vim.Datastore: ['name']})
+
+        # assert
+        self.assertEqual(res, [('ds1', {'name': 'datastore1'}), ('ds2', {'name': 'datastore2'})])
+        self.content.propertyCollector.ContinueRetrievePropertiesEx.assert_called_once_with(token='token')
+        self.assertTrue(self.view.Destroy.called)
+
+    def test_get_obj_by_name(self):
+        # arrange
+        page = Mock()
+        page.objects = [self._object_content('ds1', name='datastore1'),
+                        self._object_content('ds2', name='datastore2')]
+        page.token = None
+        self.content.propertyCollector.RetrievePropertiesEx = Mock(return_value=page)
+
+        # act
+        res = self.pv_service.get_obj(self.content, [vim.Datastore], 'datastore2')
+
+        # assert
+        self.assertEqual(res, 'ds2')
+        self.assertTrue(self.view.Destroy.called)
+
+    def test_retrieve_referenced_properties(self):
+        # arrange
+        dv_switch = vim.dvs.VmwareDistributedVirtualSwitch('dvs-1')
+        page = Mock()
+        page.objects = [self._object_content('pg1', name='VLAN_10', key='dvportgroup-1')]
+        page.token = None
+        self.content.propertyCollector.RetrievePropertiesEx = Mock(return_value=page)
+
+        # act
+        res = self.pv_service.retrieve_referenced_properties(self.content, dv_switch, 'portgroup',
+                                                             vim.dvs.DistributedVirtualPortgroup, ['name', 'key'])
+
+        # assert
+        self.assertEqual(res, [('pg1', {'name': 'VLAN_10', 'key': 'dvportgroup-1'})])
+        filter_spec = self.content.propertyCollector.RetrievePropertiesEx.call_args[1]['specSet'][0]
+        self.assertEqual(filter_spec.objectSet[0].obj, dv_switch)
+        self.assertEqual(filter_spec.objectSet[0].selectSet[0].path, 'portgroup')
+
+    def test_get_vm_network_view_reads_vm_and_networks_in_one_call(self):
+        # arrange
+        vm = vim.VirtualMachine('vm-1')
+        port_group = vim.dvs.DistributedVirtualPortgroup('dvportgroup-1')
+        page = Mock()
+        page.objects = [self._object_content(vm, name='vm1', network=[port_group]),
+                        self._object_content(port_group, name='VLAN_10', key='dvportgroup-1')]
+        page.token = None
+        self.content.propertyCollector.RetrievePropertiesEx = Mock(return_value=page)
+        si = Mock()
+        si.content = self.content
+
+        # act
+        view = self.pv_service.get_vm_network_view(si, vm)
+
+        # assert
+        self.content.propertyCollector.RetrievePropertiesEx.assert_called_once()
+        filter_spec = self.content.propertyCollector.RetrievePropertiesEx.call_args[1]['specSet'][0]
+        self.assertEqual(filter_spec.objectSet[0].selectSet[0].path, 'network')
+        self.assertEqual(view.name, 'vm1')
+        self.assertEqual(view.get_network_by_key('dvportgroup-1'), port_group)
+
+    def test_get_obj_destroys_view_on_error(self):
+        # arrange
+        self.content.propertyCollector.RetrievePropertiesEx = Mock(side_effect=Exception('failed'))
+
+        # act & assert
+        self.assertRaises(Exception, self.pv_service.get_obj, self.content, [vim.Datastore], 'datastore2')
+        self.assertTrue(self.view.Destroy.called)
+
+
+class TestFindVmsByUuids(unittest.TestCase):
+    def setUp(self):
+        self.view = Mock(spec=vim.view.ContainerView)
+        self.si = Mock()
+        self.si.content.viewManager.CreateContainerView = Mock(return_value=self.view)
+        self.pv_service = pyVmomiService(None, None)
+        self.vm1 = vim.VirtualMachine('vm-1')
+        self.vm2 = vim.VirtualMachine('vm-2')
+
+    @staticmethod
+    def _page(*objects):
+        page = Mock()
+        page.objects = [TestRetrieveProperties._object_content(obj, **properties) for obj, properties in objects]
+        page.token = None
+        return page
+
+    def test_find_vms_by_uuids_in_two_calls(self):
+        # arrange
+        uuid_page = self._page((self.vm1, {'config.uuid': 'uuid-1', 'config.instanceUuid': 'instance-1'}),
+                               (self.vm2, {'config.uuid': 'uuid-2', 'config.instanceUuid': 'instance-2'}))
+        network = vim.Network('network-1')
+        details_page = self._page((self.vm2, {'name': 'vm2', 'config.uuid': 'uuid-2',
+                                              'config.hardware.device': ['nic'], 'network': [network],
+                                              'runtime.powerState': 'poweredOn'}),
+                                  (network, {'name': 'VM Network'}))
+        self.si.content.propertyCollector.RetrievePropertiesEx = Mock(side_effect=[uuid_page, details_page])
+
+        # act
+        res = self.pv_service.find_vms_by_uuids(self.si, ['instance-2', 'unknown'])
+
+        # assert
+        self.assertEqual(res.keys(), ['instance-2'])
+        self.assertEqual(res['instance-2'].vm, self.vm2)
+        self.assertEqual(res['instance-2'].name, 'vm2')
+        self.assertEqual(res['instance-2'].devices, ['nic'])
+        self.assertEqual(res['instance-2'].networks, [network])
+        self.assertEqual(res['instance-2'].power_state, 'poweredOn')
+        self.assertEqual(res['instance-2'].network_view.name, 'vm2')
+        self.assertEqual(res['instance-2'].network_view.get_network_by_name('VM Network'), network)
+        self.assertEqual(self.si.content.propertyCollector.RetrievePropertiesEx.call_count, 2)
+        details_spec = self.si.content.propertyCollector.RetrievePropertiesEx.call_args[1]['specSet'][0]
+        self.assertEqual([object_spec.obj for object_spec in details_spec.objectSet], [self.vm2])
+        self.assertEqual(details_spec.objectSet[0].selectSet[0].path, 'network')
+
+    def test_get_vms_datacenters_uses_the_only_datacenter(self):
+        # arrange
+        datacenter = vim.Datacenter('datacenter-1')
+        self.si.content.propertyCollector.RetrievePropertiesEx = \
+            Mock(return_value=self._page((datacenter, {'name': 'QualiSB'})))
+
+        # act
+        res = self.pv_service.get_vms_datacenters(self.si, [self.vm1, self.vm2])
+
+        # assert
+        self.assertEqual(res, {self.vm1: datacenter, self.vm2: datacenter})
+
+    def test_get_vms_datacenters_uses_fresh_inventory_cache(self):
+        # arrange
+        datacenter = vim.Datacenter('datacenter-1')
+        cache = Mock()
+        cache.is_fresh = Mock(return_value=True)
+        cache.get_datacenter = Mock(side_effect=lambda vm: datacenter if vm is self.vm1 else None)
+        self.pv_service._inventory_caches[id(self.si)] = cache
+
+        # act
+        res = self.pv_service.get_vms_datacenters(self.si, [self.vm1, self.vm2])
+
+        # assert
+        self.assertEqual(res, {self.vm1: datacenter})
+        self.assertFalse(self.si.content.propertyCollector.RetrievePropertiesEx.called)
+
+    def test_find_vms_by_uuids_uses_fresh_inventory_cache(self):
+        # arrange
+        cache = Mock()
+        cache.is_fresh = Mock(return_value=True)
+        cache.find_by_uuid = Mock(return_value=self.vm1)
+        self.pv_service._inventory_caches[id(self.si)] = cache
+        self.si.content.propertyCollector.RetrievePropertiesEx = \
+            Mock(return_value=self._page((self.vm1, {'name': 'vm1'})))
+
+        # act
+        res = self.pv_service.find_vms_by_uuids(self.si, ['uuid-1'])
+
+        # assert
+        self.assertEqual(res['uuid-1'].vm, self.vm1)
+        self.assertEqual(res['uuid-1'].devices, [])
+        self.si.content.propertyCollector.RetrievePropertiesEx.assert_called_once()
+        self.assertFalse(self.si.content.viewManager.CreateContainerView.called)
+
+    def test_find_vms_by_uuids_skips_vms_that_vanished(self):
+        # arrange
+        uuid_page = self._page((self.vm1, {'config.uuid': 'uuid-1'}))
+        self.si.content.propertyCollector.RetrievePropertiesEx = Mock(side_effect=[uuid_page, self._page()])
+
+        # act
+        res = self.pv_service.find_vms_by_uuids(self.si, ['uuid-1'])
+
+        # assert
+        self.assertEqual(res, {})
@@ -29,6 +29,7 @@ class TestDvPortGroupCreator(TestCase):
         dv_switch.portgroup = Mock()
         pyvmomy_service = Mock()
         pyvmomy_service.find_network_by_name = Mock(return_value=dv_switch)
+        pyvmomy_service.retrieve_referenced_properties = Mock(return_value=[])
         synchronous_task_waiter = Mock()
         dv_port_group_creator = DvPortGroupCreator(pyvmomy_service, synchronous_task_waiter)
         dv_port_group_create_task_prev = DvPortGroupCreator.__dict__['dv_port_group_create_task']
@@ -55,4 +56,143 @@ class TestDvPortGroupCreator(TestCase):
         dv_port_group_creator.dv_port_group_create_task('dv_port_name', dv_switch, spec, 1001)
 
         #assert
-        self.assertTrue(dv_switch.AddDVPortgroup_Task.called)
\ No newline at end of file
+        self.assertTrue(dv_switch.AddDVPortgroup_Task.called)
+
+    def test_get_or_create_network_returns_the_vm_network_without_lookup(self):
+        # arrange
+        network = Mock()
+        pyvmomy_service = Mock()
+        pyvmomy_service.get_network_by_name_from_vm = Mock(return_value=network)
+        dv_port_group_creator = DvPortGroupCreator(pyvmomy_service, Mock())
+
+        # act
+        res = dv_port_group_creator.get_or_create_network(Mock(), Mock(), 'QS_dvSwitch_VLAN_10_Access', 'dvSwitch',
+                                                          'QualiSB', 'QualiSB', 10, Mock())
+
+        # assert
+        self.assertEqual(res, network)
+        self.assertFalse(pyvmomy_service.find_network_by_name.called)
+
+    def test_get_or_create_network_creates_missing_port_group(self):
+        # arrange
+        network = vim.dvs.DistributedVirtualPortgroup('dvportgroup-1')
+        dv_switch = Mock()
+        pyvmomy_service = Mock()
+        pyvmomy_service.get_network_by_name_from_vm = Mock(return_value=None)
+        pyvmomy_service.find_network_by_name = Mock(return_value=dv_switch)
+        pyvmomy_service.retrieve_referenced_properties = Mock(side_effect=[
+            [],
+            [(network, {'name': 'QS_dvSwitch_VLAN_10_Access', 'key': 'dvportgroup-1'})]])
+        synchronous_task_waiter = Mock()
+        dv_port_group_creator = DvPortGroupCreator(pyvmomy_service, synchronous_task_waiter)
+        spec = create_autospec(spec=vim.dvs.VmwareDistributedVirtualSwitch.VlanSpec)
+
+        # act
+        res = dv_port_group_creator.get_or_create_network(Mock(), Mock(), 'QS_dvSwitch_VLAN_10_Access', 'dvSwitch',
+                                                          'QualiSB', 'QualiSB', 10, spec)
+
+        # assert
+        self.assertEqual(res, network)
+        self.assertTrue(dv_switch.AddDVPortgroup_Task.called)
+        self.assertTrue(synchronous_task_waiter.wait_for_task.called)
+
+    def test_get_or_create_network_raises_when_switch_is_missing(self):
+        # arrange
+        pyvmomy_service = Mock()
+        pyvmomy_service.get_network_by_name_from_vm = Mock(return_value=None)
+        pyvmomy_service.find_network_by_name = Mock(return_value=None)
+        dv_port_group_creator = DvPortGroupCreator(pyvmomy_service, Mock())
+
+        # act & assert
+        self.assertRaises(Exception, dv_port_group_creator.get_or_create_network, Mock(), Mock(),
+                          'QS_dvSwitch_VLAN_10_Access', 'dvSwitch', 'QualiSB', 'QualiSB', 10, Mock())
+
+    def test_get_or_create_network_uses_the_port_group_index(self):
+        # arrange
+        network = vim.dvs.DistributedVirtualPortgroup('dvportgroup-1')
+        pyvmomy_service = Mock()
+        pyvmomy_service.get_network_by_name_from_vm = Mock(return_value=None)
+        pyvmomy_service.find_network_by_name = Mock(return_value=Mock())
+        pyvmomy_service.retrieve_referenced_properties = Mock(
+            return_value=[(network, {'name': 'VLAN_10', 'key': 'dvportgroup-1'}),
+                          (vim.dvs.DistributedVirtualPortgroup('dvportgroup-2'), {'name': 'VLAN_20'})])
+        dv_port_group_creator = DvPortGroupCreator(pyvmomy_service, Mock())
+        si = Mock()
+
+        # act
+        first = dv_port_group_creator.get_or_create_network(si, Mock(), 'VLAN_10', 'dvSwitch', 'QualiSB', 'QualiSB',
+                                                            10, Mock())
+        second = dv_port_group_creator.get_or_create_network(si, Mock(), 'VLAN_20', 'dvSwitch', 'QualiSB', 'QualiSB',
+                                                             20, Mock())
+
+        # assert
+        self.assertEqual(first, network)
+        self.assertEqual(second, vim.dvs.DistributedVirtualPortgroup('dvportgroup-2'))
+        pyvmomy_service.retrieve_referenced_properties.assert_called_once()
+        pyvmomy_service.find_network_by_name.assert_called_once_with(si, 'QualiSB', 'dvSwitch')
+
+    def test_create_dv_port_group_tolerates_duplicate_name(self):
+        # arrange
+        pyvmomy_service = Mock()
+        pyvmomy_service.find_network_by_name = Mock(return_value=Mock())
+        pyvmomy_service.retrieve_referenced_properties = Mock(return_value=[])
+        synchronous_task_waiter = Mock()
+        synchronous_task_waiter.wait_for_task = Mock(side_effect=vim.fault.DuplicateName())
+        dv_port_group_creator = DvPortGroupCreator(pyvmomy_service, synchronous_task_waiter)
+        si = Mock()
+        dv_port_group_creator.port_group_index.find(si, 'dvSwitch', 'QualiSB', 'VLAN_10')
+
+        # act
+        dv_port_group_creator._create_dv_port_group('VLAN_10', 'dvSwitch', 'QualiSB', si,
+                                                    vim.dvs.VmwareDistributedVirtualSwitch.VlanIdSpec(), 10)
+        dv_port_group_creator.port_group_index.find(si, 'dvSwitch', 'QualiSB', 'VLAN_10')
+
+        # assert
+        self.assertEqual(pyvmomy_service.retrieve_referenced_properties.call_count, 2)
+
+    def test_get_or_create_port_groups_creates_missing_port_groups_in_one_task(self):
+        # arrange
+        existing = vim.dvs.DistributedVirtualPortgroup('dvportgroup-1')
+        created = vim.dvs.DistributedVirtualPortgroup('dvportgroup-2')
+        dv_switch = Mock()
+        pyvmomy_service = Mock()
+        pyvmomy_service.find_network_by_name = Mock(return_value=dv_switch)
+        pyvmomy_service.retrieve_referenced_properties = Mock(side_effect=[
+            [(existing, {'name': 'VLAN_10', 'key': 'dvportgroup-1'})],
+            [(existing, {'name': 'VLAN_10', 'key': 'dvportgroup-1'}),
+             (created, {'name': 'VLAN_20', 'key': 'dvportgroup-2'})]])
+        synchronous_task_waiter = Mock()
+        dv_port_group_creator = DvPortGroupCreator(pyvmomy_service, synchronous_task_waiter)
+        access = vim.dvs.VmwareDistributedVirtualSwitch.VlanIdSpec()
+
+        # act
+        res = dv_port_group_creator.get_or_create_port_groups(Mock(), 'dvSwitch', 'QualiSB',
+                                                              [('VLAN_10', 10, access),
+                                                               ('VLAN_20', 20, vim.dvs.VmwareDistributedVirtualSwitch.VlanIdSpec()),
+                                                               ('VLAN_20', 20, vim.dvs.VmwareDistributedVirtualSwitch.VlanIdSpec())])
+
+        # assert
+        self.assertEqual(res, {'VLAN_10': existing, 'VLAN_20': created})
+        dv_switch.AddDVPortgroup_Task.assert_called_once()
+        specs = dv_switch.AddDVPortgroup_Task.call_args[0][0]
+        self.assertEqual([spec.name for spec in specs], ['VLAN_20'])
+        self.assertEqual(specs[0].defaultPortConfig.vlan.vlanId, 20)
+        self.assertEqual(synchronous_task_waiter.wait_for_task.call_count, 1)
+
+    def test_get_or_create_port_groups_without_missing_port_groups(self):
+        # arrange
+        existing = vim.dvs.DistributedVirtualPortgroup('dvportgroup-1')
+        dv_switch = Mock()
+        pyvmomy_service = Mock()
+        pyvmomy_service.find_network_by_name = Mock(return_value=dv_switch)
+        pyvmomy_service.retrieve_referenced_properties = Mock(
+            return_value=[(existing, {'name': 'VLAN_10', 'key': 'dvportgroup-1'})])
+        dv_port_group_creator = DvPortGroupCreator(pyvmomy_service, Mock())
+
+        # act
+        res = dv_port_group_creator.get_or_create_port_groups(Mock(), 'dvSwitch', 'QualiSB',
+                                                              [('VLAN_10', 10, Mock())])
+
+        # assert
+        self.assertEqual(res, {'VLAN_10': existing})
+        self.assertFalse(dv_switch.AddDVPortgroup_Task.called)
@@ -0,0 +1,87 @@
+from unittest import TestCase
+
+from mock import Mock
+from pyVmomi import vim
+
+from vCenterShell.network.dvswitch.port_group_index import DvPortGroupIndex
+
+
+class TestDvPortGroupIndex(TestCase):
+    def setUp(self):
+        self.dv_switch = Mock()
+        self.port_group = vim.dvs.DistributedVirtualPortgroup('dvportgroup-1')
+        self.port_config = Mock()
+        self.port_config.vlan.vlanId = 10
+        self.pyvmomi_service = Mock()
+        self.pyvmomi_service.find_network_by_name = Mock(return_value=self.dv_switch)
+        self.pyvmomi_service.retrieve_referenced_properties = Mock(
+            return_value=[(self.port_group, {'name': 'VLAN_10',
+                                             'key': 'dvportgroup-1',
+                                             'config.defaultPortConfig': self.port_config})])
+        self.now = [0]
+        self.index = DvPortGroupIndex(self.pyvmomi_service, max_age=300, time_func=lambda: self.now[0])
+        self.si = Mock()
+
+    def test_find_reads_the_port_groups_once(self):
+        # act
+        entry = self.index.find(self.si, 'dvSwitch', 'QualiSB', 'VLAN_10')
+        missing = self.index.find(self.si, 'dvSwitch', 'QualiSB', 'VLAN_20')
+
+        # assert
+        self.assertEqual(entry.port_group, self.port_group)
+        self.assertEqual(entry.key, 'dvportgroup-1')
+        self.assertEqual(entry.vlan.vlanId, 10)
+        self.assertIsNone(missing)
+        self.pyvmomi_service.retrieve_referenced_properties.assert_called_once_with(
+            self.si.content, self.dv_switch, 'portgroup', vim.dvs.DistributedVirtualPortgroup,
+            ['name', 'key', 'config.defaultPortConfig'])
+
+    def test_invalidate_reads_again_without_looking_up_the_switch(self):
+        # arrange
+        self.index.find(self.si, 'dvSwitch', 'QualiSB', 'VLAN_10')
+
+        # act
+        self.index.invalidate('dvSwitch', 'QualiSB')
+        self.index.find(self.si, 'dvSwitch', 'QualiSB', 'VLAN_10')
+
+        # assert
+        self.assertEqual(self.pyvmomi_service.retrieve_referenced_properties.call_count, 2)
+        self.pyvmomi_service.find_network_by_name.assert_called_once()
+
+    def test_expired_index_is_read_again(self):
+        # arrange
+        self.index.find(self.si, 'dvSwitch', 'QualiSB', 'VLAN_10')
+
+        # act
+        self.now[0] = 301
+        self.index.find(self.si, 'dvSwitch', 'QualiSB', 'VLAN_10')
+
+        # assert
+        self.assertEqual(self.pyvmomi_service.retrieve_referenced_properties.call_count, 2)
+
+    def test_other_session_does_not_reuse_the_switch(self):
+        # arrange
+        self.index.find(self.si, 'dvSwitch', 'QualiSB', 'VLAN_10')
+
+        # act
+        self.index.find(Mock(), 'dvSwitch', 'QualiSB', 'VLAN_10')
+
+        # assert
+        self.assertEqual(self.pyvmomi_service.find_network_by_name.call_count, 2)
+
+    def test_forget(self):
+        # arrange
+        self.index.find(self.si, 'dvSwitch', 'QualiSB', 'VLAN_10')
+
+        # act
+        self.index.forget(vim.dvs.DistributedVirtualPortgroup('dvportgroup-1'))
+
+        # assert
+        self.assertIsNone(self.index.find(self.si, 'dvSwitch', 'QualiSB', 'VLAN_10'))
+
+    def test_missing_switch_raises(self):
+        # arrange
+        self.pyvmomi_service.find_network_by_name = Mock(return_value=None)
+
+        # act & assert
+        self.assertRaises(Exception, self.index.find, self.si, 'dvSwitch', 'QualiSB', 'VLAN_10')
@@ -9,3 +9,7 @@ class TestVlanSpecFactory(TestCase):
         vlan_spec_factory = VlanSpecFactory()
         vlan_spec = vlan_spec_factory.get_vlan_spec('Access')
         self.assertIsNotNone(vlan_spec)
+
+    def test_get_vlan_spec_returns_new_instance(self):
+        vlan_spec_factory = VlanSpecFactory()
+        self.assertIsNot(vlan_spec_factory.get_vlan_spec('Trunk'), vlan_spec_factory.get_vlan_spec('Trunk'))
@@ -66,6 +66,36 @@ class TestCommandOrchestrator(TestCase):
         self.assertIsNotNone(res)
         self.assertTrue(self.driver.command_orchestrator.destroy_vm.called_with(self.context, self.ports))
 
+    def test_destroy_vms(self):
+        res = self.driver.remote_destroy_vms(self.context, self.ports)
+
+        self.assertIsNotNone(res)
+        self.driver.command_orchestrator.destroy_vms.assert_called_once_with(self.context, self.ports)
+
+    def test_refresh_ips(self):
+        res = self.driver.remote_refresh_ips(self.context, self.ports)
+
+        self.assertIsNotNone(res)
+        self.driver.command_orchestrator.refresh_ips.assert_called_once_with(self.context, self.ports)
+
+    def test_power_on_vms(self):
+        res = self.driver.PowerOnVms(self.context, self.ports)
+
+        self.assertIsNotNone(res)
+        self.driver.command_orchestrator.power_on_vms.assert_called_once_with(self.context, self.ports)
+
+    def test_power_off_vms(self):
+        res = self.driver.PowerOffVms(self.context, self.ports)
+
+        self.assertIsNotNone(res)
+        self.driver.command_orchestrator.power_off_vms.assert_called_once_with(self.context, self.ports)
+
+    def test_power_cycle_vms(self):
+        res = self.driver.PowerCycleVms(self.context, self.ports)
+
+        self.assertIsNotNone(res)
+        self.driver.command_orchestrator.power_cycle_vms.assert_called_once_with(self.context, self.ports)
+
     def test_deploy_from_template(self):
         self.setUp()
         deploy_data = Mock()
@@ -76,6 +106,22 @@ class TestCommandOrchestrator(TestCase):
         self.assertTrue(self.driver.command_orchestrator.deploy_from_template.called_with(self.context,
                                                                                           deploy_data))
 
+    def test_deploy_from_templates(self):
+        deploy_data = Mock()
+
+        res = self.driver.deploy_from_templates(self.context, deploy_data)
+
+        self.assertIsNotNone(res)
+        self.driver.command_orchestrator.deploy_from_templates.assert_called_once_with(self.context, deploy_data)
+
+    def test_deploy_from_warm_pool(self):
+        deploy_data = Mock()
+
+        res = self.driver.deploy_from_warm_pool(self.context, deploy_data)
+
+        self.assertIsNotNone(res)
+        self.driver.command_orchestrator.deploy_from_warm_pool.assert_called_once_with(self.context, deploy_data)
+
     def test_deploy_from_image(self):
         self.setUp()
         deploy_data = Mock()
@@ -116,3 +162,8 @@ class TestCommandOrchestrator(TestCase):
 
         self.assertIsNotNone(res)
         self.assertTrue(self.driver.command_orchestrator.refresh_ip.called_with(self.context, self.ports))
+
+    def test_cleanup(self):
+        self.driver.cleanup()
+
+        self.assertTrue(self.driver.command_orchestrator.cleanup.called)
@@ -1,5 +1,6 @@
 from unittest import TestCase
 from mock import Mock
+from pyVmomi import vmodl
 from models.DeployDataHolder import DeployDataHolder
 from vCenterShell.vm.deploy import VirtualMachineDeployer
 
@@ -54,6 +55,120 @@ class TestVirtualMachineDeployer(TestCase):
                          params.template_model.vCenter_resource_name)
         self.assertTrue(self.pv_service.CloneVmParameters.called)
 
+    def test_vm_deployer_linked_clone(self):
+        params = DeployDataHolder({
+            "template_model": {
+                "vCenter_resource_name": "vcenter_resource_name",
+                "vm_folder": "vfolder_name",
+                "template_name": "template_name",
+                "app_name": "some_name",
+                "linked_clone": "True",
+                "snapshot_name": "base"
+            },
+            "vm_cluster_model": {
+                "cluster_name": "cluster_name",
+                "resource_pool": "resource_pool"
+            },
+            "datastore_name": "datastore_name",
+            "power_on": False,
+            'ip_regex': ''
+        })
+
+        self.deployer.deploy_from_template(self.si, params)
+
+        clone_params = self.pv_service.CloneVmParameters.call_args[1]
+        self.assertTrue(clone_params['linked_clone'])
+        self.assertEqual(clone_params['snapshot_name'], 'base')
+
+    def test_vm_deployer_instant_clone_falls_back_to_linked_clone(self):
+        params = DeployDataHolder({
+            "template_model": {
+                "vCenter_resource_name": "vcenter_resource_name",
+                "vm_folder": "vfolder_name",
+                "template_name": "template_name",
+                "app_name": "some_name"
+            },
+            "vm_cluster_model": {
+                "cluster_name": "cluster_name",
+                "resource_pool": "resource_pool"
+            },
+            "datastore_name": "datastore_name",
+            "power_on": False,
+            'ip_regex': ''
+        })
+        pool = Mock()
+        self.pv_service.supports_instant_clone = Mock(return_value=False)
+        deployer = VirtualMachineDeployer(self.pv_service, self.name_gen, self.image_deployer,
+                                          instant_clone_pool=pool)
+
+        res = deployer.deploy_instant_clone(self.si, params, Mock())
+
+        self.assertEqual(res.vm_uuid, self.uuid)
+        self.assertTrue(self.clone_parmas.linked_clone)
+        self.pv_service.clone_vm.assert_called_once_with(self.clone_parmas)
+        self.assertFalse(pool.fork.called)
+
+    def test_vm_deployer_instant_clone_forks_from_the_pool(self):
+        params = DeployDataHolder({
+            "template_model": {
+                "vCenter_resource_name": "vcenter_resource_name",
+                "vm_folder": "vfolder_name",
+                "template_name": "template_name",
+                "app_name": "some_name"
+            },
+            "vm_cluster_model": {
+                "cluster_name": "cluster_name",
+                "resource_pool": "resource_pool"
+            },
+            "datastore_name": "datastore_name",
+            "power_on": False,
+            'ip_regex': ''
+        })
+        pool = Mock()
+        pool.fork.return_value.summary.config.uuid = 'child uuid'
+        self.pv_service.supports_instant_clone = Mock(return_value=True)
+        deployer = VirtualMachineDeployer(self.pv_service, self.name_gen, self.image_deployer,
+                                          instant_clone_pool=pool)
+
+        connection_details = Mock()
+
+        res = deployer.deploy_instant_clone(self.si, params, connection_details)
+
+        self.assertEqual(res.vm_uuid, 'child uuid')
+        pool.fork.assert_called_once_with(self.si, self.clone_parmas, connection_details)
+        self.assertFalse(self.pv_service.clone_vm.called)
+
+    def test_vm_deployer_warm_pool_claims_or_clones(self):
+        params = DeployDataHolder({
+            "template_model": {
+                "vCenter_resource_name": "vcenter_resource_name",
+                "vm_folder": "vfolder_name",
+                "template_name": "template_name",
+                "app_name": "some_name"
+            },
+            "vm_cluster_model": {
+                "cluster_name": "cluster_name",
+                "resource_pool": "resource_pool"
+            },
+            "datastore_name": "datastore_name",
+            "power_on": False,
+            'ip_regex': ''
+        })
+        warm_vm = Mock()
+        warm_vm.summary.config.uuid = 'warm uuid'
+        pool = Mock()
+        pool.claim = Mock(side_effect=[warm_vm, None])
+        deployer = VirtualMachineDeployer(self.pv_service, self.name_gen, self.image_deployer, warm_vm_pool=pool)
+
+        connection_details = Mock()
+
+        claimed = deployer.deploy_from_warm_pool(self.si, params, connection_details)
+        cloned = deployer.deploy_from_warm_pool(self.si, params, connection_details)
+
+        self.assertEqual(claimed.vm_uuid, 'warm uuid')
+        self.assertEqual(cloned.vm_uuid, self.uuid)
+        self.pv_service.clone_vm.assert_called_once_with(self.clone_parmas)
+
     def test_vm_deployer_error(self):
         self.clone_res.error = Mock()
 
@@ -151,3 +266,100 @@ class TestVirtualMachineDeployer(TestCase):
         connectivity.password = 'password'
 
         self.assertRaises(Exception, self.deployer.deploy_from_image, self.si, params, connectivity)
+
+
+class TestBulkDeployFromTemplates(TestCase):
+    def setUp(self):
+        self.si = Mock()
+        self.pv_service = Mock()
+        self.tasks = []
+        self.running = []
+        self.peak = [0]
+
+        def start_clone_vm(params):
+            task = Mock()
+            task.vm_name = params
+            self.tasks.append(task)
+            self.running.append(task)
+            self.peak[0] = max(self.peak[0], len(self.running))
+            return Mock(error=None, task=task)
+
+        def as_completed(tasks, action_name):
+            # the last started clone completes first, the clones started meanwhile are appended to tasks
+            done = []
+            while len(done) < len(tasks):
+                task = [task for task in tasks if task not in done][-1]
+                done.append(task)
+                self.running.remove(task)
+                vm = Mock()
+                vm.summary.config.uuid = 'uuid-' + task.vm_name
+                yield Mock(task=task, succeeded=task.vm_name != 'app2', result=vm, error=Exception('clone failed'))
+
+        self.pv_service.CloneVmParameters = Mock(side_effect=lambda **kwargs: kwargs['vm_name'])
+        self.pv_service.start_clone_vm = Mock(side_effect=start_clone_vm)
+        self.pv_service.task_waiter.as_completed = Mock(side_effect=as_completed)
+        self.deployer = VirtualMachineDeployer(self.pv_service, lambda name: name, Mock(), max_concurrent_clones=2)
+
+    @staticmethod
+    def _data_holder(app_name):
+        return DeployDataHolder({
+            "template_model": {
+                "vCenter_resource_name": "vcenter_resource_name",
+                "vm_folder": "vfolder_name",
+                "template_name": "template_name",
+                "app_name": app_name
+            },
+            "vm_cluster_model": {
+                "cluster_name": "cluster_name",
+                "resource_pool": "resource_pool"
+            },
+            "datastore_name": "datastore_name",
+            "power_on": False,
+            'ip_regex': ''
+        })
+
+    def test_clones_run_together_up_to_the_limit(self):
+        # act
+        results = list(self.deployer.deploy_from_templates(self.si, [self._data_holder('app1'),
+                                                                     self._data_holder('app2'),
+                                                                     self._data_holder('app3')]))
+
+        # assert
+        self.assertEqual(self.peak[0], 2)
+        self.assertEqual([result.vm_name for result in results], ['app2', 'app3', 'app1'])
+        self.assertEqual(results[0].error_message, 'clone failed')
+        self.assertIsNone(results[0].vm_uuid)
+        self.assertEqual(results[1].vm_uuid, 'uuid-app3')
+        self.assertIsNone(results[1].error_message)
+        self.assertEqual(self.pv_service.task_waiter.as_completed.call_count, 1)
+
+    def test_removed_placement_is_invalidated(self):
+        # arrange
+        error = vmodl.fault.ManagedObjectNotFound()
+        self.pv_service.start_clone_vm = Mock(side_effect=error)
+
+        # act
+        results = list(self.deployer.deploy_from_templates(self.si, [self._data_holder('app1')]))
+
+        # assert
+        self.assertEqual(results[0].error_message, str(error))
+        self.pv_service.invalidate_placement_cache.assert_called_once_with(self.si, 'app1')
+
+    def test_clone_that_cannot_start_fails_only_its_app(self):
+        # arrange
+        self.pv_service.start_clone_vm = Mock(side_effect=[Mock(error='Failed to find folder: vfolder_name'),
+                                                           Mock(error=None, task=Mock(vm_name='app2'))])
+
+        def as_completed(tasks, action_name):
+            vm = Mock()
+            vm.summary.config.uuid = 'uuid'
+            yield Mock(task=tasks[0], succeeded=True, result=vm)
+        self.pv_service.task_waiter.as_completed = Mock(side_effect=as_completed)
+
+        # act
+        results = list(self.deployer.deploy_from_templates(self.si, [self._data_holder('app1'),
+                                                                     self._data_holder('app2')]))
+
+        # assert
+        self.assertEqual(results[0].error_message, 'Failed to find folder: vfolder_name')
+        self.assertEqual(results[1].vm_uuid, 'uuid')
@@ -0,0 +1,153 @@
+from threading import Event
+from unittest import TestCase
+
+from mock import Mock
+from pyVmomi import vmodl
+
+from common.vcenter.task_waiter import TaskTimeoutException
+from vCenterShell.vm.instant_clone_pool import InstantClonePool
+
+
+class TestInstantClonePool(TestCase):
+    def setUp(self):
+        self.si = Mock()
+        self.si.content.about.instanceUuid = 'vcenter-1'
+        self.connection_details = Mock()
+        self.session_pool = Mock()
+        self.session_pool.get_session = Mock(return_value=Mock())
+        self.pv_service = Mock()
+        self.pv_service.CloneVmParameters = Mock(side_effect=lambda **kwargs: Mock(**kwargs))
+        self.parents = []
+
+        def clone_vm(params):
+            self.parents.append(params)
+            return Mock(error=None, vm=Mock(_moId='vm-{0}'.format(len(self.parents))))
+        self.pv_service.clone_vm = Mock(side_effect=clone_vm)
+        self.pv_service.vim.VirtualMachine = Mock(side_effect=lambda vm_id, stub: Mock(_moId=vm_id))
+        self.pv_service.find_vm_by_name = Mock(return_value=None)
+        self.time_func = Mock(return_value=0)
+        self.pool = InstantClonePool(self.pv_service, self.session_pool, max_idle_time=100,
+                                     time_func=self.time_func, retire_interval=None)
+        self.clone_params = Mock(vm_folder='folder', template_name='template', datastore_name='datastore',
+                                 cluster_name='cluster', resource_pool='pool', snapshot_name=None)
+
+    def test_parent_is_created_once_and_forked(self):
+        # act
+        self.pool.fork(self.si, self.clone_params, self.connection_details)
+        self.pool.fork(self.si, self.clone_params, self.connection_details)
+
+        # assert
+        self.assertEqual(len(self.parents), 1)
+        self.assertTrue(self.parents[0].power_on)
+        self.assertTrue(self.parents[0].linked_clone)
+        self.assertEqual(self.pv_service.instant_clone_vm.call_count, 2)
+        self.assertTrue(self.pv_service.task_waiter.wait_for_property.called)
+
+    def test_parent_is_shared_by_the_sessions_of_its_vcenter(self):
+        # arrange
+        other_si = Mock()
+        other_si.content.about.instanceUuid = 'vcenter-1'
+
+        # act
+        self.pool.fork(self.si, self.clone_params, self.connection_details)
+        self.pool.fork(other_si, self.clone_params, self.connection_details)
+
+        # assert
+        self.assertEqual(len(self.parents), 1)
+        self.assertEqual(self.pv_service.vim.VirtualMachine.call_args[0], ('vm-1', other_si._stub))
+
+    def test_idle_parent_is_retired_with_a_session_of_its_vcenter(self):
+        # arrange
+        self.pool.fork(self.si, self.clone_params, self.connection_details)
+
+        # act
+        self.time_func.return_value = 50
+        self.pool.retire_idle()
+        destroyed_early = self.pv_service.destroy_vm.called
+        self.time_func.return_value = 100
+        self.pool.retire_idle()
+
+        # assert
+        self.assertFalse(destroyed_early)
+        self.assertEqual(self.pv_service.destroy_vm.call_args[0][0]._moId, 'vm-1')
+        self.session_pool.get_session.assert_called_once_with(self.connection_details)
+        self.session_pool.release_session.assert_called_once_with(self.connection_details, self.session_pool.get_session.return_value)
+
+    def test_retire_all_skips_the_parents_that_are_forking(self):
+        # arrange
+        self.pv_service.instant_clone_vm = Mock(side_effect=lambda parent, vm_name, placement:
+                                                self.pool.retire_all())
+
+        # act
+        self.pool.fork(self.si, self.clone_params, self.connection_details)
+        forking_retired = self.pv_service.destroy_vm.called
+        self.pool.retire_all()
+
+        # assert
+        self.assertFalse(forking_retired)
+        self.assertTrue(self.pv_service.destroy_vm.called)
+
+    def test_removed_parent_is_created_again(self):
+        # arrange
+        self.pv_service.instant_clone_vm = Mock(side_effect=[vmodl.fault.ManagedObjectNotFound(), Mock()])
+
+        # act
+        self.pool.fork(self.si, self.clone_params, self.connection_details)
+
+        # assert
+        self.assertEqual(len(self.parents), 2)
+        self.assertEqual(self.pv_service.instant_clone_vm.call_args[0][0]._moId, 'vm-2')
+
+    def test_parent_that_is_not_ready_is_destroyed(self):
+        # arrange
+        self.pv_service.task_waiter.wait_for_property = Mock(side_effect=TaskTimeoutException('timed out'))
+
+        # act
+        with self.assertRaises(TaskTimeoutException):
+            self.pool.fork(self.si, self.clone_params, self.connection_details)
+
+        # assert
+        self.assertEqual(self.pv_service.task_waiter.wait_for_property.call_args[1]['timeout'], 600)
+        self.assertEqual(self.pv_service.destroy_vm.call_args[0][0]._moId, 'vm-1')
+        self.assertFalse(self.pv_service.instant_clone_vm.called)
+
+    def test_running_parent_of_an_earlier_instance_is_used(self):
+        # arrange
+        self.pv_service.find_vm_by_name = Mock(return_value=Mock(_moId='vm-left', runtime=Mock(powerState='poweredOn')))
+
+        # act
+        self.pool.fork(self.si, self.clone_params, self.connection_details)
+
+        # assert
+        self.assertEqual(self.parents, [])
+        self.assertEqual(self.pv_service.instant_clone_vm.call_args[0][0]._moId, 'vm-left')
+        folder, name = self.pv_service.find_vm_by_name.call_args[0][1:]
+        self.assertEqual(folder, 'folder')
+        self.assertTrue(name.startswith('template instant clone parent '))
+
+    def test_parent_is_named_after_its_template_and_placement(self):
+        # act
+        self.pool.fork(self.si, self.clone_params, self.connection_details)
+        self.pool.retire_all()
+        self.pool.fork(self.si, self.clone_params, self.connection_details)
+        self.clone_params.datastore_name = 'other datastore'
+        self.pool.fork(self.si, self.clone_params, self.connection_details)
+
+        # assert
+        names = [params.vm_name for params in self.parents]
+        self.assertEqual(names[0], names[1])
+        self.assertNotEqual(names[0], names[2])
+
+    def test_idle_parents_are_retired_periodically(self):
+        # arrange
+        retired = Event()
+        self.pv_service.destroy_vm = Mock(side_effect=lambda vm: retired.set())
+        pool = InstantClonePool(self.pv_service, self.session_pool, max_idle_time=0, retire_interval=0.01)
+
+        # act
+        pool.fork(self.si, self.clone_params, self.connection_details)
+        retired.wait(5)
+        pool.retire_all()
+
+        # assert
+        self.assertTrue(retired.is_set())
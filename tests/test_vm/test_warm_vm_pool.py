@@ -0,0 +1,152 @@
+from collections import deque
+from unittest import TestCase
+
+from mock import Mock
+from pyVmomi import vim, vmodl
+
+from vCenterShell.vm.warm_vm_pool import WarmVmPool
+
+
+class TestWarmVmPool(TestCase):
+    def setUp(self):
+        self.si = Mock()
+        self.si.content.about.instanceUuid = 'vcenter-1'
+        self.refill_si = Mock()
+        self.connection_details = Mock()
+        self.session_pool = Mock()
+        self.session_pool.get_session = Mock(return_value=self.refill_si)
+        self.pv_service = Mock()
+        self.pv_service.CloneVmParameters = Mock(side_effect=lambda **kwargs: Mock(**kwargs))
+        self.clones = []
+
+        def start_clone_vm(params):
+            self.clones.append(params)
+            return Mock(error=None, task=Mock(vm=Mock(_moId='vm-{0}'.format(len(self.clones)))))
+        self.pv_service.start_clone_vm = Mock(side_effect=start_clone_vm)
+        self.pv_service.wait_for_task = Mock(side_effect=lambda task: task.vm)
+        self.pv_service.vim.VirtualMachine = Mock(side_effect=lambda vm_id, stub: Mock(_moId=vm_id))
+        self.pool = WarmVmPool(self.pv_service, lambda name: name, self.session_pool, target_size=2)
+        self.clone_params = Mock(vm_name='app', vm_folder='folder', template_name='template',
+                                 datastore_name='datastore', cluster_name='cluster', resource_pool='pool',
+                                 linked_clone=False, snapshot_name=None, power_on=True)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def _fill(self, *vm_ids):
+        self.pool._pools[self.pool._get_key(self.si, self.clone_params)] = deque(vm_ids)
+
+    def test_miss_refills_the_pool_with_a_session_of_its_own(self):
+        # act
+        vm = self.pool.claim(self.si, self.clone_params, self.connection_details)
+        self.pool.shutdown()
+
+        # assert
+        self.assertIsNone(vm)
+        self.assertEqual(len(self.clones), 2)
+        self.assertFalse(self.clones[0].power_on)
+        self.assertEqual(self.clones[0].si, self.refill_si)
+        self.session_pool.get_session.assert_called_once_with(self.connection_details)
+        self.session_pool.release_session.assert_called_once_with(self.connection_details, self.refill_si)
+        stats = self.pool.get_stats()[0]
+        self.assertEqual((stats.template_name, stats.size, stats.target, stats.misses), ('template', 2, 2, 1))
+
+    def test_warm_vm_whose_clone_failed_is_reported_as_orphan(self):
+        # arrange
+        self.pv_service.wait_for_task = Mock(side_effect=Exception('session logged out'))
+
+        # act
+        self.pool.claim(self.si, self.clone_params, self.connection_details)
+        self.pool.shutdown()
+
+        # assert
+        stats = self.pool.get_stats()[0]
+        self.assertEqual(stats.orphans, ['template warm'])
+        self.assertEqual(stats.cloning, [])
+        self.assertEqual(stats.size, 0)
+
+    def test_claim_renames_moves_and_powers_on_a_warm_vm(self):
+        # arrange
+        self._fill('vm-9')
+        placement = self.pv_service.resolve_clone_placement.return_value
+
+        # act
+        vm = self.pool.claim(self.si, self.clone_params, self.connection_details)
+        self.pool.shutdown()
+
+        # assert
+        self.assertEqual(vm._moId, 'vm-9')
+        vm.Rename_Task.assert_called_once_with(newName='app')
+        placement.dest_folder.MoveIntoFolder_Task.assert_called_once_with(list=[vm])
+        self.assertTrue(vm.PowerOnVM_Task.called)
+        stats = self.pool.get_stats()[0]
+        self.assertEqual((stats.hits, stats.misses, stats.hit_rate), (1, 0, 1.0))
+
+    def test_removed_warm_vm_is_dropped(self):
+        # arrange
+        self._fill('vm-8', 'vm-9')
+        self.pv_service.wait_for_task = Mock(side_effect=[vmodl.fault.ManagedObjectNotFound(), None, None, None])
+
+        # act
+        vm = self.pool.claim(self.si, self.clone_params, self.connection_details)
+
+        # assert
+        self.assertEqual(vm._moId, 'vm-9')
+        self.assertFalse(self.pv_service.destroy_vm.called)
+
+    def test_warm_vm_in_invalid_state_is_destroyed(self):
+        # arrange
+        self._fill('vm-8', 'vm-9')
+        self.pv_service.wait_for_task = Mock(side_effect=[vim.fault.InvalidState(), None, None, None])
+
+        # act
+        vm = self.pool.claim(self.si, self.clone_params, self.connection_details)
+
+        # assert
+        self.assertEqual(vm._moId, 'vm-9')
+        self.assertEqual(self.pv_service.destroy_vm.call_args[0][0]._moId, 'vm-8')
+
+    def test_warm_vm_is_kept_when_the_rename_fails_for_the_app(self):
+        # arrange
+        self._fill('vm-8', 'vm-9')
+        self.pv_service.wait_for_task = Mock(side_effect=vim.fault.DuplicateName())
+
+        # act & assert
+        self.assertRaises(vim.fault.DuplicateName, self.pool.claim, self.si, self.clone_params,
+                          self.connection_details)
+        self.assertFalse(self.pv_service.destroy_vm.called)
+        self.assertEqual(list(self.pool._pools[self.pool._get_key(self.si, self.clone_params)])[:2],
+                         ['vm-8', 'vm-9'])
+
+    def test_destroy_all_destroys_the_warm_vms_and_the_orphans(self):
+        # arrange
+        self.pv_service.wait_for_task = Mock(side_effect=Exception('session logged out'))
+        self.pool.claim(self.si, self.clone_params, self.connection_details)
+        self.pool.shutdown()
+        self._fill('vm-9')
+        orphan = Mock()
+        self.pv_service.find_vm_by_name = Mock(return_value=orphan)
+        self.session_pool.get_session.reset_mock()
+        self.session_pool.release_session.reset_mock()
+
+        # act
+        self.pool.destroy_all()
+
+        # assert
+        destroyed = [call[0][0] for call in self.pv_service.destroy_vm.call_args_list]
+        self.assertEqual(destroyed[0]._moId, 'vm-9')
+        self.assertIs(destroyed[1], orphan)
+        self.pv_service.find_vm_by_name.assert_called_once_with(self.refill_si, 'folder', 'template warm')
+        self.session_pool.get_session.assert_called_once_with(self.connection_details)
+        self.session_pool.release_session.assert_called_once_with(self.connection_details, self.refill_si)
+        stats = self.pool.get_stats()[0]
+        self.assertEqual((stats.size, stats.orphans), (0, []))
+
+    def test_claimed_vm_that_cannot_be_powered_on_is_kept(self):
+        # arrange
+        self._fill('vm-9')
+        self.pv_service.wait_for_task = Mock(side_effect=[None, None, Exception('not enough memory')])
+
+        # act & assert
+        self.assertRaises(Exception, self.pool.claim, self.si, self.clone_params, self.connection_details)
+        self.assertFalse(self.pv_service.destroy_vm.called)
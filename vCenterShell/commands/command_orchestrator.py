@@ -1,15 +1,17 @@
 from logging import getLogger
 
 import jsonpickle
-import time
+from threading import Lock
 from pyVim.connect import SmartConnect, Disconnect
 
 from common.cloud_shell.driver_helper import CloudshellDriverHelper
 from common.cloud_shell.resource_remover import CloudshellResourceRemover
 from common.model_factory import ResourceModelParser
+from common.utilites.bounded_executor import BoundedExecutor
 from common.utilites.command_result import set_command_result
 from common.utilites.common_name import generate_unique_name
 from common.vcenter.ovf_service import OvfImageDeployerService
+from common.vcenter.session_pool import VCenterSessionPool
 from common.vcenter.task_waiter import SynchronousTaskWaiter
 from common.vcenter.vmomi_service import pyVmomiService
 from common.wrappers.command_wrapper import CommandWrapper
@@ -18,12 +20,14 @@ from models.DriverResponse import DriverResponse, DriverResponseRoot
 from models.GenericDeployedAppResourceModel import GenericDeployedAppResourceModel
 from models.VMwarevCenterResourceModel import VMwarevCenterResourceModel
 from vCenterShell.commands.connect_dvswitch import VirtualSwitchConnectCommand
-from vCenterShell.commands.connect_orchestrator import ConnectionCommandOrchestrator
+from vCenterShell.commands.connect_orchestrator import ConnectionCommandOrchestrator, MAX_CONCURRENT_VCENTER_CALLS
 from vCenterShell.commands.deploy_vm import DeployCommand
 from vCenterShell.commands.destroy_vm import DestroyVirtualMachineCommand
 from vCenterShell.commands.disconnect_dvswitch import VirtualSwitchToMachineDisconnectCommand
 from vCenterShell.commands.power_manager_vm import VirtualMachinePowerManagementCommand
 from vCenterShell.commands.refresh_ip import RefreshIpCommand
+from vCenterShell.vm.instant_clone_pool import InstantClonePool
+from vCenterShell.vm.warm_vm_pool import WarmVmPool
 from vCenterShell.network.dvswitch.creator import DvPortGroupCreator
 from vCenterShell.network.dvswitch.name_generator import DvPortGroupNameGenerator
 from vCenterShell.network.vlan.factory import VlanSpecFactory
@@ -54,20 +58,37 @@ class CommandOrchestrator(object):
         resource_remover = CloudshellResourceRemover()
         ovf_service = OvfImageDeployerService(self.vc_data_model.ovf_tool_path, getLogger('OvfImageDeployerService'))
 
+        # vCenter sessions are kept alive for the lifetime of the driver instance,
+        # every session follows the inventory changes so lookups do not go to the vCenter
+        self.session_pool = VCenterSessionPool(pv_service=pv_service,
+                                               on_session_created=pv_service.start_inventory_cache)
+        # running parents the instant clone deploys fork from, kept for the lifetime of the driver instance
+        self.instant_clone_pool = InstantClonePool(pv_service=pv_service, session_pool=self.session_pool)
+        # powered off clones the warm pool deploys claim, refilled in the background
+        self.warm_vm_pool = WarmVmPool(pv_service=pv_service, name_generator=generate_unique_name,
+                                       session_pool=self.session_pool)
         vm_deployer = VirtualMachineDeployer(pv_service=pv_service,
                                              name_generator=generate_unique_name,
-                                             ovf_service=ovf_service)
+                                             ovf_service=ovf_service,
+                                             instant_clone_pool=self.instant_clone_pool,
+                                             warm_vm_pool=self.warm_vm_pool)
         dv_port_group_creator = DvPortGroupCreator(pyvmomi_service=pv_service,
                                                    synchronous_task_waiter=synchronous_task_waiter)
         virtual_machine_port_group_configurer = \
             VirtualMachinePortGroupConfigurer(pyvmomi_service=pv_service,
                                               synchronous_task_waiter=synchronous_task_waiter,
                                               vnic_to_network_mapper=vnic_to_network_mapper,
-                                              vnic_service=VNicService())
+                                              vnic_service=VNicService(),
+                                              dv_port_group_creator=dv_port_group_creator)
         virtual_switch_to_machine_connector = VirtualSwitchToMachineConnector(dv_port_group_creator,
                                                                               virtual_machine_port_group_configurer)
+        # worker threads of the driver instance, shared by the commands that fan out over many vms
+        self.executor = BoundedExecutor(MAX_CONCURRENT_VCENTER_CALLS)
+        # the connection details are decrypted once, the password is the one of the resource model
+        self._connection_details = dict()
+        self._connection_details_lock = Lock()
         # Command Wrapper
-        self.command_wrapper = CommandWrapper(logger=getLogger, pv_service=pv_service)
+        self.command_wrapper = CommandWrapper(logger=getLogger, pv_service=pv_service, session_pool=self.session_pool)
         # Deploy Command
         self.deploy_command = DeployCommand(deployer=vm_deployer)
 
@@ -89,25 +110,30 @@ class CommandOrchestrator(object):
                 logger=getLogger('VirtualSwitchConnectCommand'))
         self.connection_orchestrator = ConnectionCommandOrchestrator(self.vc_data_model,
                                                                      virtual_switch_connect_command,
-                                                                     self.virtual_switch_disconnect_command)
+                                                                     self.virtual_switch_disconnect_command,
+                                                                     pv_service,
+                                                                     virtual_machine_port_group_configurer,
+                                                                     executor=self.executor)
 
         # Destroy VM Command
         self.destroy_virtual_machine_command = \
             DestroyVirtualMachineCommand(pv_service=pv_service,
                                          resource_remover=resource_remover,
-                                         disconnector=self.virtual_switch_disconnect_command)
+                                         disconnector=self.virtual_switch_disconnect_command,
+                                         synchronous_task_waiter=synchronous_task_waiter)
         # Power Command
         self.vm_power_management_command = \
             VirtualMachinePowerManagementCommand(pyvmomi_service=pv_service,
                                                  synchronous_task_waiter=synchronous_task_waiter)
         # Refresh IP command
         self.refresh_ip_command = RefreshIpCommand(pyvmomi_service=pv_service,
-                                                   resource_model_parser=ResourceModelParser())
+                                                   resource_model_parser=ResourceModelParser(),
+                                                   synchronous_task_waiter=synchronous_task_waiter)
 
     def connect_bulk(self, context, request):
         session = self.cs_helper.get_session(context.connectivity.server_address, context.connectivity.admin_auth_token,
                                              context.reservation.domain)
-        connection_details = self.cs_helper.get_connection_details(session, self.vc_data_model, context.resource)
+        connection_details = self._get_connection_details(session, context.resource)
 
         results = self.command_wrapper.execute_command_with_connection(connection_details,
                                                                        self.connection_orchestrator.connect_bulk,
@@ -144,8 +170,7 @@ class CommandOrchestrator(object):
         session = self.cs_helper.get_session(context.connectivity.server_address, context.connectivity.admin_auth_token,
                                              context.reservation.domain)
 
-        connection_details = self.cs_helper.get_connection_details(session, self.vc_data_model,
-                                                                           context.resource)
+        connection_details = self._get_connection_details(session, context.resource)
 
         # get command parameters from the environment
         data = jsonpickle.decode(deploy_data)
@@ -159,6 +184,92 @@ class CommandOrchestrator(object):
 
         return set_command_result(result=result, unpicklable=False)
 
+    def deploy_instant_clone(self, context, deploy_data):
+        """
+        Deploy Instant Clone Command, will fork the vm from a running parent of the template,
+        or deploy a linked clone when the vCenter or pyVmomi are older than 6.7 (requirements.txt pins
+        pyVmomi 6.0.0, which has no instant clone)
+
+        :param models.QualiDriverModels.ResourceCommandContext context: the context of the command
+        :param str deploy_data: represent a json of the deploy_from_template parameters
+        :return str deploy results
+        """
+        session = self.cs_helper.get_session(context.connectivity.server_address,
+                                             context.connectivity.admin_auth_token,
+                                             context.reservation.domain)
+        connection_details = self._get_connection_details(session, context.resource)
+
+        # get command parameters from the environment
+        data_holder = DeployDataHolder(jsonpickle.decode(deploy_data))
+
+        # execute command
+        result = self.command_wrapper.execute_command_with_connection(
+            connection_details,
+            self.deploy_command.execute_deploy_instant_clone,
+            data_holder,
+            connection_details)
+
+        return set_command_result(result=result, unpicklable=False)
+
+    def deploy_from_warm_pool(self, context, deploy_data):
+        """
+        Deploy From Warm Pool Command, will claim a powered off clone of the template that was prepared ahead,
+        or clone the template when there is none
+
+        :param models.QualiDriverModels.ResourceCommandContext context: the context of the command
+        :param str deploy_data: represent a json of the deploy_from_template parameters
+        :return str deploy results
+        """
+        session = self.cs_helper.get_session(context.connectivity.server_address,
+                                             context.connectivity.admin_auth_token,
+                                             context.reservation.domain)
+        connection_details = self._get_connection_details(session, context.resource)
+
+        # get command parameters from the environment
+        data_holder = DeployDataHolder(jsonpickle.decode(deploy_data))
+
+        # execute command
+        result = self.command_wrapper.execute_command_with_connection(
+            connection_details,
+            self.deploy_command.execute_deploy_from_warm_pool,
+            data_holder,
+            connection_details)
+
+        return set_command_result(result=result, unpicklable=False)
+
+    def get_warm_pool_stats(self, context):
+        """
+        Get Warm Pool Stats Command, the size, target and hit rate of every warm pool of the driver instance
+
+        :param models.QualiDriverModels.ResourceCommandContext context: the context of the command
+        :return str the stats of the warm pools
+        """
+        return set_command_result(result=self.deploy_command.get_warm_pool_stats(), unpicklable=False)
+
+    def deploy_from_templates(self, context, deploy_data):
+        """
+        Deploy From Templates Command, will clone many vms together in one vCenter session
+
+        :param models.QualiDriverModels.ResourceCommandContext context: the context of the command
+        :param str deploy_data: represent a json list of deploy_from_template parameters
+        :return str deploy results, one for each app in the order the deploys complete
+        """
+        session = self.cs_helper.get_session(context.connectivity.server_address,
+                                             context.connectivity.admin_auth_token,
+                                             context.reservation.domain)
+        connection_details = self._get_connection_details(session, context.resource)
+
+        # get command parameters from the environment
+        data_holders = [DeployDataHolder(data) for data in jsonpickle.decode(deploy_data)]
+
+        # execute command
+        result = self.command_wrapper.execute_command_with_connection(
+            connection_details,
+            self.deploy_command.execute_deploy_from_templates,
+            data_holders)
+
+        return set_command_result(result=result, unpicklable=False)
+
     def deploy_from_image(self, context, deploy_data):
         """
         Deploy From Image Command, will deploy vm from ovf image
@@ -182,7 +293,7 @@ class CommandOrchestrator(object):
         session = self.cs_helper.get_session(context.connectivity.server_address,
                                              context.connectivity.admin_auth_token,
                                              context.reservation.domain)
-        connection_details = self.cs_helper.get_connection_details(session,  self.vc_data_model, context.resource)
+        connection_details = self._get_connection_details(session, context.resource)
 
         # get command parameters from the environment
         data = jsonpickle.decode(deploy_data)
@@ -210,7 +321,7 @@ class CommandOrchestrator(object):
         session = self.cs_helper.get_session(context.connectivity.server_address,
                                              context.connectivity.admin_auth_token,
                                              context.remote_reservation.domain)
-        connection_details = self.cs_helper.get_connection_details(session, self.vc_data_model, context.resource)
+        connection_details = self._get_connection_details(session, context.resource)
 
         resource_details = self._parse_remote_model(context)
 
@@ -236,7 +347,7 @@ class CommandOrchestrator(object):
         session = self.cs_helper.get_session(context.connectivity.server_address,
                                              context.connectivity.admin_auth_token,
                                              context.remote_reservation.domain)
-        connection_details = self.cs_helper.get_connection_details(session, self.vc_data_model, context.resource)
+        connection_details = self._get_connection_details(session, context.resource)
 
         resource_details = self._parse_remote_model(context)
 
@@ -259,7 +370,7 @@ class CommandOrchestrator(object):
         # get connection details
         session = self.cs_helper.get_session(context.connectivity.server_address, context.connectivity.admin_auth_token,
                                              context.remote_reservation.domain)
-        connection_details = self.cs_helper.get_connection_details(session, self.vc_data_model, context.resource)
+        connection_details = self._get_connection_details(session, context.resource)
 
         resource_details = self._parse_remote_model(context)
 
@@ -272,6 +383,30 @@ class CommandOrchestrator(object):
             resource_details.fullname)
         return set_command_result(result=res, unpicklable=False)
 
+    # remote command
+    def destroy_vms(self, context, ports):
+        """
+        Destroy Vms Command, will destroy the vms of all the remote resources together and remove their resources
+
+        :param models.QualiDriverModels.ResourceRemoteCommandContext context: the context the command runs on
+        :param list[string] ports: the ports of the connection between the remote resource and the local resource, NOT IN USE!!!
+        """
+        # get connection details
+        session = self.cs_helper.get_session(context.connectivity.server_address, context.connectivity.admin_auth_token,
+                                             context.remote_reservation.domain)
+        connection_details = self._get_connection_details(session, context.resource)
+
+        vms = [(resource_details.vm_uuid, resource_details.fullname)
+               for resource_details in self._parse_remote_models(context)]
+
+        # execute command
+        res = self.command_wrapper.execute_command_with_connection(
+            connection_details,
+            self.destroy_virtual_machine_command.destroy_vms,
+            session,
+            vms)
+        return set_command_result(result=res, unpicklable=False)
+
     # remote command
     def refresh_ip(self, context, ports):
         """
@@ -284,7 +419,7 @@ class CommandOrchestrator(object):
         session = self.cs_helper.get_session(context.connectivity.server_address,
                                              context.connectivity.admin_auth_token,
                                              context.remote_reservation.domain)
-        connection_details = self.cs_helper.get_connection_details(session, self.vc_data_model, context.resource)
+        connection_details = self._get_connection_details(session, context.resource)
 
         resource_details = self._parse_remote_model(context)
 
@@ -297,6 +432,32 @@ class CommandOrchestrator(object):
                                                                    self.vc_data_model.holding_network)
         return set_command_result(result=res, unpicklable=False)
 
+    # remote command
+    def refresh_ips(self, context, ports):
+        """
+        Refresh IPs Command, will follow the ips of the vms of all the remote resources together and will update
+        every resource as soon as its ip is known
+
+        :param models.QualiDriverModels.ResourceRemoteCommandContext context: the context the command runs on
+        :param list[string] ports: the ports of the connection between the remote resource and the local resource, NOT IN USE!!!
+        """
+        # get connection details
+        session = self.cs_helper.get_session(context.connectivity.server_address,
+                                             context.connectivity.admin_auth_token,
+                                             context.remote_reservation.domain)
+        connection_details = self._get_connection_details(session, context.resource)
+
+        vms = [(resource_details.vm_uuid, resource_details.fullname)
+               for resource_details in self._parse_remote_models(context)]
+
+        # execute command
+        res = self.command_wrapper.execute_command_with_connection(connection_details,
+                                                                   self.refresh_ip_command.refresh_ips,
+                                                                   session,
+                                                                   vms,
+                                                                   self.vc_data_model.holding_network)
+        return set_command_result(result=res, unpicklable=False)
+
     # remote command
     def power_off(self, context, ports):
         """
@@ -318,14 +479,54 @@ class CommandOrchestrator(object):
     # remote command
     def power_cycle(self, context, ports, delay):
         """
-        preforms a restart to the vm
+        preforms a restart to the vm in one vCenter session, the power on follows as soon as the vCenter reports
+        the vm is powered off
+        :param models.QualiDriverModels.ResourceRemoteCommandContext context: the context the command runs on
+        :param list[string] ports: the ports of the connection between the remote resource and the local resource, NOT IN USE!!!
+        :param number delay: kept for the driver signature, the restart no longer sleeps between the power off and on
+        """
+        return self._power_command(context, ports, self.vm_power_management_command.power_cycle)
+
+    # remote command
+    def power_on_vms(self, context, ports):
+        """
+        Powers on the vms of all the remote resources together
         :param models.QualiDriverModels.ResourceRemoteCommandContext context: the context the command runs on
         :param list[string] ports: the ports of the connection between the remote resource and the local resource, NOT IN USE!!!
-        :param number delay: the time to wait between the power on and off
         """
-        self.power_off(context, ports)
-        time.sleep(float(delay))
-        return self.power_on(context, ports)
+        return self._bulk_power_command(context, self.vm_power_management_command.power_on_vms)
+
+    # remote command
+    def power_off_vms(self, context, ports):
+        """
+        Powers off the vms of all the remote resources together
+        :param models.QualiDriverModels.ResourceRemoteCommandContext context: the context the command runs on
+        :param list[string] ports: the ports of the connection between the remote resource and the local resource, NOT IN USE!!!
+        """
+        return self._bulk_power_command(context, self.vm_power_management_command.power_off_vms)
+
+    # remote command
+    def power_cycle_vms(self, context, ports):
+        """
+        Powers off the vms of all the remote resources together and then powers them on together
+        :param models.QualiDriverModels.ResourceRemoteCommandContext context: the context the command runs on
+        :param list[string] ports: the ports of the connection between the remote resource and the local resource, NOT IN USE!!!
+        """
+        return self._bulk_power_command(context, self.vm_power_management_command.power_cycle_vms)
+
+    def _bulk_power_command(self, context, command):
+        # get connection details
+        session = self.cs_helper.get_session(context.connectivity.server_address,
+                                             context.connectivity.admin_auth_token,
+                                             context.remote_reservation.domain)
+        connection_details = self._get_connection_details(session, context.resource)
+
+        vms = [(resource_details.vm_uuid, resource_details.fullname)
+               for resource_details in self._parse_remote_models(context)]
+
+        # execute command
+        res = self.command_wrapper.execute_command_with_connection(connection_details, command, session, vms)
+        return set_command_result(result=res, unpicklable=False)
 
     def _power_command(self, context, ports, command):
         # get connection details
@@ -333,7 +534,7 @@ class CommandOrchestrator(object):
                                              context.connectivity.admin_auth_token,
                                              context.remote_reservation.domain)
 
-        connection_details = self.cs_helper.get_connection_details(session, self.vc_data_model, context.resource)
+        connection_details = self._get_connection_details(session, context.resource)
 
         resource_details = self._parse_remote_model(context)
 
@@ -345,6 +546,33 @@ class CommandOrchestrator(object):
                                                                    resource_details.fullname)
         return set_command_result(result=res, unpicklable=False)
 
+    def _get_connection_details(self, session, resource):
+        """
+        the vCenter connection details of the resource, the password is decrypted on the first command only
+        :param CloudShellAPISession session:
+        :param ResourceContextDetails resource: the vCenter resource of the command
+        """
+        key = (getattr(resource, 'address', None), self.vc_data_model.user, self.vc_data_model.password)
+        with self._connection_details_lock:
+            connection_details = self._connection_details.get(key)
+        if connection_details is None:
+            connection_details = self.cs_helper.get_connection_details(session, self.vc_data_model, resource)
+            with self._connection_details_lock:
+                self._connection_details[key] = connection_details
+        return connection_details
+
+    def cleanup(self):
+        """
+        Releases the state the driver instance kept between commands:
+        stops the worker threads, destroys the warm vms, retires the instant clone parents
+        and logs out the pooled vCenter sessions
+        """
+        self.executor.shutdown()
+        self.warm_vm_pool.shutdown()
+        self.warm_vm_pool.destroy_all()
+        self.instant_clone_pool.retire_all()
+        self.session_pool.close_all()
+
     def _parse_remote_model(self, context):
         """
         parse the remote resource model and adds its full name
@@ -353,8 +581,19 @@ class CommandOrchestrator(object):
         """
         if not context.remote_endpoints:
             raise Exception('no remote resources found in context: {0}', jsonpickle.encode(context, unpicklable=False))
-        resource = context.remote_endpoints[0]
+        return self._parse_remote_resource(context, context.remote_endpoints[0])
+
+    def _parse_remote_models(self, context):
+        """
+        parse the models of all the remote resources of the context
+        :type context: models.QualiDriverModels.ResourceRemoteCommandContext
+        """
+        if not context.remote_endpoints:
+            raise Exception('no remote resources found in context: {0}', jsonpickle.encode(context, unpicklable=False))
+        return [self._parse_remote_resource(context, resource) for resource in context.remote_endpoints]
 
+    @staticmethod
+    def _parse_remote_resource(context, resource):
         dictionary = jsonpickle.decode(resource.app_context.deployed_app_json)
         holder = DeployDataHolder(dictionary)
         app_resource_detail = GenericDeployedAppResourceModel()
@@ -367,7 +606,7 @@ class CommandOrchestrator(object):
         # get connection details
         session = self.cs_helper.get_session(context.connectivity.server_address, context.connectivity.admin_auth_token,
                                              context.reservation.domain)
-        connection_details = self.cs_helper.get_connection_details(session, self.vc_data_model, context.resource)
+        connection_details = self._get_connection_details(session, context.resource)
 
         res = self.command_wrapper.execute_command_with_connection(connection_details,
                                                                    self.vm_power_management_command.power_on,
@@ -25,16 +25,18 @@ class VirtualSwitchConnectCommand:
         self.vlan_id_range_parser = vlan_id_range_parser
         self.logger = logger
 
-    def connect_to_networks(self, si, vm_uuid, vm_network_mappings, default_network_name):
+    def connect_to_networks(self, si, vm_uuid, vm_network_mappings, default_network_name, vm=None):
         """
         Connect VM to Network
         :param si: VmWare Service Instance - defined connection to vCenter
         :param vm_uuid: <str> UUID for VM
         :param vm_network_mappings: <collection of 'VmNetworkMapping'>
         :param default_network_name: <str> Full Network name - likes 'DataCenterName/NetworkName'
+        :param <pyvmomi vm object> vm: If the vm obj is None will use vm_uuid to fetch the object
         :return: None
         """
-        vm = self.pv_service.find_by_uuid(si, vm_uuid)
+        if vm is None:
+            vm = self.pv_service.find_by_uuid(si, vm_uuid)
 
         if not vm:
             raise ValueError('VM having UUID {0} not found'.format(vm_uuid))
@@ -60,6 +62,30 @@ class VirtualSwitchConnectCommand:
 
         return connection_results
 
+    def create_port_groups(self, si, vm_network_mappings):
+        """
+        Gets or creates the port groups of many VMs together, with one creation task per dvSwitch
+        :param si: VmWare Service Instance - defined connection to vCenter
+        :param vm_network_mappings: <collection of 'VmNetworkMapping'>
+        :return: <dict of port group name to port group>
+        """
+        mappings = self._prepare_mappings(vm_network_mappings)
+        return self.virtual_switch_to_machine_connector.create_port_groups(si, mappings)
+
+    def create_connect_requests(self, si, vm, vm_network_mappings, port_groups=None, vm_network_view=None):
+        """
+        Gets or creates the port groups the VM should be connected to, the VM itself is not changed
+        :param si: VmWare Service Instance - defined connection to vCenter
+        :param vm: vim.VirtualMachine
+        :param vm_network_mappings: <collection of 'VmNetworkMapping'>
+        :param port_groups: <dict of port group name to port group> created already by create_port_groups
+        :param vm_network_view: <VmNetworkView> the networks of the VM read once
+        :return: <list of 'ConnectRequest'>
+        """
+        mappings = self._prepare_mappings(vm_network_mappings)
+        return self.virtual_switch_to_machine_connector.create_connect_requests(si, vm, mappings, port_groups,
+                                                                                vm_network_view)
+
     def _prepare_mappings(self, vm_network_mappings):
         mappings = []
         # create mapping
@@ -1,23 +1,123 @@
-import copy
 import traceback
-import uuid
-from multiprocessing.pool import ThreadPool
+from collections import OrderedDict
 
 import jsonpickle
+from pyVmomi import vmodl
 
-from models.ActionResult import ActionResult, CustomActionResult
+from common.logger import getLogger
+from common.utilites.bounded_executor import BoundedExecutor, KeyedSemaphore
+from models.ActionResult import CustomActionResult
 from models.DeployDataHolder import DeployDataHolder
-from vCenterShell.commands.combine_action import CombineAction
 from vCenterShell.vm.dvswitch_connector import VmNetworkMapping, VmNetworkRemoveMapping
 
+logger = getLogger(__name__)
+
+SET_VLAN = 'setVlan'
+REMOVE_VLAN = 'removeVlan'
+# the vms of all the requests of the driver are planned and reconfigured by this many threads together
+MAX_CONCURRENT_VCENTER_CALLS = 8
+# reconfigures running together on the vms of the same host
+MAX_CONCURRENT_HOST_RECONFIGURES = 4
+
+
+class VmConnectionPlan(object):
+    def __init__(self):
+        """
+        The wanted vnic -> network state of one vm, collected from all the actions of the request on that vm
+        so it can be applied with one reconfigure
+        """
+        self.removals = []
+        self.connections = []
+        self.results = []
+
+    def add_removal(self, action, mappings):
+        """
+        :param action: the removeVlan action
+        :param mappings: [VNicDeviceMapper] the vnics the action moves to the default network
+        """
+        self.removals.append((action, mappings))
+
+    def add_connection(self, action, mappings):
+        """
+        :param action: the setVlan action
+        :param mappings: [VNicDeviceMapper] the vnics the action connects
+        """
+        self.connections.append((action, mappings))
+
+    def add_result(self, result):
+        self.results.append(result)
+
+    def get_released_vnic_names(self):
+        """
+        :return: the names of the vnics that are disconnected by the plan, they can be reused by the connections
+        """
+        return [mapping.vnic.deviceInfo.label for action, mappings in self.removals for mapping in mappings]
+
+    def get_device_mappings(self):
+        """
+        :return: [VNicDeviceMapper] one per vnic, a connection wins over a removal of the same vnic
+        """
+        by_mac = OrderedDict()
+        for action, mappings in self.removals + self.connections:
+            for mapping in mappings:
+                by_mac[mapping.vnic_mac] = mapping
+        return by_mac.values()
+
+    def fail(self, ex):
+        """
+        reports all the planned actions as failed, must be called while handling the exception
+        """
+        for action, mappings in self.removals + self.connections:
+            self.add_result(ConnectionCommandOrchestrator._create_failure_result(action, ex))
+        self.removals = []
+        self.connections = []
+
+    def get_results(self):
+        results = list(self.results)
+        for action, mappings in self.removals:
+            results.extend([ConnectionCommandOrchestrator._create_successful_result(action, mapping)
+                            for mapping in mappings])
+        for action, mappings in self.connections:
+            results.extend([ConnectionCommandOrchestrator._create_connected_result(action, mapping)
+                            for mapping in mappings])
+        return [result.get_base_class() for result in results]
+
 
 class ConnectionCommandOrchestrator(object):
-    def __init__(self, vc_data_model, connector, disconnector):
+    def __init__(self, vc_data_model, connector, disconnector, pv_service, port_group_configurer,
+                 executor=None, max_host_reconfigures=MAX_CONCURRENT_HOST_RECONFIGURES):
+        """
+        :param vc_data_model: VMwarevCenterResourceModel
+        :param connector: VirtualSwitchConnectCommand
+        :param disconnector: VirtualSwitchToMachineDisconnectCommand
+        :param pv_service: pyVmomiService
+        :param port_group_configurer: VirtualMachinePortGroupConfigurer, applies the plan of a vm
+        :param executor: BoundedExecutor shared by all the requests to the vCenter, bounds the concurrent calls
+        :param int max_host_reconfigures: the number of vms of the same host that are reconfigured together
+        """
         self.connector = connector
         self.disconnector = disconnector
         self.vc_data_model = vc_data_model
+        self.pv_service = pv_service
+        self.port_group_configurer = port_group_configurer
+        self.executor = executor or BoundedExecutor(MAX_CONCURRENT_VCENTER_CALLS)
+        self.host_reconfigures = KeyedSemaphore(max_host_reconfigures)
 
     def connect_bulk(self, si, request):
+        """
+        :return: list of ActionResult of all the actions of the request
+        """
+        results = []
+        for vm_results in self.connect_bulk_iter(si, request):
+            results.extend(vm_results)
+        return results
+
+    def connect_bulk_iter(self, si, request):
+        """
+        applies the request in dependency order: the port groups of all the vms are created first,
+        then the vms are reconfigured by the shared executor
+        :return: generator of the lists of ActionResult of each vm, in the order the vms complete
+        """
         dv_switch_path_parts = str.split(self.vc_data_model.default_dvswitch, '\\')
         if len(dv_switch_path_parts) < 2:
             raise ValueError('Default dvSwitch should contains full path to distributed virtual switch')
@@ -27,89 +127,155 @@ class ConnectionCommandOrchestrator(object):
         default_network = self.vc_data_model.holding_network
         holder = DeployDataHolder(jsonpickle.decode(request))
 
-        mappings = self._group_actions_by_uuid_and_mode(holder.driverRequest.actions)
-        unified_actions = self._create_new_action_by_mapping(mappings)
-
-        pool = ThreadPool()
-        async_results = self.run_async_connection_actions(default_network, dv_switch_name, dv_switch_path,
-                                                          port_group_path, si, unified_actions, pool)
-
-        results = self._get_async_results(async_results, mappings, pool)
-
-        return results
-
-    def run_async_connection_actions(self, default_network, dv_switch_name, dv_switch_path, port_group_path, si,
-                                     unified_actions, pool):
-        async_results = []
-        for action in unified_actions:
-            vm_uuid = self._get_vm_uuid(action)
-            if action.type == 'setVlan':
-                res = pool.apply_async(self._set_vlan_bulk,
-                                       (action, default_network, dv_switch_name, dv_switch_path,
-                                        port_group_path,
-                                        vm_uuid, si))
-
-            elif action.type == 'removeVlan':
-
-                res = pool.apply_async(self._remove_vlan_bulk,
-                                       (action, vm_uuid, si))
+        vm_to_actions = self._group_actions_by_vm(holder.driverRequest.actions)
+        vms = self._find_vms(si, vm_to_actions.keys())
+        port_groups = self._create_port_groups(si, holder.driverRequest.actions,
+                                               dv_switch_name, dv_switch_path, port_group_path)
+
+        vm_args = [(si, vm_uuid, actions, vms[vm_uuid].vm if vm_uuid in vms else None, default_network,
+                    dv_switch_name, dv_switch_path, port_group_path, port_groups,
+                    vms[vm_uuid].host if vm_uuid in vms else None,
+                    vms[vm_uuid].network_view if vm_uuid in vms else None)
+                   for vm_uuid, actions in vm_to_actions.items()]
+
+        for args, vm_results, error in self.executor.imap_unordered(self._apply_vm_actions, vm_args):
+            if error is not None:
+                vm_uuid, actions = args[1], args[2]
+                logger.error('failed to apply the actions of vm {0}: {1}'.format(vm_uuid, error))
+                vm_results = [self._create_error_result(action, str(error)).get_base_class() for action in actions]
+            logger.debug('{0} actions of the request completed'.format(len(vm_results)))
+            yield vm_results
+
+    def _find_vms(self, si, vm_uuids):
+        """
+        resolves the vms of all the actions in one call, the vms that are not found are looked up again
+        and reported by their own actions
+        :return: dict of vm uuid to pyVmomiService.PrefetchedVm
+        """
+        try:
+            return self.pv_service.find_vms_by_uuids(si, vm_uuids)
+        except Exception as e:
+            logger.warn('failed to resolve the vms of the request in one call: {0}'.format(e))
+            return dict()
 
-            if res:
-                async_results.append(res)
-        return async_results
+    def _create_port_groups(self, si, actions, dv_switch_name, dv_switch_path, port_group_path):
+        """
+        creates the missing port groups of all the vms in one batch, the port groups that are not created here
+        are created again by the vms that need them, so their errors are reported on the actions
+        :return: dict of port group name to port group
+        """
+        mappings = [mapping
+                    for action in actions if action.type == SET_VLAN
+                    for mapping in self._create_connect_mappings(action, dv_switch_name, dv_switch_path,
+                                                                 port_group_path)]
+        if not mappings:
+            return dict()
+        try:
+            return self.connector.create_port_groups(si, mappings)
+        except Exception as e:
+            logger.warn('failed to create the port groups of the request in one batch: {0}'.format(e))
+            return dict()
+
+    def _apply_vm_actions(self, si, vm_uuid, actions, vm, default_network_name, dv_switch_name, dv_switch_path,
+                          port_group_path, port_groups=None, host=None, vm_network_view=None):
+        """
+        plans all the actions of one vm and applies them with a single reconfigure
+        :param host: the host of the vm, limits the reconfigures that run on the same host
+        :param VmNetworkView vm_network_view: the vnics and networks of the vm when they were read with the vm
+        :return: list of ActionResult, each one carries the id of the action it belongs to
+        """
+        try:
+            if vm is None:
+                vm = self.pv_service.find_by_uuid(si, vm_uuid)
+            if not vm:
+                raise ValueError('VM having UUID {0} not found'.format(vm_uuid))
+
+            default_network = self.pv_service.get_network_by_full_name(si, default_network_name)
+            if not default_network:
+                raise ValueError('Default Network {0} not found'.format(default_network_name))
+
+            # the vnics and networks of the vm are read once for all of its actions
+            if vm_network_view is None:
+                vm_network_view = self.pv_service.get_vm_network_view(si, vm)
+        except Exception as ex:
+            return [self._create_failure_result(action, ex).get_base_class() for action in actions]
+
+        plan = VmConnectionPlan()
+        for action in actions:
+            if action.type not in (SET_VLAN, REMOVE_VLAN):
+                plan.add_result(self._create_error_result(action, 'Action type {0} is not supported'
+                                                          .format(action.type)))
 
-    def _set_vlan_bulk(self, action, default_network, dv_switch_name, dv_switch_path, port_group_path, vm_uuid, si):
+        for action in [action for action in actions if action.type == REMOVE_VLAN]:
+            self._plan_removal(plan, vm, vm_uuid, action, default_network, vm_network_view)
 
-        mappings = self._create_connect_mappings(action, dv_switch_name, dv_switch_path, port_group_path)
+        self._plan_connections(plan, si, vm, [action for action in actions if action.type == SET_VLAN],
+                               default_network, dv_switch_name, dv_switch_path, port_group_path, port_groups,
+                               vm_network_view)
 
-        results = []
-        if mappings:
+        device_mappings = plan.get_device_mappings()
+        if device_mappings:
             try:
-                connection_results = self.connector.connect_to_networks(si, vm_uuid, mappings,
-                                                                        default_network)
-                for connection_result in connection_results:
-                    result = CustomActionResult()
-                    result.actionId = str(action.actionId)
-                    result.type = str(action.type)
-                    result.infoMessage = 'VLAN successfully set'
-                    result.errorMessage = ''
-                    result.success = True
-                    result.updatedInterface = connection_result.mac_address
-                    result.network_name = connection_result.network_name
-                    results.append(result)
-
+                with self.host_reconfigures.hold(host):
+                    self.port_group_configurer.update_vnic_by_mapping(vm, device_mappings)
             except Exception as ex:
-                error_result = self._create_failure_result(action, ex)
-                results.append(error_result)
+                if isinstance(ex, vmodl.fault.ManagedObjectNotFound):
+                    # the holding network or a port group was removed, it is resolved again by the next request
+                    self.pv_service.invalidate_network_cache(si)
+                    self.connector.invalidate_port_groups(dv_switch_name, dv_switch_path)
+                plan.fail(ex)
 
-        return results
+        return plan.get_results()
 
-    def _remove_vlan_bulk(self, action, vm_uuid, si):
+    def _plan_removal(self, plan, vm, vm_uuid, action, default_network, vm_network_view=None):
         mappings = self._create_disconnection_mappings(action, vm_uuid)
-
-        results = []
         if not mappings:
-            error_result = CustomActionResult()
-            error_result.actionId = str(action.actionId)
-            error_result.type = str(action.type)
-            error_result.infoMessage = str('')
-            error_result.errorMessage = 'Interface attribute is missing on connectorAttributes for removeVlan action'
-            error_result.success = False
-            error_result.updatedInterface = None
-            results = [error_result]
-        else:
+            plan.add_result(self._create_error_result(
+                action, 'Interface attribute is missing on connectorAttributes for removeVlan action'))
+            return
+
+        try:
+            plan.add_removal(action, self.disconnector.create_disconnect_mappings(vm, vm_uuid, mappings,
+                                                                                  default_network, vm_network_view))
+        except Exception as ex:
+            plan.add_result(self._create_failure_result(action, ex))
+
+    def _plan_connections(self, plan, si, vm, actions, default_network, dv_switch_name, dv_switch_path,
+                          port_group_path, port_groups=None, vm_network_view=None):
+        action_requests = []
+        for action in actions:
+            mappings = self._create_connect_mappings(action, dv_switch_name, dv_switch_path, port_group_path)
+            if not mappings:
+                continue
             try:
-                connection_results = self.disconnector.disconnect_from_networks(si, vm_uuid, mappings)
-
-                for connection_result in connection_results:
-                    result = self._create_successful_result(action, connection_result)
-                    results.append(result)
-
+                requests = self.connector.create_connect_requests(si, vm, mappings, port_groups, vm_network_view)
+                action_requests.append((action, requests))
             except Exception as ex:
-                error_result = self._create_failure_result(action, ex)
-                results.append(error_result)
-
-        return results
+                plan.add_result(self._create_failure_result(action, ex))
+
+        if not action_requests:
+            return
+
+        # the vnics are chosen for all the connections of the vm together so they do not compete on the same vnic
+        try:
+            device_mappings = self.port_group_configurer.map_vnics_to_networks(
+                vm,
+                [request for action, requests in action_requests for request in requests],
+                default_network,
+                plan.get_released_vnic_names(),
+                vm_network_view)
+        except Exception as ex:
+            for action, requests in action_requests:
+                plan.add_result(self._create_failure_result(action, ex))
+            return
+
+        for action, requests in action_requests:
+            action_mappings = []
+            for request in requests:
+                device_mapping = next(mapping for mapping in device_mappings if mapping.network == request.network)
+                device_mappings.remove(device_mapping)
+                action_mappings.append(device_mapping)
+            plan.add_connection(action, action_mappings)
 
     @staticmethod
     def _create_disconnection_mappings(action, vm_uuid):
@@ -124,34 +290,26 @@ class ConnectionCommandOrchestrator(object):
         return mappings
 
     @staticmethod
-    def _group_actions_by_uuid_and_mode(actions):
-        key_to_actions = dict()
-
-        # group by machine and vlan mode and action type
+    def _group_actions_by_vm(actions):
+        vm_to_actions = OrderedDict()
         for action in actions:
             vm_uuid = ConnectionCommandOrchestrator._get_vm_uuid(action)
-            vlan_mode = action.connectionParams.mode
-            action_type = action.type
-            key = (vm_uuid, vlan_mode, action_type)
-            if key not in key_to_actions:
-                key_to_actions[key] = []
-            key_to_actions[key].append(action)
-
-        # generate new keys
-        return {str(uuid.uuid4()): action
-                for key, action in key_to_actions.items()}
+            if vm_uuid not in vm_to_actions:
+                vm_to_actions[vm_uuid] = []
+            vm_to_actions[vm_uuid].append(action)
+        return vm_to_actions
 
     @staticmethod
-    def _create_new_action_by_mapping(mapping):
-        actions = []
-
-        for key, actions_arr in mapping.items():
-            action = copy.deepcopy(actions_arr[0])
-            action.actionId = key
-            for act in actions_arr[1:]:
-                CombineAction.combine(action, act)
-            actions.append(action)
-        return actions
+    def _create_connected_result(action, device_mapping):
+        result = CustomActionResult()
+        result.actionId = str(action.actionId)
+        result.type = str(action.type)
+        result.infoMessage = 'VLAN successfully set'
+        result.errorMessage = ''
+        result.success = True
+        result.updatedInterface = device_mapping.vnic.macAddress
+        result.network_name = device_mapping.network.name
+        return result
 
     @staticmethod
     def _create_successful_result(action, connection_result):
@@ -166,11 +324,16 @@ class ConnectionCommandOrchestrator(object):
 
     @staticmethod
     def _create_failure_result(action, ex):
+        return ConnectionCommandOrchestrator._create_error_result(
+            action, ConnectionCommandOrchestrator._get_error_message_from_exception(ex))
+
+    @staticmethod
+    def _create_error_result(action, error_message):
         error_result = CustomActionResult()
         error_result.actionId = str(action.actionId)
         error_result.type = str(action.type)
         error_result.infoMessage = str('')
-        error_result.errorMessage = ConnectionCommandOrchestrator._get_error_message_from_exception(ex)
+        error_result.errorMessage = error_message
         error_result.success = False
         error_result.updatedInterface = None
         return error_result
@@ -205,64 +368,6 @@ class ConnectionCommandOrchestrator(object):
             return vnic_name_values[0]
         return None
 
-    @staticmethod
-    def _get_async_results(async_results, unified_actions, pool):
-        pool.close()
-        pool.join()
-        results = []
-        for async_result in async_results:
-            action_results = async_result.get()
-            for action_result in action_results:
-                if action_result.success:
-                    ConnectionCommandOrchestrator._decombine_success_action_result(action_result,
-                                                                                   unified_actions, results)
-                else:
-                    ConnectionCommandOrchestrator._decombine_failed_action_result(action_result,
-                                                                                   unified_actions, results)
-        return results
-
-    @staticmethod
-    def _decombine_failed_action_result(action_result, unified_actions, results):
-        for unified_action in unified_actions[action_result.actionId]:
-            result = ConnectionCommandOrchestrator._decombine(unified_action, action_result)
-            if result:
-                results.append(result)
-
-    @staticmethod
-    def _decombine_success_action_result(action_result, unified_actions, results):
-        for unified_action in unified_actions[action_result.actionId]:
-            result = ConnectionCommandOrchestrator._decombine(unified_action, action_result)
-            if result:
-                results.append(result)
-                break
-
-    @staticmethod
-    def _decombine_setVlan(unified_action, action_result):
-        name = str(action_result.network_name)
-        for vlan_id in unified_action.connectionParams.vlanIds:
-            sub = '_{0}_'.format(str(vlan_id))
-            if name.find(sub) > -1 or not action_result.success:
-                copied_action = action_result.get_base_class()
-                copied_action.actionId = unified_action.actionId
-                return copied_action
-        return None
-
-    @staticmethod
-    def _decombine_removeVlan(unified_action, action_result):
-        """
-            :type action_result: CustomActionResult
-        """
-        mac = str(action_result.updatedInterface)
-        interfaces = [inter
-                      for inter in unified_action.connectorAttributes
-                      if inter.attributeName == "Interface"]
-        for interface in interfaces:
-            if not action_result.success or mac == str(interface.attributeValue):
-                copied_action = action_result.get_base_class()
-                copied_action.actionId = unified_action.actionId
-                return copied_action
-        return None
-
     @staticmethod
     def _create_connect_mappings(action, dv_switch_name, dv_switch_path, port_group_path):
         mappings = []
@@ -280,14 +385,3 @@ class ConnectionCommandOrchestrator(object):
 
             mappings.append(vnic_to_network)
         return mappings
-
-    @classmethod
-    def _decombine(self, unified_action, action_result):
-        method_name = '_decombine_' + unified_action.type
-
-        if not hasattr(self, method_name):
-            raise ValueError('Action type {0} is not supported'.format(unified_action.type))
-
-        method = getattr(self, method_name)
-        return method(unified_action, action_result)
-
@@ -13,6 +13,28 @@ class DeployCommand(object):
         deploy_result = self.deployer.deploy_from_template(si, deployment_params)
         return deploy_result
 
+    def execute_deploy_from_templates(self, si, deployment_params_list):
+        """
+        :return: list of DeployResult in the order the deploys complete
+        """
+        return list(self.deployer.deploy_from_templates(si, deployment_params_list))
+
+    def execute_deploy_instant_clone(self, si, deployment_params, connection_details):
+        deploy_result = self.deployer.deploy_instant_clone(si, deployment_params, connection_details)
+        return deploy_result
+
+    def execute_deploy_from_warm_pool(self, si, deployment_params, connection_details):
+        deploy_result = self.deployer.deploy_from_warm_pool(si, deployment_params, connection_details)
+        return deploy_result
+
+    def get_warm_pool_stats(self):
+        """
+        :return: list of WarmPoolStats, one per template and placement
+        """
+        if self.deployer.warm_vm_pool is None:
+            return []
+        return self.deployer.warm_vm_pool.get_stats()
+
     def execute_deploy_from_image(self, si, deployment_params, connectivity):
         deploy_result = self.deployer.deploy_from_image(si, deployment_params, connectivity)
         return deploy_result
@@ -1,19 +1,44 @@
-﻿from common.logger import getLogger
+﻿from collections import OrderedDict
+
+from common.logger import getLogger
 
 logger = getLogger(__name__)
 
+POWERED_ON = 'poweredOn'
+# power off and destroy tasks that run together on the vCenter during a bulk destroy
+MAX_CONCURRENT_DESTROY_TASKS = 10
+
+
+class VmDestroyResult(object):
+    def __init__(self, vm_uuid, resource_name, success, error_message=''):
+        """
+        :param str vm_uuid: the uuid of the vm
+        :param str resource_name: the full name of the CloudShell resource of the vm
+        :param bool success: True when the vm was destroyed
+        :param str error_message: why the vm was not destroyed, or why its resource was not deleted
+        """
+        self.vm_uuid = vm_uuid
+        self.resource_name = resource_name
+        self.success = success
+        self.error_message = error_message
+
 
 class DestroyVirtualMachineCommand(object):
     """ Command to Destroy a VM """
 
-    def __init__(self, pv_service, resource_remover, disconnector):
+    def __init__(self, pv_service, resource_remover, disconnector, synchronous_task_waiter=None,
+                 max_concurrent_tasks=MAX_CONCURRENT_DESTROY_TASKS):
         """
         :param pv_service:   pv_service Instance
         :param resource_remover: CloudshellResourceRemover
+        :param synchronous_task_waiter: SynchronousTaskWaiter, follows the tasks of a bulk destroy together
+        :param int max_concurrent_tasks: the number of vms a bulk destroy powers off and destroys together
         """
         self.pv_service = pv_service
         self.resource_remover = resource_remover
         self.disconnector = disconnector
+        self.synchronous_task_waiter = synchronous_task_waiter or pv_service.task_waiter
+        self.max_concurrent_tasks = max_concurrent_tasks
 
     def destroy(self, si, session, vm_uuid, vm_name):
         # find vm
@@ -30,3 +55,80 @@ class DestroyVirtualMachineCommand(object):
         # delete resources
         self.resource_remover.remove_resource(session=session, resource_full_name=vm_name)
         return result
+
+    def destroy_vms(self, si, session, vms):
+        """
+        Destroys many vms together: the vms are not disconnected first since they are destroyed anyway,
+        the power off and destroy tasks of up to max_concurrent_tasks vms run together,
+        and the resources of the destroyed vms are deleted with one CloudShell call
+        :param si: pyvmomi 'ServiceInstance'
+        :param session: CloudShellAPISession
+        :param vms: list of (vm uuid, resource full name)
+        :return: list of VmDestroyResult in the order of vms
+        """
+        prefetched = self.pv_service.find_vms_by_uuids(si, [vm_uuid for vm_uuid, resource_name in vms])
+
+        results = OrderedDict()
+        found = []
+        for vm_uuid, resource_name in vms:
+            if vm_uuid in prefetched:
+                found.append((vm_uuid, resource_name, prefetched[vm_uuid]))
+            else:
+                results[vm_uuid] = VmDestroyResult(vm_uuid, resource_name, False,
+                                                   'VM having UUID {0} not found'.format(vm_uuid))
+
+        for i in range(0, len(found), self.max_concurrent_tasks):
+            self._destroy_window(found[i:i + self.max_concurrent_tasks], results)
+
+        destroyed = [result for result in results.values() if result.success]
+        if destroyed:
+            try:
+                self.resource_remover.remove_resources(session=session,
+                                                       resource_full_names=[result.resource_name
+                                                                            for result in destroyed])
+            except Exception as e:
+                # the vms are gone, only their resources are left in CloudShell
+                logger.warn('failed to delete the resources of the destroyed vms: {0}'.format(e))
+                for result in destroyed:
+                    result.error_message = 'the vm was destroyed but its resource was not deleted: {0}'.format(
+                        self._get_error_message(e))
+        return [results[vm_uuid] for vm_uuid, resource_name in vms]
+
+    def _destroy_window(self, window, results):
+        powered_on = [item for item in window if item[2].power_state == POWERED_ON]
+        self._run_tasks(powered_on, lambda vm: vm.PowerOffVM_Task(), 'Power Off', results)
+
+        destroyable = [item for item in window if item[0] not in results]
+        for vm_uuid, resource_name, outcome in self._run_tasks(destroyable, lambda vm: vm.Destroy_Task(),
+                                                               'Destroy VM', results):
+            results[vm_uuid] = VmDestroyResult(vm_uuid, resource_name, True)
+
+    def _run_tasks(self, items, start_task, action_name, results):
+        """
+        starts a task for every vm and waits for all of them, the vms that failed are added to results
+        :return: list of (vm uuid, resource name, TaskOutcome) of the tasks that succeeded
+        """
+        started = []
+        for vm_uuid, resource_name, prefetched_vm in items:
+            try:
+                started.append((vm_uuid, resource_name, start_task(prefetched_vm.vm)))
+            except Exception as e:
+                results[vm_uuid] = VmDestroyResult(vm_uuid, resource_name, False, self._get_error_message(e))
+        if not started:
+            return []
+
+        succeeded = []
+        outcomes = self.synchronous_task_waiter.wait_all([task for vm_uuid, resource_name, task in started],
+                                                         action_name=action_name)
+        for (vm_uuid, resource_name, task), outcome in zip(started, outcomes):
+            if outcome.succeeded:
+                succeeded.append((vm_uuid, resource_name, outcome))
+            else:
+                logger.info('{0} of vm {1} failed: {2}'.format(action_name, vm_uuid, outcome.error))
+                results[vm_uuid] = VmDestroyResult(vm_uuid, resource_name, False,
+                                                   self._get_error_message(outcome.error))
+        return succeeded
+
+    @staticmethod
+    def _get_error_message(error):
+        return getattr(error, 'msg', None) or str(error)
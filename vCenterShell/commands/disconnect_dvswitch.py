@@ -29,23 +29,44 @@ class VirtualSwitchToMachineDisconnectCommand(object):
         self.port_group_configurer = port_group_configurer
         self.default_network = default_network
 
-    def disconnect_from_networks(self, si, vm_uuid, vm_network_remove_mappings):
-        vm = self.pyvmomi_service.find_by_uuid(si, vm_uuid)
+    def disconnect_from_networks(self, si, vm_uuid, vm_network_remove_mappings, vm=None):
+        """
+        :param <pyvmomi vm object> vm: If the vm obj is None will use vm_uuid to fetch the object
+        """
+        if vm is None:
+            vm = self.pyvmomi_service.find_by_uuid(si, vm_uuid)
         if not vm:
             raise ValueError('VM having UUID {0} not found'.format(vm_uuid))
 
         default_network = self.pyvmomi_service.get_network_by_full_name(si, self.default_network)
 
+        mappings = self.create_disconnect_mappings(vm, vm_uuid, vm_network_remove_mappings, default_network)
+        return self.port_group_configurer.update_vnic_by_mapping(vm, mappings)
+
+    def create_disconnect_mappings(self, vm, vm_uuid, vm_network_remove_mappings, default_network,
+                                   vm_network_view=None):
+        """
+        Finds the vnics to move to the default network, the vm is not changed
+        :param vm: vim.VirtualMachine
+        :param <str> vm_uuid: the uuid of the vm
+        :param vm_network_remove_mappings: <collection of 'VmNetworkRemoveMapping'>
+        :param default_network: the network the vnics are moved to
+        :param vm_network_view: <VmNetworkView> the vnics of the vm read once, the vnics are looked up in it
+        :return: <list of 'VNicDeviceMapper'>
+        """
         mappings = []
         for vm_network_remove_mapping in vm_network_remove_mappings:
-            vnic = self.pyvmomi_service.get_vnic_by_mac_address(vm, vm_network_remove_mapping.mac_address)
+            if vm_network_view is not None:
+                vnic = vm_network_view.get_vnic_by_mac_address(vm_network_remove_mapping.mac_address)
+            else:
+                vnic = self.pyvmomi_service.get_vnic_by_mac_address(vm, vm_network_remove_mapping.mac_address)
             if vnic is None:
                 raise KeyError('VNIC having MAC address {0} not found on VM having UUID {1}'
                                .format(vm_network_remove_mapping.mac_address, vm_uuid))
 
             mappings.append(VNicDeviceMapper(connect=False, network=default_network,
                                              vnic=vnic, mac=vm_network_remove_mapping.mac_address))
-        return self.port_group_configurer.update_vnic_by_mapping(vm, mappings)
+        return mappings
 
     def remove_vnic(self, si, vm_uuid, network_name=None):
         """
@@ -1,7 +1,30 @@
+from collections import OrderedDict
+
 from common.logger import getLogger
+from common.vcenter.task_waiter import TaskTimeoutException
 
 _logger = getLogger("vCenterShell")
 
+POWERED_ON = 'poweredOn'
+POWERED_OFF = 'poweredOff'
+POWER_STATE = 'runtime.powerState'
+# seconds a power cycle waits for the guest tools to report a green heartbeat
+HEARTBEAT_TIMEOUT = 600
+
+
+class VmPowerResult(object):
+    def __init__(self, vm_uuid, resource_name, success, message=''):
+        """
+        :param str vm_uuid: the uuid of the vm
+        :param str resource_name: the full name of the deployed app resource
+        :param bool success: True when the vm reached the wanted power state
+        :param str message: what was done, or why it failed
+        """
+        self.vm_uuid = vm_uuid
+        self.resource_name = resource_name
+        self.success = success
+        self.message = message
+
 
 class VirtualMachinePowerManagementCommand(object):
     def __init__(self, pyvmomi_service, synchronous_task_waiter):
@@ -62,3 +85,244 @@ class VirtualMachinePowerManagementCommand(object):
             session.SetResourceLiveStatus(resource_fullname, "Online", "Active")
 
         return task_result
+
+    def power_cycle(self, si, session, vm_uuid, resource_fullname, use_reset=True, wait_for_heartbeat=False,
+                    heartbeat_timeout=HEARTBEAT_TIMEOUT):
+        """
+        restarts the vm in one vCenter session, the power state changes are waited for with the property
+        collector instead of sleeping between the power off and the power on
+        :param si: Service Instance
+        :param session: CloudShellAPISession
+        :param vm_uuid: the uuid of the vm
+        :param resource_fullname: the full name of the deployed app resource
+        :param bool use_reset: a powered on vm is restarted with a native reset instead of a power off and on
+        :param bool wait_for_heartbeat: returns only when the guest tools report a green heartbeat
+        :param int heartbeat_timeout: seconds to wait for the heartbeat, the power cycle fails when it passes
+        :return: the power state of the vm
+        """
+        _logger.info('retrieving vm by uuid: {0}'.format(vm_uuid))
+        vm = self.pyvmomi_service.find_by_uuid(si, vm_uuid)
+
+        if vm.summary.runtime.powerState == POWERED_ON:
+            if use_reset:
+                _logger.info('resetting vm')
+                self.synchronous_task_waiter.wait_for_task(task=vm.ResetVM_Task(), action_name='Reset')
+            else:
+                _logger.info('hard powering off vm')
+                self.synchronous_task_waiter.wait_for_task(task=vm.PowerOff(), action_name='Power Off')
+                self._wait_for_power_state(vm, POWERED_OFF)
+
+        if vm.summary.runtime.powerState != POWERED_ON:
+            _logger.info('powering on vm')
+            self.synchronous_task_waiter.wait_for_task(task=vm.PowerOn(), action_name='Power On')
+        power_state = self._wait_for_power_state(vm, POWERED_ON)
+
+        if wait_for_heartbeat:
+            try:
+                self.synchronous_task_waiter.wait_for_property(vm, 'guestHeartbeatStatus',
+                                                               lambda status: status == 'green',
+                                                               action_name='Guest Heartbeat',
+                                                               timeout=heartbeat_timeout)
+            except TaskTimeoutException:
+                # the vm is powered on but its guest is not up, the live status is not set to online
+                raise Exception('vm {0} was powered on but its guest heartbeat was not green after {1} seconds'
+                                .format(vm_uuid, heartbeat_timeout))
+
+        # Set live status - deployment done
+        if resource_fullname:
+            session.SetResourceLiveStatus(resource_fullname, "Online", "Active")
+
+        return power_state
+
+    def _wait_for_power_state(self, vm, power_state):
+        return self.synchronous_task_waiter.wait_for_property(vm, POWER_STATE,
+                                                              lambda state: state == power_state,
+                                                              action_name='Power State {0}'.format(power_state))
+
+    def power_on_vms(self, si, session, vms):
+        """
+        power on many vms together: their power states are read with one property fetch, the vms of a datacenter
+        are powered on with one PowerOnMultiVM_Task and all the tasks are followed together
+        :param si: Service Instance
+        :param session: CloudShellAPISession
+        :param vms: list of (vm uuid, deployed app resource full name)
+        :return: list of VmPowerResult in the order of vms
+        """
+        results, prefetched = self._prefetch_vms(si, vms)
+        to_power_on = self._skip_in_state(vms, prefetched, POWERED_ON, 'already powered on', results)
+        self._power_on_together(si, to_power_on, results)
+        self._set_live_statuses(session, results, "Online", "Active")
+        return [results[vm_uuid] for vm_uuid, resource_name in vms]
+
+    def power_off_vms(self, si, session, vms):
+        """
+        hard power off many vms together, their power states are read with one property fetch
+        and all the tasks are followed together
+        :param si: Service Instance
+        :param session: CloudShellAPISession
+        :param vms: list of (vm uuid, deployed app resource full name)
+        :return: list of VmPowerResult in the order of vms
+        """
+        results, prefetched = self._prefetch_vms(si, vms)
+        to_power_off = self._skip_in_state(vms, prefetched, POWERED_OFF, 'already powered off', results)
+        self._run_tasks(to_power_off, lambda vm: vm.PowerOff(), 'Power Off', 'powered off', results)
+        self._set_live_statuses(session, results, "Offline", "Powered Off")
+        return [results[vm_uuid] for vm_uuid, resource_name in vms]
+
+    def power_cycle_vms(self, si, session, vms):
+        """
+        powers off all the vms together and then powers them on together
+        :param si: Service Instance
+        :param session: CloudShellAPISession
+        :param vms: list of (vm uuid, deployed app resource full name)
+        :return: list of VmPowerResult in the order of vms
+        """
+        results, prefetched = self._prefetch_vms(si, vms)
+        powered_on = [(vm_uuid, resource_name, prefetched[vm_uuid]) for vm_uuid, resource_name in vms
+                      if vm_uuid in prefetched and prefetched[vm_uuid].power_state == POWERED_ON]
+        self._run_tasks(powered_on, lambda vm: vm.PowerOff(), 'Power Off', 'powered off', results)
+
+        to_power_on = [(vm_uuid, resource_name, prefetched[vm_uuid]) for vm_uuid, resource_name in vms
+                       if vm_uuid in prefetched and (vm_uuid not in results or results[vm_uuid].success)]
+        self._power_on_together(si, to_power_on, results)
+        self._set_live_statuses(session, results, "Online", "Active")
+        return [results[vm_uuid] for vm_uuid, resource_name in vms]
+
+    def _prefetch_vms(self, si, vms):
+        """
+        :return: (dict of vm uuid to VmPowerResult of the vms that were not found,
+                  dict of vm uuid to pyVmomiService.PrefetchedVm)
+        """
+        prefetched = self.pyvmomi_service.find_vms_by_uuids(si, [vm_uuid for vm_uuid, resource_name in vms])
+        results = OrderedDict()
+        for vm_uuid, resource_name in vms:
+            if vm_uuid not in prefetched:
+                results[vm_uuid] = VmPowerResult(vm_uuid, resource_name, False,
+                                                 'VM having UUID {0} not found'.format(vm_uuid))
+        return results, prefetched
+
+    @staticmethod
+    def _skip_in_state(vms, prefetched, power_state, message, results):
+        """
+        :return: list of (vm uuid, resource name, PrefetchedVm) of the vms that are not in the power state
+        """
+        items = []
+        for vm_uuid, resource_name in vms:
+            if vm_uuid not in prefetched:
+                continue
+            if prefetched[vm_uuid].power_state == power_state:
+                results[vm_uuid] = VmPowerResult(vm_uuid, resource_name, True, message)
+            else:
+                items.append((vm_uuid, resource_name, prefetched[vm_uuid]))
+        return items
+
+    def _power_on_together(self, si, items, results):
+        if not items:
+            return
+        datacenters = self.pyvmomi_service.get_vms_datacenters(si, [item[2].vm for item in items])
+        by_datacenter = OrderedDict()
+        for item in items:
+            datacenter = datacenters.get(item[2].vm)
+            by_datacenter.setdefault(datacenter, []).append(item)
+
+        for datacenter, datacenter_items in by_datacenter.items():
+            if datacenter is None or not hasattr(datacenter, 'PowerOnMultiVM_Task'):
+                self._run_tasks(datacenter_items, lambda vm: vm.PowerOn(), 'Power On', 'powered on', results)
+            else:
+                self._power_on_multi(si, datacenter, datacenter_items, results)
+
+    def _power_on_multi(self, si, datacenter, items, results):
+        """
+        powers on the vms of one datacenter with PowerOnMultiVM_Task, the vms it did not attempt are reported
+        as failed, the power on tasks it started are followed together.
+        The vms it left without a task, like the recommendations of a manual DRS cluster, are powered on one by one
+        and a vm is reported as powered on only once its power state says so
+        """
+        task = datacenter.PowerOnMultiVM_Task([item[2].vm for item in items])
+        try:
+            cluster_result = self.synchronous_task_waiter.wait_for_task(task=task, action_name='Power On Multi VM')
+        except Exception as e:
+            for vm_uuid, resource_name, prefetched_vm in items:
+                results[vm_uuid] = VmPowerResult(vm_uuid, resource_name, False, self._get_error_message(e))
+            return
+
+        by_vm = OrderedDict((item[2].vm, item) for item in items)
+        for not_attempted in getattr(cluster_result, 'notAttempted', None) or []:
+            item = by_vm.pop(not_attempted.vm, None)
+            if item:
+                results[item[0]] = VmPowerResult(item[0], item[1], False,
+                                                 self._get_error_message(not_attempted.fault))
+
+        # the vms of a DRS cluster are powered on by tasks of their own
+        started = []
+        for attempted in getattr(cluster_result, 'attempted', None) or []:
+            if attempted.task is not None and attempted.vm in by_vm:
+                vm_uuid, resource_name, prefetched_vm = by_vm.pop(attempted.vm)
+                started.append((vm_uuid, resource_name, attempted.task))
+        self._wait_all(started, 'Power On', 'powered on', results)
+
+        without_task = by_vm.values()
+        power_states = self._get_power_states(si, without_task)
+        for vm_uuid, resource_name, prefetched_vm in without_task:
+            if power_states.get(prefetched_vm.vm) == POWERED_ON:
+                results[vm_uuid] = VmPowerResult(vm_uuid, resource_name, True, 'powered on')
+        self._run_tasks([item for item in without_task if item[0] not in results],
+                        lambda vm: vm.PowerOn(), 'Power On', 'powered on', results)
+
+        # a succeeded task does not promise a running vm, a manual DRS cluster only recommends where to run it
+        succeeded = [item for item in items if results[item[0]].success]
+        power_states = self._get_power_states(si, succeeded)
+        for vm_uuid, resource_name, prefetched_vm in succeeded:
+            power_state = power_states.get(prefetched_vm.vm)
+            if power_state != POWERED_ON:
+                results[vm_uuid] = VmPowerResult(vm_uuid, resource_name, False,
+                                                 'vm is {0} after the power on'.format(power_state))
+
+    def _get_power_states(self, si, items):
+        """
+        :param items: list of (vm uuid, resource name, PrefetchedVm)
+        :return: dict of vm to its current power state, read with one property fetch
+        """
+        properties = self.pyvmomi_service.retrieve_object_properties(si.content, [item[2].vm for item in items],
+                                                                     [POWER_STATE])
+        return {vm: values.get(POWER_STATE) for vm, values in properties}
+
+    def _run_tasks(self, items, start_task, action_name, message, results):
+        started = []
+        for vm_uuid, resource_name, prefetched_vm in items:
+            try:
+                started.append((vm_uuid, resource_name, start_task(prefetched_vm.vm)))
+            except Exception as e:
+                results[vm_uuid] = VmPowerResult(vm_uuid, resource_name, False, self._get_error_message(e))
+        self._wait_all(started, action_name, message, results)
+
+    def _wait_all(self, started, action_name, message, results):
+        """
+        :param started: list of (vm uuid, resource name, task)
+        """
+        if not started:
+            return
+        outcomes = self.synchronous_task_waiter.wait_all([task for vm_uuid, resource_name, task in started],
+                                                         action_name=action_name)
+        for (vm_uuid, resource_name, task), outcome in zip(started, outcomes):
+            if outcome.succeeded:
+                results[vm_uuid] = VmPowerResult(vm_uuid, resource_name, True, message)
+            else:
+                results[vm_uuid] = VmPowerResult(vm_uuid, resource_name, False,
+                                                 self._get_error_message(outcome.error))
+
+    @staticmethod
+    def _set_live_statuses(session, results, live_status, additional_info):
+        """
+        sets the live status of the vms that succeeded once all the tasks are done
+        """
+        for result in results.values():
+            if result.success and result.resource_name:
+                try:
+                    session.SetResourceLiveStatus(result.resource_name, live_status, additional_info)
+                except Exception as e:
+                    _logger.warn('failed to set the live status of {0}: {1}'.format(result.resource_name, e))
+
+    @staticmethod
+    def _get_error_message(error):
+        return getattr(error, 'msg', None) or str(error)
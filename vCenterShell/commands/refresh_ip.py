@@ -1,18 +1,47 @@
 import re
-import time
 
 from common.logger import getLogger
+from common.utilites.lru_cache import LruCache
+from common.vcenter.task_waiter import TaskTimeoutException
 
 logger = getLogger(__name__)
 
+GUEST_IP_ADDRESS = 'guest.ipAddress'
+GUEST_NET = 'guest.net'
+GUEST_TOOLS_STATUS = 'guest.toolsStatus'
+TOOLS_NOT_INSTALLED = 'toolsNotInstalled'
+
+
+class RefreshIpResult(object):
+    def __init__(self, vm_uuid, resource_name, success, ip=None, error_message=''):
+        """
+        :param str vm_uuid: the uuid of the vm
+        :param str resource_name: the deployed app resource whose address was updated
+        :param bool success: True when the address was updated
+        :param str ip: the address of the vm
+        :param str error_message: why the address was not updated
+        """
+        self.vm_uuid = vm_uuid
+        self.resource_name = resource_name
+        self.success = success
+        self.ip = ip
+        self.error_message = error_message
+
 
 class RefreshIpCommand(object):
     TIMEOUT = 600
-    IP_V4_PATTERN = re.compile('^(?:[0-9]{1,3}\.){3}[0-9]{1,3}$')
+    # the v4 check is a lookahead in front of the custom regex, so one match call applies both
+    IP_MATCHER_FORMAT = '(?=(?:[0-9]{{1,3}}\.){{3}}[0-9]{{1,3}}$)(?:{0})'
+    CACHE_SIZE = 1024
 
-    def __init__(self, pyvmomi_service, resource_model_parser):
+    def __init__(self, pyvmomi_service, resource_model_parser, synchronous_task_waiter=None):
         self.pyvmomi_service = pyvmomi_service
         self.resource_model_parser = resource_model_parser
+        self.synchronous_task_waiter = synchronous_task_waiter or pyvmomi_service.task_waiter
+        # the ip_regex of a deployed app does not change, a redeployed app with the same name gets another vm uuid
+        self._ip_regexes = LruCache(self.CACHE_SIZE)
+        # apps deployed from the same app template share their ip_regex and its compiled matcher
+        self._ip_matchers = LruCache(self.CACHE_SIZE)
 
     def refresh_ip(self, si, session, vm_uuid, resource_name, default_network):
         """
@@ -24,7 +53,7 @@ class RefreshIpCommand(object):
         :param str resource_name: Logical resource name to update address property on
         :param vim.Network default_network: the default network
         """
-        match_function = self._get_ip_match_function(session, resource_name)
+        match_function = self._get_ip_match_function(session, vm_uuid, resource_name)
 
         vm = self.pyvmomi_service.find_by_uuid(si, vm_uuid)
 
@@ -39,8 +68,86 @@ class RefreshIpCommand(object):
 
         session.UpdateResourceAddress(resource_name, ip)
 
+    def refresh_ips(self, si, session, vms, default_network):
+        """
+        Refreshes the IP addresses of many virtual machines: the guest addresses of all of them are followed with
+        one property collector filter and the address of every resource is updated as soon as its ip is known
+
+        :param vim.ServiceInstance si: py_vmomi service instance
+        :param vCenterShell.driver.SecureCloudShellApiSession session: cloudshell session
+        :param vms: list of (vm uuid, deployed app resource name)
+        :param vim.Network default_network: the default network
+        :return: list of RefreshIpResult in the order of vms
+        """
+        results = dict()
+        match_functions = dict()
+        for vm_uuid, resource_name in vms:
+            try:
+                match_functions[vm_uuid] = self._get_ip_match_function(session, vm_uuid, resource_name)
+            except Exception as e:
+                results[vm_uuid] = RefreshIpResult(vm_uuid, resource_name, False, error_message=str(e))
+
+        prefetched = self.pyvmomi_service.find_vms_by_uuids(si, match_functions.keys())
+        watched = dict()
+        for vm_uuid, resource_name in vms:
+            if vm_uuid in results:
+                continue
+            if vm_uuid not in prefetched:
+                results[vm_uuid] = RefreshIpResult(vm_uuid, resource_name, False,
+                                                   error_message='VM having UUID {0} not found'.format(vm_uuid))
+            else:
+                watched[prefetched[vm_uuid].vm] = (vm_uuid, resource_name)
+
+        ips = dict()
+
+        def is_ready(vm, values):
+            if values[GUEST_TOOLS_STATUS] == TOOLS_NOT_INSTALLED:
+                return True
+            ip = self._select_ip(values, default_network, match_functions[watched[vm][0]])
+            if ip:
+                ips[vm] = ip
+            return ip is not None
+
+        try:
+            for vm, values in self.synchronous_task_waiter.as_ready(watched.keys(),
+                                                                    [GUEST_IP_ADDRESS, GUEST_NET, GUEST_TOOLS_STATUS],
+                                                                    is_ready, action_name='Refresh IP',
+                                                                    timeout=self.TIMEOUT):
+                vm_uuid, resource_name = watched.pop(vm)
+                results[vm_uuid] = self._update_address(session, vm_uuid, resource_name, ips.get(vm))
+        except TaskTimeoutException as e:
+            logger.debug(str(e))
+
+        for vm_uuid, resource_name in watched.values():
+            results[vm_uuid] = RefreshIpResult(vm_uuid, resource_name, False,
+                                               error_message='IP address of VM {0} could not be obtained during {1} '
+                                                             'seconds'.format(resource_name, self.TIMEOUT))
+        return [results[vm_uuid] for vm_uuid, resource_name in vms]
+
     @staticmethod
-    def _get_ip_match_function(session, resource_name):
+    def _update_address(session, vm_uuid, resource_name, ip):
+        if ip is None:
+            return RefreshIpResult(vm_uuid, resource_name, False,
+                                   error_message='VMWare Tools status on VM {0} are not installed'
+                                   .format(resource_name))
+        try:
+            session.UpdateResourceAddress(resource_name, ip)
+        except Exception as e:
+            return RefreshIpResult(vm_uuid, resource_name, False, ip, str(e))
+        return RefreshIpResult(vm_uuid, resource_name, True, ip)
+
+    def _get_ip_match_function(self, session, vm_uuid, resource_name):
+        """
+        :return: one precompiled match function that accepts the v4 addresses that match the ip_regex of the
+                 resource, the resource details are read only the first time the resource is refreshed
+        """
+        ip_regex = self._ip_regexes.get_or_create((resource_name, vm_uuid),
+                                                  lambda key: self._get_ip_regex(session, resource_name))
+        return self._ip_matchers.get_or_create(ip_regex,
+                                               lambda key: re.compile(self.IP_MATCHER_FORMAT.format(ip_regex)).match)
+
+    @staticmethod
+    def _get_ip_regex(session, resource_name):
 
         logger.debug('Trying to obtain IP address for {0}'.format(resource_name))
 
@@ -70,38 +177,51 @@ class RefreshIpCommand(object):
             ip_regex = ip_regexes[0]
             logger.debug('Custom IP Regex to filter IP addresses {0}'.format(ip_regex))
 
-        return re.compile(ip_regex).match
+        return ip_regex
 
     def _obtain_ip(self, vm, default_network, match_function):
-        time_elapsed = 0
-        ip = None
-        interval = self.TIMEOUT / 100
-        while time_elapsed < self.TIMEOUT and ip is None:
-            ips = RefreshIpCommand._get_ip_addresses(vm, default_network)
-            if ips:
-                print 'filtering ip by v4'
-                logger.debug('Filtering IP adresses to limit to IP V4 {0}'.format(','.join(ips)))
-                ips = RefreshIpCommand._select_ip_by_match(ips, RefreshIpCommand.IP_V4_PATTERN.match)
-            if ips:
-                print 'filtering ip by custom filter'
-                logger.debug('Filtering IP adresses by custom IP Regex'.format(','.join(ips)))
-                ips = RefreshIpCommand._select_ip_by_match(ips, match_function)
-            if ips:
-                ip = ips[0]
-                if ip:
-                    return ip
-                time_elapsed += interval
-                time.sleep(interval)
-        return ip
+        """
+        follows the guest addresses of the vm with the property collector and returns as soon as an address
+        matches, the addresses are filtered again on every change the vCenter reports
+        :return: the ip address, None when no address matched within TIMEOUT seconds
+        """
+        found = []
+
+        def select_ip(values):
+            ip = RefreshIpCommand._select_ip(values, default_network, match_function)
+            if ip:
+                found.append(ip)
+            return ip is not None
+
+        try:
+            self.synchronous_task_waiter.wait_for_properties(vm, [GUEST_IP_ADDRESS, GUEST_NET], select_ip,
+                                                             action_name='Refresh IP', timeout=self.TIMEOUT)
+        except TaskTimeoutException as e:
+            logger.debug(str(e))
+            return None
+        return found[-1]
+
+    @staticmethod
+    def _select_ip(values, default_network, match_function):
+        """
+        :param values: dict of the guest property paths to their values
+        :param match_function: accepts the v4 addresses that match the custom ip regex
+        :return: the first address that matches, None when there is no such address
+        """
+        ips = RefreshIpCommand._get_ip_addresses(values[GUEST_IP_ADDRESS], values[GUEST_NET], default_network)
+        if ips:
+            logger.debug('Filtering IP adresses by IP V4 and custom IP Regex {0}'.format(','.join(ips)))
+            ips = RefreshIpCommand._select_ip_by_match(ips, match_function)
+        return ips[0] if ips else None
 
     @staticmethod
-    def _get_ip_addresses(vm, default_network):
+    def _get_ip_addresses(ip_address, guest_nics, default_network):
         ips = []
-        if vm.guest.ipAddress:
-            ips.append(vm.guest.ipAddress)
-        for nic in vm.guest.net:
+        if ip_address:
+            ips.append(ip_address)
+        for nic in guest_nics or []:
             if nic.network != default_network:
-                for addr in nic.ipAddress:
+                for addr in nic.ipAddress or []:
                     if addr:
                         ips.append(addr)
         return ips
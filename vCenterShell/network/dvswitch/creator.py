@@ -1,16 +1,26 @@
 # -*- coding: utf-8 -*-
+from collections import OrderedDict
+
 from pyVmomi import vim
 from common.logger import getLogger
-from threading import Lock
+from common.utilites.single_flight import SingleFlight
+from vCenterShell.network.dvswitch.port_group_index import DvPortGroupIndex
 
 logger = getLogger("vCenterCommon")
 
 
 class DvPortGroupCreator(object):
-    def __init__(self, pyvmomi_service, synchronous_task_waiter):
+    def __init__(self, pyvmomi_service, synchronous_task_waiter, port_group_index=None):
+        """
+        :param pyvmomi_service: pyVmomiService
+        :param synchronous_task_waiter: SynchronousTaskWaiter
+        :param port_group_index: DvPortGroupIndex, answers whether a port group exists without going to the vCenter
+        """
         self.pyvmomi_service = pyvmomi_service
         self.synchronous_task_waiter = synchronous_task_waiter
-        self._lock = Lock()
+        self.port_group_index = port_group_index or DvPortGroupIndex(pyvmomi_service)
+        # only requests for the same port group wait for each other, and they share one creation
+        self._port_group_flights = SingleFlight()
 
     def get_or_create_network(self,
                               si,
@@ -21,43 +31,96 @@ class DvPortGroupCreator(object):
                               port_group_path,
                               vlan_id,
                               vlan_spec):
-        network = None
-        self._lock.acquire()
-        try:
-            # check if the network is attached to the vm and gets it, the function doesn't goes to the vcenter
+        # check if the network is attached to the vm and gets it, the function doesn't goes to the vcenter
+        # (the vm is None when its networks were already checked by the caller)
+        if vm is not None:
             network = self.pyvmomi_service.get_network_by_name_from_vm(vm, dv_port_name)
+            if network is not None:
+                return network
+
+        key = (dv_switch_path, dv_switch_name, dv_port_name)
+        return self._port_group_flights.do(key, self._find_or_create_network,
+                                           si, dv_port_name, dv_switch_name, dv_switch_path, vlan_id, vlan_spec)
+
+    def _find_or_create_network(self, si, dv_port_name, dv_switch_name, dv_switch_path, vlan_id, vlan_spec):
+        entry = self.port_group_index.find(si, dv_switch_name, dv_switch_path, dv_port_name)
+
+        # if we couldn't get the network ---> create it(can't find it, play god!)
+        if entry is None:
+            self._create_dv_port_group(dv_port_name,
+                                       dv_switch_name,
+                                       dv_switch_path,
+                                       si,
+                                       vlan_spec,
+                                       vlan_id)
+            entry = self.port_group_index.find(si, dv_switch_name, dv_switch_path, dv_port_name)
+            if entry is None:
+                raise Exception('DV Port Group {0} not found on DV Switch {1} after it was created'
+                                .format(dv_port_name, dv_switch_name))
+        return entry.port_group
+
+    def get_or_create_port_groups(self, si, dv_switch_name, dv_switch_path, port_groups):
+        """
+        Creates all the missing port groups of a dvSwitch with one AddDVPortgroup_Task
 
-            # if we didn't found the network on the vm
-            if network is None:
-                # try to get it from the vcenter
-                try:
-                    network = self.pyvmomi_service.find_network_by_name(si, dv_switch_path, dv_port_name)
-                except KeyError:
-                    network = None
-
-            # if we still couldn't get the network ---> create it(can't find it, play god!)
-            if network is None:
-                self._create_dv_port_group(dv_port_name,
-                                          dv_switch_name,
-                                          dv_switch_path,
-                                          si,
-                                          vlan_spec,
-                                          vlan_id)
-                network = self.pyvmomi_service.find_network_by_name(si, dv_switch_path, dv_port_name)
-
-        finally:
-            self._lock.release()
-            return network
-
+        :param si: pyvmomi 'ServiceInstance'
+        :param dv_switch_name: <str> the name of the dvSwitch
+        :param dv_switch_path: <str> the path of the dvSwitch
+        :param port_groups: list of (port group name, vlan id, vlan spec)
+        :return: dict of port group name to <vim.dvs.DistributedVirtualPortgroup>
+        """
+        existing = self.port_group_index.get_port_groups(si, dv_switch_name, dv_switch_path)
+
+        missing = OrderedDict()
+        for dv_port_name, vlan_id, vlan_spec in port_groups:
+            if dv_port_name not in existing and dv_port_name not in missing:
+                missing[dv_port_name] = (vlan_id, vlan_spec)
+
+        if missing:
+            dv_switch = self.port_group_index.get_dv_switch(si, dv_switch_name, dv_switch_path)
+            specs = [DvPortGroupCreator.create_port_group_spec(dv_port_name, vlan_spec, vlan_id)
+                     for dv_port_name, (vlan_id, vlan_spec) in missing.items()]
+            logger.info(u"DV Port Groups '{}' CREATE Task ...".format(', '.join(missing.keys())))
+            try:
+                task = dv_switch.AddDVPortgroup_Task(specs)
+                self.synchronous_task_waiter.wait_for_task(task=task,
+                                                           action_name='Create {0} dv port groups'.format(len(specs)))
+            finally:
+                self.port_group_index.invalidate(dv_switch_name, dv_switch_path)
+            existing = self.port_group_index.get_port_groups(si, dv_switch_name, dv_switch_path)
+
+        return {dv_port_name: existing[dv_port_name].port_group
+                for dv_port_name, vlan_id, vlan_spec in port_groups
+                if dv_port_name in existing}
 
     def _create_dv_port_group(self, dv_port_name, dv_switch_name, dv_switch_path, si, spec, vlan_id):
-        dv_switch = self.pyvmomi_service.find_network_by_name(si, dv_switch_path, dv_switch_name)
-        if dv_switch is None:
-            raise Exception('DV Switch {0} not found in path {1}'.format(dv_switch_name, dv_switch_path))
+        dv_switch = self.port_group_index.get_dv_switch(si, dv_switch_name, dv_switch_path)
 
         task = DvPortGroupCreator.dv_port_group_create_task(dv_port_name, dv_switch, spec, vlan_id)
-        self.synchronous_task_waiter.wait_for_task(task=task,
-                                                   action_name='Create dv port group')
+        try:
+            self.synchronous_task_waiter.wait_for_task(task=task,
+                                                       action_name='Create dv port group')
+        except vim.fault.DuplicateName:
+            # created outside of the driver since the port groups of the switch were indexed
+            logger.info(u"DV Port Group '{}' already exists".format(dv_port_name))
+        finally:
+            self.port_group_index.invalidate(dv_switch_name, dv_switch_path)
+
+    def invalidate_port_groups(self, dv_switch_name, dv_switch_path):
+        """
+        The port groups of the dvSwitch are read again on the next lookup, called when one of them was not found
+        """
+        self.port_group_index.invalidate(dv_switch_name, dv_switch_path)
+
+    def destroy_port_group_task(self, port_group):
+        """
+        Creates 'Destroy Distributed Virtual Portgroup' Task and removes the port group from the index
+        :param port_group: <vim.dvs.DistributedVirtualPortgroup>
+        :return: <vim.Task> Task which really provides update
+        """
+        task = DvPortGroupCreator.dv_port_group_destroy_task(port_group)
+        self.port_group_index.forget(port_group)
+        return task
 
     @staticmethod
     def dv_port_group_create_task(dv_port_name, dv_switch, spec, vlan_id, num_ports=32):
@@ -70,7 +133,22 @@ class DvPortGroupCreator(object):
         :param num_ports: <int> number of ports in this Group
         :return: <vim.Task> Task which really provides update
         """
+        dv_pg_spec = DvPortGroupCreator.create_port_group_spec(dv_port_name, spec, vlan_id, num_ports)
+        task = dv_switch.AddDVPortgroup_Task([dv_pg_spec])
 
+        logger.info(u"DV Port Group '{}' CREATE Task ...".format(dv_port_name))
+        return task
+
+    @staticmethod
+    def create_port_group_spec(dv_port_name, spec, vlan_id, num_ports=32):
+        """
+        Create the config spec of a 'Distributed Virtual Portgroup'
+        :param dv_port_name: <str>  Distributed Virtual Portgroup Name
+        :param spec:
+        :param vlan_id: <int>
+        :param num_ports: <int> number of ports in this Group
+        :return: <vim.dvs.DistributedVirtualPortgroup.ConfigSpec>
+        """
         dv_pg_spec = vim.dvs.DistributedVirtualPortgroup.ConfigSpec()
         dv_pg_spec.name = dv_port_name
         dv_pg_spec.numPorts = num_ports
@@ -87,11 +165,7 @@ class DvPortGroupCreator(object):
         dv_pg_spec.defaultPortConfig.vlan.inherited = False
         dv_pg_spec.defaultPortConfig.securityPolicy.macChanges = vim.BoolPolicy(value=False)
         dv_pg_spec.defaultPortConfig.securityPolicy.inherited = False
-
-        task = dv_switch.AddDVPortgroup_Task([dv_pg_spec])
-
-        logger.info(u"DV Port Group '{}' CREATE Task ...".format(dv_port_name))
-        return task
+        return dv_pg_spec
 
     @staticmethod
     def dv_port_group_destroy_task(port_group):
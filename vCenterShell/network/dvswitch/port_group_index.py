@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import time
+from threading import Lock
+
+from pyVmomi import vim
+from common.logger import getLogger
+
+logger = getLogger("vCenterCommon")
+
+NAME = 'name'
+KEY = 'key'
+DEFAULT_PORT_CONFIG = 'config.defaultPortConfig'
+PORT_GROUP_PROPERTIES = [NAME, KEY, DEFAULT_PORT_CONFIG]
+
+
+class PortGroupEntry(object):
+    __slots__ = ('port_group', 'name', 'key', 'vlan')
+
+    def __init__(self, port_group, name, key, vlan):
+        """
+        :param port_group: <vim.dvs.DistributedVirtualPortgroup>
+        :param name: <str> the name of the port group
+        :param key: <str> the port group key, the one the vnic backing refers to
+        :param vlan: the vlan spec of the default port config
+        """
+        self.port_group = port_group
+        self.name = name
+        self.key = key
+        self.vlan = vlan
+
+
+class _SwitchPortGroups(object):
+    def __init__(self, si, dv_switch, entries, loaded_at):
+        self.si = si
+        self.dv_switch = dv_switch
+        self.entries = entries
+        self.loaded_at = loaded_at
+        self.stale = False
+
+
+class DvPortGroupIndex(object):
+    """
+    Name -> port group index of the port groups of a dvSwitch, read from 'dvs.portgroup' with one property
+    collector call, so checking whether the port group of a vlan exists does not go to the vCenter.
+    The port groups the driver creates or destroys update the index, changes made by others are picked up
+    when the index is older than max_age
+    """
+
+    def __init__(self, pyvmomi_service, max_age=300, time_func=time.time):
+        """
+        :param pyvmomi_service: pyVmomiService
+        :param int max_age: seconds after which the port groups of a dvSwitch are read again
+        :param time_func: returns the current time in seconds
+        """
+        self.pyvmomi_service = pyvmomi_service
+        self.max_age = max_age
+        self.time_func = time_func
+        self._switches = dict()
+        self._lock = Lock()
+
+    def get_dv_switch(self, si, dv_switch_name, dv_switch_path):
+        """
+        :return: the dvSwitch, raises an exception if it is not found
+        """
+        return self._get_switch(si, dv_switch_name, dv_switch_path).dv_switch
+
+    def find(self, si, dv_switch_name, dv_switch_path, name):
+        """
+        :param name: <str> the port group name
+        :return: <PortGroupEntry> or None if the dvSwitch has no port group with that name
+        """
+        return self._get_switch(si, dv_switch_name, dv_switch_path).entries.get(name)
+
+    def get_port_groups(self, si, dv_switch_name, dv_switch_path):
+        """
+        :return: dict of port group name to <PortGroupEntry>
+        """
+        return dict(self._get_switch(si, dv_switch_name, dv_switch_path).entries)
+
+    def invalidate(self, dv_switch_name, dv_switch_path):
+        """
+        The port groups of the dvSwitch are read again on the next lookup, called after port groups were created
+        """
+        with self._lock:
+            switch = self._switches.get((dv_switch_path, dv_switch_name))
+            if switch:
+                switch.stale = True
+
+    def forget(self, port_group):
+        """
+        Removes a destroyed port group from the index
+        :param port_group: <vim.dvs.DistributedVirtualPortgroup>
+        """
+        with self._lock:
+            for switch in self._switches.values():
+                for name, entry in switch.entries.items():
+                    if entry.port_group == port_group:
+                        del switch.entries[name]
+
+    def _get_switch(self, si, dv_switch_name, dv_switch_path):
+        key = (dv_switch_path, dv_switch_name)
+        with self._lock:
+            switch = self._switches.get(key)
+
+        if switch is not None and switch.si is si and not switch.stale \
+                and self.time_func() - switch.loaded_at < self.max_age:
+            return switch
+
+        # the objects of another session are bound to its connection, they are not reused
+        dv_switch = switch.dv_switch if switch is not None and switch.si is si else None
+        if dv_switch is None:
+            dv_switch = self.pyvmomi_service.find_network_by_name(si, dv_switch_path, dv_switch_name)
+            if dv_switch is None:
+                raise Exception('DV Switch {0} not found in path {1}'.format(dv_switch_name, dv_switch_path))
+
+        switch = _SwitchPortGroups(si, dv_switch, self._read_port_groups(si, dv_switch), self.time_func())
+        with self._lock:
+            self._switches[key] = switch
+        logger.debug(u"indexed {0} port groups of dvSwitch '{1}'".format(len(switch.entries), dv_switch_name))
+        return switch
+
+    def _read_port_groups(self, si, dv_switch):
+        port_groups = self.pyvmomi_service.retrieve_referenced_properties(si.content, dv_switch, 'portgroup',
+                                                                          vim.dvs.DistributedVirtualPortgroup,
+                                                                          PORT_GROUP_PROPERTIES)
+        entries = dict()
+        for port_group, properties in port_groups:
+            default_port_config = properties.get(DEFAULT_PORT_CONFIG)
+            entries[properties[NAME]] = PortGroupEntry(port_group,
+                                                       properties[NAME],
+                                                       properties.get(KEY),
+                                                       getattr(default_port_config, 'vlan', None))
+        return entries
@@ -4,8 +4,8 @@ from pyVmomi import vim
 class VlanSpecFactory(object):
     def __init__(self):
         self.dvsVlanSpec = {
-            'Access': vim.dvs.VmwareDistributedVirtualSwitch.VlanIdSpec(),
-            'Trunk': vim.dvs.VmwareDistributedVirtualSwitch.TrunkVlanSpec()
+            'Access': vim.dvs.VmwareDistributedVirtualSwitch.VlanIdSpec,
+            'Trunk': vim.dvs.VmwareDistributedVirtualSwitch.TrunkVlanSpec
         }
 
     def get_vlan_spec(self, vlan_spec_name):
@@ -13,6 +13,7 @@ class VlanSpecFactory(object):
         Returns an instance of vim.dvs.VmwareDistributedVirtualSwitch.VlanIdSpec according to name:
         'VLAN', 'VLAN Trunking', 'Private VLAN'
         :param vlan_spec_name: str
-        :return:  vim.dvs.VmwareDistributedVirtualSwitch.VlanIdSpec
+        :return:  vim.dvs.VmwareDistributedVirtualSwitch.VlanIdSpec, a new instance on every call since the
+                  vlan id is set on it
         """
-        return self.dvsVlanSpec[vlan_spec_name]
\ No newline at end of file
+        return self.dvsVlanSpec[vlan_spec_name]()
\ No newline at end of file
@@ -1,28 +1,38 @@
 import time
+from collections import deque
 
+from pyVmomi import vmodl
+
+from common.logger import getLogger
 from models.DeployResultModel import DeployResult
 from vCenterShell.vm.ovf_image_params import OvfImageParams
 
+logger = getLogger(__name__)
+
+MAX_CONCURRENT_CLONE_TASKS = 8
+
 
 class VirtualMachineDeployer(object):
-    def __init__(self, pv_service, name_generator, ovf_service):
+    def __init__(self, pv_service, name_generator, ovf_service, max_concurrent_clones=MAX_CONCURRENT_CLONE_TASKS,
+                 instant_clone_pool=None, warm_vm_pool=None):
+        """
+        :param int max_concurrent_clones: the number of clone tasks a bulk deploy runs together
+        :param InstantClonePool instant_clone_pool: the running parents apps are forked from
+        :param WarmVmPool warm_vm_pool: the cloned vms apps are claimed from
+        """
         self.pv_service = pv_service
         self.name_generator = name_generator
         self.ovf_service = ovf_service  # type common.vcenter.ovf_service.OvfImageDeployerService
+        self.max_concurrent_clones = max_concurrent_clones
+        self.instant_clone_pool = instant_clone_pool
+        self.warm_vm_pool = warm_vm_pool
 
     def deploy_from_template(self, si, data_holder):
 
         # generate unique name
         vm_name = self.name_generator(data_holder.template_model.app_name)
 
-        params = self.pv_service.CloneVmParameters(si=si,
-                                                   template_name=data_holder.template_model.template_name,
-                                                   vm_name=vm_name,
-                                                   vm_folder=data_holder.template_model.vm_folder,
-                                                   datastore_name=data_holder.datastore_name,
-                                                   cluster_name=data_holder.vm_cluster_model.cluster_name,
-                                                   resource_pool=data_holder.vm_cluster_model.resource_pool,
-                                                   power_on=data_holder.power_on)
+        params = self._get_clone_params(si, data_holder, vm_name)
 
         clone_vm_result = self.pv_service.clone_vm(params)
         if clone_vm_result.error:
@@ -33,6 +43,146 @@ class VirtualMachineDeployer(object):
                             data_holder.template_model.vCenter_resource_name,
                             data_holder.ip_regex)
 
+    def deploy_instant_clone(self, si, data_holder, connection_details):
+        """
+        Forks the app from a running parent of its template. Instant clone needs a vCenter 6.7 or later and a
+        pyVmomi 6.7 or later, the pinned pyVmomi 6.0.0 has no InstantClone_Task, so the app is deployed as a
+        linked clone until pyVmomi is upgraded
+
+        :param si: pyvmomi 'ServiceInstance'
+        :param data_holder: DeployDataHolder of a deploy_from_template
+        :param connection_details: VCenterConnectionDetails of the session, the parents are retired with it
+        :rtype: DeployResult
+        """
+        vm_name = self.name_generator(data_holder.template_model.app_name)
+        params = self._get_clone_params(si, data_holder, vm_name)
+
+        if self.instant_clone_pool is None or not self.pv_service.supports_instant_clone(si):
+            logger.warn('instant clone is not supported, deploying {0} as a linked clone'.format(vm_name))
+            params.linked_clone = True
+            clone_vm_result = self.pv_service.clone_vm(params)
+            if clone_vm_result.error:
+                raise Exception(clone_vm_result.error)
+            vm = clone_vm_result.vm
+        else:
+            vm = self.instant_clone_pool.fork(si, params, connection_details)
+
+        return DeployResult(vm_name,
+                            vm.summary.config.uuid,
+                            data_holder.template_model.vCenter_resource_name,
+                            data_holder.ip_regex)
+
+    def deploy_from_warm_pool(self, si, data_holder, connection_details):
+        """
+        Claims a warm vm of the template of the app, the app is cloned when the pool is empty
+
+        :param si: pyvmomi 'ServiceInstance'
+        :param data_holder: DeployDataHolder of a deploy_from_template
+        :param connection_details: VCenterConnectionDetails of the session, the pool is refilled with it
+        :rtype: DeployResult
+        """
+        vm_name = self.name_generator(data_holder.template_model.app_name)
+        params = self._get_clone_params(si, data_holder, vm_name)
+
+        vm = self.warm_vm_pool.claim(si, params, connection_details) if self.warm_vm_pool is not None else None
+        if vm is None:
+            clone_vm_result = self.pv_service.clone_vm(params)
+            if clone_vm_result.error:
+                raise Exception(clone_vm_result.error)
+            vm = clone_vm_result.vm
+
+        return DeployResult(vm_name,
+                            vm.summary.config.uuid,
+                            data_holder.template_model.vCenter_resource_name,
+                            data_holder.ip_regex)
+
+    def deploy_from_templates(self, si, data_holders):
+        """
+        Clones many vms together, at most max_concurrent_clones clone tasks run at a time and a new one is
+        started as soon as one is done. The placement shared by the apps is resolved once
+
+        :param si: pyvmomi 'ServiceInstance'
+        :param data_holders: list of DeployDataHolder
+        :return: generator of DeployResult in the order the clones complete, the failed ones have an error_message
+        """
+        pending = deque(data_holders)
+        started = dict()
+        tasks = []
+        for failed_result in self._start_clones(si, pending, started, tasks, self.max_concurrent_clones):
+            yield failed_result
+
+        # one property collector follows all the clones, a clone started when another one is done joins it
+        for outcome in self.pv_service.task_waiter.as_completed(tasks, action_name='Clone'):
+            data_holder, vm_name, clone_params = started.pop(outcome.task)
+            if outcome.succeeded:
+                yield DeployResult(vm_name,
+                                   outcome.result.summary.config.uuid,
+                                   data_holder.template_model.vCenter_resource_name,
+                                   data_holder.ip_regex)
+            else:
+                self._invalidate_removed_placement(si, clone_params, outcome.error)
+                yield self._create_failed_result(data_holder, vm_name, getattr(outcome.error, 'msg', None) or
+                                                 str(outcome.error))
+            for failed_result in self._start_clones(si, pending, started, tasks, 1):
+                yield failed_result
+
+    def _start_clones(self, si, pending, started, tasks, count):
+        """
+        starts the clones of the pending apps until count clones are running or no app is pending
+        :param dict started: the started clones are added as task to (data holder, vm name, clone params)
+        :param list tasks: the tasks of the started clones are appended to it
+        :return: generator of the DeployResult of the apps whose clone could not start
+        """
+        while pending and count:
+            data_holder = pending.popleft()
+            vm_name = self.name_generator(data_holder.template_model.app_name)
+            clone_params = None
+            try:
+                clone_params = self._get_clone_params(si, data_holder, vm_name)
+                clone_vm_result = self.pv_service.start_clone_vm(clone_params)
+                error = clone_vm_result.error
+            except Exception as e:
+                self._invalidate_removed_placement(si, clone_params, e)
+                error = str(e)
+            if error:
+                yield self._create_failed_result(data_holder, vm_name, error)
+            else:
+                started[clone_vm_result.task] = (data_holder, vm_name, clone_params)
+                tasks.append(clone_vm_result.task)
+                count -= 1
+
+    def _invalidate_removed_placement(self, si, clone_params, error):
+        # the cached placement of the template holds an object that was removed, the next deploy resolves it again
+        if clone_params is not None and isinstance(error, vmodl.fault.ManagedObjectNotFound):
+            self.pv_service.invalidate_placement_cache(si, clone_params)
+
+    @staticmethod
+    def _create_failed_result(data_holder, vm_name, error):
+        logger.error('failed deploying {0}: {1}'.format(vm_name, error))
+        return DeployResult(vm_name,
+                            None,
+                            data_holder.template_model.vCenter_resource_name,
+                            data_holder.ip_regex,
+                            error)
+
+    def _get_clone_params(self, si, data_holder, vm_name):
+        return self.pv_service.CloneVmParameters(si=si,
+                                                 template_name=data_holder.template_model.template_name,
+                                                 vm_name=vm_name,
+                                                 vm_folder=data_holder.template_model.vm_folder,
+                                                 datastore_name=data_holder.datastore_name,
+                                                 cluster_name=data_holder.vm_cluster_model.cluster_name,
+                                                 resource_pool=data_holder.vm_cluster_model.resource_pool,
+                                                 power_on=data_holder.power_on,
+                                                 linked_clone=self._is_linked_clone(data_holder.template_model),
+                                                 snapshot_name=getattr(data_holder.template_model, 'snapshot_name',
+                                                                       None))
+
+    @staticmethod
+    def _is_linked_clone(template_model):
+        # deploy data of older callers has no linked_clone, the value may come as a string from the app attributes
+        return str(getattr(template_model, 'linked_clone', False)).lower() == 'true'
+
     def deploy_from_image(self, si, data_holder, host_info):
         vm_name = self.name_generator(data_holder.app_name)
 
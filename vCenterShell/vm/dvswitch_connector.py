@@ -1,3 +1,5 @@
+from collections import OrderedDict
+
 from common.vcenter.vmomi_service import *
 
 class VmNetworkMapping(object):
@@ -40,22 +42,79 @@ class VirtualSwitchToMachineConnector(object):
         self.dv_port_group_creator = dv_port_group_creator
         self.virtual_machine_port_group_configurer = virtual_machine_port_group_configurer
 
-    def connect_by_mapping(self, si, vm, mapping, default_network):
+    def connect_by_mapping(self, si, vm, mapping, default_network, vm_network_view=None):
         """
         gets the mapping to the vnics and connects it to the vm
         :param default_network:
         :param si: ServiceInstance
         :param vm: vim.VirtualMachine
         :param mapping: [VmNetworkMapping]
+        :param vm_network_view: VmNetworkView, the vnics and networks of the vm read once
+        """
+        request_mapping = self.create_connect_requests(si, vm, mapping, vm_network_view=vm_network_view)
+        return self.virtual_machine_port_group_configurer.connect_vnic_to_networks(vm, request_mapping, default_network,
+                                                                                   vm_network_view)
+
+    def create_port_groups(self, si, mapping):
+        """
+        gets or creates the port groups of the mapping with one task per dvSwitch
+        :param si: ServiceInstance
+        :param mapping: [VmNetworkMapping]
+        :return: dict of port group name to port group
+        """
+        switch_to_port_groups = OrderedDict()
+        for network_map in mapping:
+            switch = (network_map.dv_switch_name, network_map.dv_switch_path)
+            if switch not in switch_to_port_groups:
+                switch_to_port_groups[switch] = []
+            switch_to_port_groups[switch].append((network_map.dv_port_name,
+                                                  network_map.vlan_id,
+                                                  network_map.vlan_spec))
+
+        port_groups = dict()
+        for (dv_switch_name, dv_switch_path), switch_port_groups in switch_to_port_groups.items():
+            port_groups.update(self.dv_port_group_creator.get_or_create_port_groups(si,
+                                                                                   dv_switch_name,
+                                                                                   dv_switch_path,
+                                                                                   switch_port_groups))
+        return port_groups
+
+    def invalidate_port_groups(self, dv_switch_name, dv_switch_path):
+        """
+        forgets the indexed port groups of the dvSwitch, a port group that was removed is not handed out again
+        """
+        self.dv_port_group_creator.invalidate_port_groups(dv_switch_name, dv_switch_path)
+
+    def create_connect_requests(self, si, vm, mapping, port_groups=None, vm_network_view=None):
+        """
+        gets or creates the port groups of the mapping, the vm is not changed
+        :param si: ServiceInstance
+        :param vm: vim.VirtualMachine
+        :param mapping: [VmNetworkMapping]
+        :param port_groups: dict of port group name to port group that were already created for the request
+        :param vm_network_view: VmNetworkView, the networks already attached to the vm are taken from it
+        :return: [ConnectRequest]
         """
         request_mapping = []
+        port_groups = port_groups or dict()
 
-        logger.debug(
-            'about to map to the vm: {0}, the following networks'.format(vm.name if vm.name else vm.config.uuid))
+        if vm_network_view is not None:
+            vm_name = vm_network_view.name
+        else:
+            vm_name = vm.name if vm.name else vm.config.uuid
+        logger.debug('about to map to the vm: {0}, the following networks'.format(vm_name))
 
         for network_map in mapping:
+            network = port_groups.get(network_map.dv_port_name)
+            if network is None and vm_network_view is not None:
+                network = vm_network_view.get_network_by_name(network_map.dv_port_name)
+            if network is not None:
+                request_mapping.append(ConnectRequest(network_map.vnic_name, network))
+                continue
+
+            # the networks of the vm were already checked in the view, the creator does not walk them again
             network = self.dv_port_group_creator.get_or_create_network(si,
-                                                                       vm,
+                                                                       vm if vm_network_view is None else None,
                                                                        network_map.dv_port_name,
                                                                        network_map.dv_switch_name,
                                                                        network_map.dv_switch_path,
@@ -66,4 +125,4 @@ class VirtualSwitchToMachineConnector(object):
             request_mapping.append(ConnectRequest(network_map.vnic_name, network))
 
         logger.debug(str(request_mapping))
-        return self.virtual_machine_port_group_configurer.connect_vnic_to_networks(vm, request_mapping, default_network)
+        return request_mapping
@@ -0,0 +1,225 @@
+import hashlib
+import time
+from threading import Event, Lock, Thread
+
+from pyVmomi import vmodl
+
+from common.logger import getLogger
+from common.utilites.bounded_executor import KeyedSemaphore
+
+logger = getLogger(__name__)
+
+GUEST_HEARTBEAT_STATUS = 'guestHeartbeatStatus'
+POWERED_ON = 'poweredOn'
+# seconds a new parent may take until its guest tools report a green heartbeat
+PARENT_READY_TIMEOUT = 600
+# seconds between two checks for idle parents
+RETIRE_INTERVAL = 60
+
+
+class ParentVm(object):
+    def __init__(self, vm_id, connection_details, created_at):
+        """
+        :param str vm_id: the managed object id of the running parent
+        :param connection_details: VCenterConnectionDetails of the vCenter of the parent
+        :param float created_at: the time the parent was created
+        """
+        self.vm_id = vm_id
+        self.connection_details = connection_details
+        self.last_used = created_at
+        # the number of forks that are running from the parent, it is not retired meanwhile
+        self.forks = 0
+
+
+class InstantClonePool(object):
+    """
+    Keeps a running parent vm per template and placement, so apps are forked from it with instant clone instead
+    of being cloned and booted. A parent is created on the first deploy that needs it and retired once it was not
+    used for max_idle_time, the idle parents are looked for every retire_interval seconds.
+    The parents are remembered by their vCenter and managed object id, so they are used and retired from any
+    session of their vCenter. A parent is named after its template and placement, so a parent left running by an
+    earlier driver instance is found and used by the next deploy of its template instead of creating another one
+    """
+
+    def __init__(self, pv_service, session_pool, max_idle_time=1800, time_func=time.time,
+                 parent_ready_timeout=PARENT_READY_TIMEOUT, retire_interval=RETIRE_INTERVAL):
+        """
+        :param pv_service: pyVmomiService
+        :param session_pool: VCenterSessionPool the parents are retired with
+        :param int max_idle_time: seconds a parent may stay unused before it is destroyed
+        :param time_func: returns the current time in seconds
+        :param int parent_ready_timeout: seconds to wait for the heartbeat of a new parent before it is destroyed
+        :param int retire_interval: seconds between two checks for idle parents, None to retire them only when
+                                    retire_idle is called
+        """
+        self.pv_service = pv_service
+        self.session_pool = session_pool
+        self.max_idle_time = max_idle_time
+        self.time_func = time_func
+        self.parent_ready_timeout = parent_ready_timeout
+        self.retire_interval = retire_interval
+        self._parents = dict()
+        self._lock = Lock()
+        # a parent is created once even when many apps of its template are deployed together
+        self._creating = KeyedSemaphore(1)
+        self._retirer = None
+        self._stopped = Event()
+
+    def fork(self, si, clone_params, connection_details):
+        """
+        :param si: pyvmomi 'ServiceInstance'
+        :param clone_params: pyVmomiService.CloneVmParameters of the app
+        :param connection_details: VCenterConnectionDetails of the session
+        :return: vim.VirtualMachine the forked child
+        """
+        key = self._get_key(si, clone_params)
+        placement = self.pv_service.resolve_clone_placement(clone_params)
+        # a parent that was removed from the vCenter, or retired meanwhile, is created again once
+        for attempt in range(2):
+            parent = self._acquire_parent(si, clone_params, connection_details, key)
+            try:
+                parent_vm = self.pv_service.vim.VirtualMachine(parent.vm_id, si._stub)
+                return self.pv_service.instant_clone_vm(parent_vm, clone_params.vm_name, placement)
+            except vmodl.fault.ManagedObjectNotFound:
+                self._forget(key, parent)
+                if attempt:
+                    raise
+            finally:
+                with self._lock:
+                    parent.forks -= 1
+                    parent.last_used = self.time_func()
+
+    def retire_idle(self):
+        """
+        destroys the parents that were not used for max_idle_time, whatever session created them
+        """
+        now = self.time_func()
+        self._retire(lambda parent: now - parent.last_used >= self.max_idle_time)
+
+    def retire_all(self):
+        """
+        stops the periodic retirement and destroys all the parents that are not forking,
+        called when the driver instance is cleaned up
+        """
+        self._stopped.set()
+        self._retire(lambda parent: True)
+
+    def _retire(self, should_retire):
+        with self._lock:
+            retired = [(key, parent) for key, parent in self._parents.items()
+                       if not parent.forks and should_retire(parent)]
+            for key, parent in retired:
+                self._parents.pop(key)
+        for key, parent in retired:
+            self._destroy(parent)
+
+    def _acquire_parent(self, si, clone_params, connection_details, key):
+        with self._creating.hold(key):
+            with self._lock:
+                parent = self._parents.get(key)
+                if parent is not None:
+                    parent.forks += 1
+                    return parent
+            parent_name = self._get_parent_name(key, clone_params)
+            parent = self._find_parent(si, clone_params, connection_details, parent_name) or \
+                self._create_parent(si, clone_params, connection_details, parent_name)
+            parent.forks = 1
+            with self._lock:
+                self._parents[key] = parent
+            self._start_retirer()
+            return parent
+
+    def _find_parent(self, si, clone_params, connection_details, parent_name):
+        """
+        :return: ParentVm of a running parent an earlier driver instance left, None if there is none
+        """
+        vm = self.pv_service.find_vm_by_name(si, clone_params.vm_folder, parent_name)
+        if vm is None:
+            return None
+        if vm.runtime.powerState != POWERED_ON:
+            logger.info('destroying instant clone parent {0}, it is not running'.format(parent_name))
+            self.pv_service.destroy_vm(vm)
+            return None
+        logger.info('using the running instant clone parent {0}'.format(parent_name))
+        return ParentVm(vm._moId, connection_details, self.time_func())
+
+    def _create_parent(self, si, clone_params, connection_details, parent_name):
+        parent_params = self.pv_service.CloneVmParameters(
+            si=si,
+            template_name=clone_params.template_name,
+            vm_name=parent_name,
+            vm_folder=clone_params.vm_folder,
+            datastore_name=clone_params.datastore_name,
+            cluster_name=clone_params.cluster_name,
+            resource_pool=clone_params.resource_pool,
+            power_on=True,
+            linked_clone=True,
+            snapshot_name=clone_params.snapshot_name)
+        logger.info('creating instant clone parent {0}'.format(parent_params.vm_name))
+        clone_vm_result = self.pv_service.clone_vm(parent_params)
+        if clone_vm_result.error:
+            raise Exception(clone_vm_result.error)
+
+        # the children are forked from the running guest, so the parent is used once its tools report in
+        try:
+            self.pv_service.task_waiter.wait_for_property(clone_vm_result.vm, GUEST_HEARTBEAT_STATUS,
+                                                          lambda status: status == 'green',
+                                                          action_name='Instant Clone Parent',
+                                                          timeout=self.parent_ready_timeout)
+        except Exception as e:
+            logger.warn('instant clone parent {0} is not ready, destroying it: {1}'.format(parent_params.vm_name, e))
+            try:
+                self.pv_service.destroy_vm(clone_vm_result.vm)
+            except Exception as destroy_error:
+                logger.warn('failed to destroy instant clone parent {0}: {1}'.format(parent_params.vm_name,
+                                                                                     destroy_error))
+            raise
+        return ParentVm(clone_vm_result.vm._moId, connection_details, self.time_func())
+
+    def _start_retirer(self):
+        with self._lock:
+            if self.retire_interval is None or self._retirer is not None or self._stopped.is_set():
+                return
+            self._retirer = Thread(target=self._retire_periodically, name='InstantClonePoolRetirer')
+            self._retirer.daemon = True
+        self._retirer.start()
+
+    def _retire_periodically(self):
+        while not self._stopped.wait(self.retire_interval):
+            try:
+                self.retire_idle()
+            except Exception as e:
+                logger.warn('failed to retire the idle instant clone parents: {0}'.format(e))
+
+    def _forget(self, key, parent):
+        with self._lock:
+            if self._parents.get(key) is parent:
+                self._parents.pop(key)
+
+    def _destroy(self, parent):
+        si = None
+        try:
+            logger.info('retiring instant clone parent {0}'.format(parent.vm_id))
+            si = self.session_pool.get_session(parent.connection_details)
+            if si is None:
+                raise Exception('cannot connect to {0}'.format(parent.connection_details.host))
+            self.pv_service.destroy_vm(self.pv_service.vim.VirtualMachine(parent.vm_id, si._stub))
+        except Exception as e:
+            logger.warn('failed to retire instant clone parent {0}: {1}'.format(parent.vm_id, e))
+        finally:
+            if si is not None:
+                self.session_pool.release_session(parent.connection_details, si)
+
+    @staticmethod
+    def _get_parent_name(key, clone_params):
+        """
+        the same vCenter, template and placement always get the same parent name
+        """
+        digest = hashlib.md5('/'.join(str(part) for part in key)).hexdigest()[:8]
+        return '{0} instant clone parent {1}'.format(clone_params.template_name, digest)
+
+    @staticmethod
+    def _get_key(si, clone_params):
+        return (si.content.about.instanceUuid, clone_params.vm_folder, clone_params.template_name,
+                clone_params.datastore_name, clone_params.cluster_name, clone_params.resource_pool,
+                clone_params.snapshot_name)
@@ -19,31 +19,52 @@ class VirtualMachinePortGroupConfigurer(object):
                  pyvmomi_service, 
                  synchronous_task_waiter, 
                  vnic_to_network_mapper, 
-                 vnic_service):
+                 vnic_service,
+                 dv_port_group_creator=None):
         """
         :param pyvmomi_service: vCenter API wrapper
         :param synchronous_task_waiter: Task Performer Service
         :param vnic_to_network_mapper: VnicToNetworkMapper
         :param vnic_service: VNicService
+        :param dv_port_group_creator: DvPortGroupCreator, keeps its port group index up to date on destroy
         :return:
         """
         self.pyvmomi_service = pyvmomi_service
         self.synchronous_task_waiter = synchronous_task_waiter
         self.vnic_to_network_mapper = vnic_to_network_mapper
         self.vnic_service = vnic_service
+        self.dv_port_group_creator = dv_port_group_creator
 
-    def connect_vnic_to_networks(self, vm, mapping, default_network):
-        vnic_mapping = self.vnic_service.map_vnics(vm)
+    def connect_vnic_to_networks(self, vm, mapping, default_network, vm_network_view=None):
+        update_mapping = self.map_vnics_to_networks(vm, mapping, default_network,
+                                                    vm_network_view=vm_network_view)
+        self.update_vnic_by_mapping(vm, update_mapping)
+        return update_mapping
+
+    def map_vnics_to_networks(self, vm, mapping, default_network, released_vnic_names=None, vm_network_view=None):
+        """
+        decides which vnic every connect request goes to, the vm is not changed
+        :param vm: vim.VirtualMachine
+        :param mapping: [ConnectRequest]
+        :param default_network: the network of the vnics that are available
+        :param released_vnic_names: names of the vnics that are disconnected in the same reconfigure
+        :param vm_network_view: VmNetworkView, the vnics and networks of the vm read once
+        :return: [VNicDeviceMapper]
+        """
+        if vm_network_view is not None:
+            vnic_mapping = vm_network_view.map_vnics()
+            existing_network = vm_network_view.networks
+        else:
+            vnic_mapping = self.vnic_service.map_vnics(vm)
+            existing_network = vm.network
 
         vnic_to_network_mapping = self.vnic_to_network_mapper.map_request_to_vnics(
-            mapping, vnic_mapping, vm.network, default_network)
+            mapping, vnic_mapping, existing_network, default_network, released_vnic_names, vm_network_view)
 
         update_mapping = []
         for vnic_name, network in vnic_to_network_mapping.items():
             vnic = vnic_mapping[vnic_name]
             update_mapping.append(VNicDeviceMapper(vnic, network, True, vnic.macAddress))
-
-        self.update_vnic_by_mapping(vm, update_mapping)
         return update_mapping
 
     def erase_network_by_mapping(self, vm, update_mapping):
@@ -108,9 +129,10 @@ class VirtualMachinePortGroupConfigurer(object):
             logger.debug('reconfigure task result {0}'.format(res))
         return res
 
-    @staticmethod
-    def destroy_port_group_task(network):
+    def destroy_port_group_task(self, network):
         if network_is_portgroup(network):
+            if self.dv_port_group_creator is not None:
+                return self.dv_port_group_creator.destroy_port_group_task(network)
             task = DvPortGroupCreator.dv_port_group_destroy_task(network)
             return task
         return None
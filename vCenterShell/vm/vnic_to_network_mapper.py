@@ -2,17 +2,26 @@ class VnicToNetworkMapper(object):
     def __init__(self, quali_name_generator):
         self.quali_name_generator = quali_name_generator
 
-    def map_request_to_vnics(self, requests, vnics, existing_network, default_network):
+    def map_request_to_vnics(self, requests, vnics, existing_network, default_network, released_vnic_names=None,
+                             vm_network_view=None):
         """
         gets the requests for connecting netwoks and maps it the suitable vnic of specific is not specified
         :param requests:
         :param vnics:
         :param existing_network:
         :param default_network:
+        :param released_vnic_names: vnics that are moved to the default network in the same reconfigure,
+                                    they are available for the requests
+        :param vm_network_view: VmNetworkView, when given the network names of the vnics are taken from it
+                                instead of being read from the vnic backings
         :return:
         """
         mapping = dict()
-        vnics_to_network_mapping = self._map_vnic_to_network(vnics, existing_network, default_network)
+        vnics_to_network_mapping = self._map_vnic_to_network(vnics, existing_network, default_network,
+                                                             vm_network_view)
+        for vnic_name in released_vnic_names or []:
+            if vnic_name in vnics_to_network_mapping:
+                vnics_to_network_mapping[vnic_name] = default_network.name
         for request in requests:
             if request.vnic_name:
                 if request.vnic_name not in vnics_to_network_mapping:
@@ -32,11 +41,13 @@ class VnicToNetworkMapper(object):
                 return vnic_name
         raise Exception('no vnic available')
 
-    def _map_vnic_to_network(self, vnics, existing_network, default_network):
+    def _map_vnic_to_network(self, vnics, existing_network, default_network, vm_network_view=None):
         mapping = dict()
         for vnic_name, vnic in vnics.items():
             network_to_map = ''
-            if hasattr(vnic, 'backing'):
+            if vm_network_view is not None:
+                network_to_map = vm_network_view.get_vnic_network_name(vnic_name) or ''
+            elif hasattr(vnic, 'backing'):
                 if hasattr(vnic.backing, 'network') and hasattr(vnic.backing.network, 'name'):
                     network_to_map = vnic.backing.network.name
                 elif hasattr(vnic.backing, 'port') and hasattr(vnic.backing.port, 'portgroupKey'):
@@ -0,0 +1,272 @@
+from collections import deque
+from threading import Lock
+
+from pyVmomi import vim, vmodl
+
+from common.logger import getLogger
+from common.utilites.bounded_executor import BoundedExecutor
+
+logger = getLogger(__name__)
+
+MAX_CONCURRENT_REFILLS = 2
+
+
+class WarmPoolStats(object):
+    def __init__(self, template_name, vm_folder, size, target, hits, misses, refilling, cloning=None, orphans=None):
+        """
+        :param str template_name: the template the warm vms are cloned from
+        :param str vm_folder: the folder the apps of the pool are deployed to
+        :param int size: the number of warm vms ready to be claimed
+        :param int target: the number of warm vms the refiller keeps
+        :param int hits: the deploys that claimed a warm vm
+        :param int misses: the deploys that found the pool empty
+        :param bool refilling: True while the refiller clones warm vms for the pool
+        :param list[str] cloning: the names of the warm vms that are being cloned
+        :param list[str] orphans: the names of the warm vms whose clone failed while it ran,
+                                  they may be left in the vCenter
+        """
+        self.template_name = template_name
+        self.vm_folder = vm_folder
+        self.size = size
+        self.target = target
+        self.hits = hits
+        self.misses = misses
+        self.hit_rate = float(hits) / (hits + misses) if hits + misses else 0.0
+        self.refilling = refilling
+        self.cloning = cloning or []
+        self.orphans = orphans or []
+
+
+class WarmVmPool(object):
+    """
+    Keeps target_size powered off clones per template and placement, so a deploy claims one by renaming it
+    instead of waiting for a clone. The pool is refilled in the background after every claim.
+    The warm vms are remembered by their managed object id, so they are claimed from any session of their vCenter.
+    The refiller clones with a session of its own, the session of the deploy is given back when the deploy is done.
+    The warm vms and the orphans are destroyed when the driver instance is cleaned up
+    """
+
+    def __init__(self, pv_service, name_generator, session_pool, target_size=2, pool_folder=None,
+                 max_concurrent_refills=MAX_CONCURRENT_REFILLS):
+        """
+        :param pv_service: pyVmomiService
+        :param name_generator: returns a unique vm name for a given name
+        :param session_pool: VCenterSessionPool the refiller takes its sessions from
+        :param int target_size: the number of warm vms kept per template and placement
+        :param str pool_folder: the folder the warm vms are kept in until claimed, the folder of the app by default
+        :param int max_concurrent_refills: the number of warm vms cloned together
+        """
+        self.pv_service = pv_service
+        self.name_generator = name_generator
+        self.session_pool = session_pool
+        self.target_size = target_size
+        self.pool_folder = pool_folder
+        self._pools = dict()
+        self._hits = dict()
+        self._misses = dict()
+        self._refilling = set()
+        self._cloning = dict()
+        self._orphans = dict()
+        # the connection details every key was last deployed with, the warm vms are destroyed with them
+        self._connections = dict()
+        self._lock = Lock()
+        self._refiller = BoundedExecutor(max_workers=max_concurrent_refills, max_pending=64)
+
+    def claim(self, si, clone_params, connection_details):
+        """
+        Takes a warm vm of the template and placement of the app, renames it to the name of the app,
+        moves it to the folder of the app and powers it on when the app asks for it
+
+        :param si: pyvmomi 'ServiceInstance'
+        :param clone_params: pyVmomiService.CloneVmParameters of the app
+        :param connection_details: VCenterConnectionDetails of the session, the pool is refilled with it
+        :return: vim.VirtualMachine the claimed vm, None when the pool is empty
+        """
+        key = self._get_key(si, clone_params)
+        with self._lock:
+            self._connections[key] = connection_details
+        vm = None
+        try:
+            while vm is None:
+                vm_id = self._take(key)
+                if vm_id is None:
+                    break
+                vm = self._claim_vm(si, vm_id, clone_params, key)
+        finally:
+            with self._lock:
+                counters = self._misses if vm is None else self._hits
+                counters[key] = counters.get(key, 0) + 1
+            self._schedule_refill(clone_params, connection_details, key)
+        return vm
+
+    def get_stats(self):
+        """
+        :rtype: list[WarmPoolStats]
+        """
+        with self._lock:
+            keys = set(self._pools) | set(self._hits) | set(self._misses) | set(self._orphans)
+            return [WarmPoolStats(template_name=key[2],
+                                  vm_folder=key[1],
+                                  size=len(self._pools.get(key, ())),
+                                  target=self.target_size,
+                                  hits=self._hits.get(key, 0),
+                                  misses=self._misses.get(key, 0),
+                                  refilling=key in self._refilling,
+                                  cloning=sorted(self._cloning.get(key, ())),
+                                  orphans=list(self._orphans.get(key, ())))
+                    for key in sorted(keys)]
+
+    def shutdown(self):
+        """
+        lets the running refills finish, the warm vms stay in the vCenter until destroy_all
+        """
+        self._refiller.shutdown()
+
+    def destroy_all(self):
+        """
+        destroys the warm vms and the orphans of every pool with a session of its vCenter,
+        called when the driver instance is cleaned up after shutdown
+        """
+        with self._lock:
+            keys = set(self._pools) | set(self._orphans)
+            pools = [(key, list(self._pools.pop(key, ())), self._orphans.pop(key, []), self._connections.get(key))
+                     for key in keys]
+        for key, vm_ids, orphans, connection_details in pools:
+            if connection_details is None or not (vm_ids or orphans):
+                continue
+            si = None
+            try:
+                si = self.session_pool.get_session(connection_details)
+                if si is None:
+                    raise Exception('cannot connect to {0}'.format(connection_details.host))
+                for vm_id in vm_ids:
+                    self._destroy(self.pv_service.vim.VirtualMachine(vm_id, si._stub))
+                for vm_name in orphans:
+                    # an orphan may never have been created
+                    vm = self.pv_service.find_vm_by_name(si, self.pool_folder or key[1], vm_name)
+                    if vm is not None:
+                        self._destroy(vm)
+            except Exception as e:
+                logger.warn('failed to destroy the warm vms of {0}: {1}'.format(key[2], e))
+            finally:
+                if si is not None:
+                    self.session_pool.release_session(connection_details, si)
+
+    def _take(self, key):
+        with self._lock:
+            pool = self._pools.get(key)
+            return pool.popleft() if pool else None
+
+    def _claim_vm(self, si, vm_id, clone_params, key):
+        vm = self.pv_service.vim.VirtualMachine(vm_id, si._stub)
+        placement = self.pv_service.resolve_clone_placement(clone_params)
+        try:
+            self.pv_service.wait_for_task(vm.Rename_Task(newName=clone_params.vm_name))
+        except vmodl.fault.ManagedObjectNotFound as e:
+            # a warm vm that was removed from the vCenter is dropped, the next one is claimed instead
+            logger.warn('warm vm {0} was removed: {1}'.format(vm_id, e))
+            return None
+        except vim.fault.InvalidState as e:
+            logger.warn('warm vm {0} cannot be claimed, destroying it: {1}'.format(vm_id, e))
+            self._destroy(vm)
+            return None
+        except Exception:
+            # the warm vm is fine, the rename failed for the app, e.g. its name is taken
+            with self._lock:
+                self._pools.setdefault(key, deque()).appendleft(vm_id)
+            raise
+
+        # the vm is the app now, it is kept when it cannot be prepared
+        try:
+            if vm.parent != placement.dest_folder:
+                self.pv_service.wait_for_task(placement.dest_folder.MoveIntoFolder_Task(list=[vm]))
+            if clone_params.power_on:
+                self.pv_service.wait_for_task(vm.PowerOnVM_Task())
+        except Exception as e:
+            raise Exception('warm vm {0} was claimed as {1} but could not be prepared: {2}'.format(
+                vm_id, clone_params.vm_name, e))
+        return vm
+
+    def _schedule_refill(self, clone_params, connection_details, key):
+        with self._lock:
+            if key in self._refilling or len(self._pools.get(key, ())) >= self.target_size:
+                return
+            self._refilling.add(key)
+        try:
+            self._refiller.submit(self._refill, clone_params, connection_details, key)
+        except Exception as e:
+            logger.warn('failed to schedule the refill of the warm pool of {0}: {1}'.format(
+                clone_params.template_name, e))
+            with self._lock:
+                self._refilling.discard(key)
+
+    def _refill(self, clone_params, connection_details, key):
+        si = None
+        try:
+            si = self.session_pool.get_session(connection_details)
+            if si is None:
+                raise Exception('cannot connect to {0}'.format(connection_details.host))
+            while True:
+                with self._lock:
+                    if len(self._pools.get(key, ())) >= self.target_size:
+                        return
+                if not self._clone_warm_vm(si, clone_params, key):
+                    return
+        except Exception as e:
+            logger.warn('failed to refill the warm pool of {0}: {1}'.format(clone_params.template_name, e))
+        finally:
+            if si is not None:
+                self.session_pool.release_session(connection_details, si)
+            with self._lock:
+                self._refilling.discard(key)
+
+    def _clone_warm_vm(self, si, clone_params, key):
+        """
+        :return: True when the warm vm was added to the pool
+        """
+        vm_name = self.name_generator('{0} warm'.format(clone_params.template_name))
+        warm_params = self.pv_service.CloneVmParameters(
+            si=si,
+            template_name=clone_params.template_name,
+            vm_name=vm_name,
+            vm_folder=self.pool_folder or clone_params.vm_folder,
+            datastore_name=clone_params.datastore_name,
+            cluster_name=clone_params.cluster_name,
+            resource_pool=clone_params.resource_pool,
+            power_on=False,
+            linked_clone=clone_params.linked_clone,
+            snapshot_name=clone_params.snapshot_name)
+        clone_vm_result = self.pv_service.start_clone_vm(warm_params)
+        if clone_vm_result.error:
+            logger.warn('failed to refill the warm pool of {0}: {1}'.format(
+                clone_params.template_name, clone_vm_result.error))
+            return False
+
+        # the name is known before the clone is waited for, so a vm the refiller lost track of can be found
+        with self._lock:
+            self._cloning.setdefault(key, set()).add(vm_name)
+        try:
+            vm = self.pv_service.wait_for_task(clone_vm_result.task)
+        except Exception as e:
+            logger.warn('warm vm {0} may be left in the vcenter, its clone failed: {1}'.format(vm_name, e))
+            with self._lock:
+                self._orphans.setdefault(key, []).append(vm_name)
+            return False
+        finally:
+            with self._lock:
+                self._cloning[key].discard(vm_name)
+        with self._lock:
+            self._pools.setdefault(key, deque()).append(vm._moId)
+        return True
+
+    def _destroy(self, vm):
+        try:
+            self.pv_service.destroy_vm(vm)
+        except Exception as e:
+            logger.warn('failed to destroy warm vm: {0}'.format(e))
+
+    @staticmethod
+    def _get_key(si, clone_params):
+        return (si.content.about.instanceUuid, clone_params.vm_folder, clone_params.template_name,
+                clone_params.datastore_name, clone_params.cluster_name, clone_params.resource_pool,
+                clone_params.linked_clone, clone_params.snapshot_name)
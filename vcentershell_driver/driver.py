@@ -11,6 +11,13 @@ class VCenterShellDriver:
     def initialize(self, context):
         self.command_orchestrator = CommandOrchestrator(context)
 
+    def cleanup(self):
+        """
+        called when the driver instance is destroyed, releases the sessions and threads kept between commands
+        """
+        if self.command_orchestrator:
+            self.command_orchestrator.cleanup()
+
     def ApplyConnectivityChanges(self, context, request):
         return self.command_orchestrator.connect_bulk(context, request)
 
@@ -23,9 +30,15 @@ class VCenterShellDriver:
     def remote_destroy_vm(self, context, ports):
         return self.command_orchestrator.destroy_vm(context, ports)
 
+    def remote_destroy_vms(self, context, ports):
+        return self.command_orchestrator.destroy_vms(context, ports)
+
     def remote_refresh_ip(self, context, ports):
         return self.command_orchestrator.refresh_ip(context, ports)
 
+    def remote_refresh_ips(self, context, ports):
+        return self.command_orchestrator.refresh_ips(context, ports)
+
     def PowerOff(self, context, ports):
         return self.command_orchestrator.power_off(context, ports)
 
@@ -42,8 +55,29 @@ class VCenterShellDriver:
     def PowerCycle(self, context, ports, delay):
         return self.command_orchestrator.power_cycle(context, ports, delay)
 
+    def PowerOnVms(self, context, ports):
+        return self.command_orchestrator.power_on_vms(context, ports)
+
+    def PowerOffVms(self, context, ports):
+        return self.command_orchestrator.power_off_vms(context, ports)
+
+    def PowerCycleVms(self, context, ports):
+        return self.command_orchestrator.power_cycle_vms(context, ports)
+
     def deploy_from_template(self, context, deploy_data):
         return self.command_orchestrator.deploy_from_template(context, deploy_data)
 
+    def deploy_from_templates(self, context, deploy_data):
+        return self.command_orchestrator.deploy_from_templates(context, deploy_data)
+
+    def deploy_instant_clone(self, context, deploy_data):
+        return self.command_orchestrator.deploy_instant_clone(context, deploy_data)
+
+    def deploy_from_warm_pool(self, context, deploy_data):
+        return self.command_orchestrator.deploy_from_warm_pool(context, deploy_data)
+
+    def get_warm_pool_stats(self, context):
+        return self.command_orchestrator.get_warm_pool_stats(context)
+
     def deploy_from_image(self, context, deploy_data):
         return self.command_orchestrator.deploy_from_image(context, deploy_data)